@@ -0,0 +1,224 @@
+"""
+End-to-end benchmark of every API endpoint
+
+Loads a dataset through the app's own startup path, then drives each
+endpoint through the ASGI app (middleware included, no network) and reports
+startup time, resident memory and per-endpoint p50/p95/p99 latency and
+throughput. Species are picked in proportion to their observation count,
+like real traffic, so hot species dominate the tail. The response cache is
+disabled unless --cache is given, so every request does the full work.
+
+Usage (from the backend directory):
+    python benchmarks/bench_endpoints.py --generate 1M --species 10k
+    python benchmarks/synthetic.py --observations 10M --species 50k --output /tmp/bench-10m
+    python benchmarks/bench_endpoints.py --data /tmp/bench-10m --requests 500 --concurrency 8 --json 10m.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+
+def rss_mb() -> float:
+    """Current resident set size of this process"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return peak_rss_mb()
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+
+def build_scenarios(dataset, n_requests: int, rng: np.random.Generator):
+    """Request URLs per endpoint, drawn from the loaded data"""
+    species = dataset.species
+    counts = species['observationCount'].to_numpy(dtype=np.float64, na_value=0)
+    keys = rng.choice(species['speciesKey'].to_numpy(), n_requests, p=counts / counts.sum())
+
+    # Search terms are 3-6 character prefixes of real names, as typed
+    names = species['vernacularName'].astype(object).where(species['vernacularName'].notna(), species['scientificName'])
+    picked = names.to_numpy()[rng.integers(0, len(names), n_requests)]
+    queries = [str(name)[:length] for name, length in zip(picked, rng.integers(3, 7, n_requests))]
+
+    # Viewports of roughly a city's size around each species' first observation
+    observations = dataset.species_index
+    bboxes = []
+    for key in keys:
+        start, _ = observations.bounds(key)
+        lat = float(observations.frame['decimalLatitude'].iat[start])
+        lon = float(observations.frame['decimalLongitude'].iat[start])
+        bboxes.append(f"{lon - 0.5:.3f},{lat - 0.3:.3f},{lon + 0.5:.3f},{lat + 0.3:.3f}")
+
+    # Taxa drawn like species, so popular families and genera dominate
+    taxonomy = dataset.taxonomy_index
+    families = np.array(taxonomy.nodes_at('family'))
+    family_counts = np.array([taxonomy.observation_count(node) for node in families], dtype=np.float64)
+    taxa = rng.choice(families, n_requests, p=family_counts / family_counts.sum()) if len(families) else []
+
+    return {
+        "health": ["/health"] * n_requests,
+        "search": [f"/api/species/search?query={query}&limit=10" for query in queries],
+        "observations_page": [f"/api/species/{key}/observations?limit=1000" for key in keys],
+        "observations_bbox": [f"/api/species/{key}/observations?bbox={bbox}" for key, bbox in zip(keys, bboxes)],
+        "observations_filtered": [
+            f"/api/species/{key}/observations?year_from=2015&year_to=2018&basis_of_record=HUMAN_OBSERVATION"
+            for key in keys
+        ],
+        "observations_ndjson": [f"/api/species/{key}/observations?limit=5000&format=ndjson" for key in keys],
+        "grid": [f"/api/species/{key}/observations/grid?zoom=6" for key in keys],
+        "timeline": [f"/api/species/{key}/timeline" for key in keys],
+        "timeline_month_split": [
+            f"/api/species/{key}/timeline?interval=month&split_by=basisOfRecord" for key in keys
+        ],
+        "timeline_filtered": [
+            f"/api/species/{key}/timeline?interval=month&year_from=2015&state_province=Masovia" for key in keys
+        ],
+        "taxon_timeline": [f"/api/taxonomy/{taxon}/timeline" for taxon in taxa],
+        "taxon_grid": [f"/api/taxonomy/{taxon}/grid?zoom=6" for taxon in taxa],
+        "stats": ["/api/dashboard/stats"] * n_requests,
+    }
+
+
+async def run_scenario(client, urls, concurrency: int):
+    """Issue every URL with at most `concurrency` in flight; returns latencies, errors, bytes, wall time"""
+    latencies = []
+    errors = 0
+    response_bytes = 0
+    queue = iter(urls)
+
+    async def worker():
+        nonlocal errors, response_bytes
+        for url in queue:
+            start = time.perf_counter()
+            response = await client.get(url)
+            latencies.append(time.perf_counter() - start)
+            response_bytes += len(response.content)
+            if response.status_code != 200:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return np.array(latencies), errors, response_bytes, time.perf_counter() - start
+
+
+async def run(args, data_dir: str):
+    import httpx
+
+    started = time.perf_counter()
+    import main as app_module
+    imported = time.perf_counter() - started
+
+    app_module.SPECIES_PATH = os.path.join(data_dir, "species_poland")
+    app_module.OBSERVATIONS_PATH = os.path.join(data_dir, "observations_poland")
+    rss_before = rss_mb()
+
+    async with app_module.lifespan(app_module.app):
+        # The data loads in the background; time-to-ready is what matters
+        await asyncio.to_thread(app_module.startup_progress.finished.wait)
+        startup = time.perf_counter() - started
+        dataset = app_module.get_dataset()
+        if dataset.species is None or dataset.observations is None:
+            raise SystemExit(f"No dataset found in {data_dir}")
+
+        results = {
+            "dataset": {"observations": len(dataset.observations), "species": len(dataset.species)},
+            "startup": {
+                "importSeconds": round(imported, 3),
+                "totalSeconds": round(startup, 3),
+                "phaseSeconds": {
+                    name: round(seconds, 3) for name, seconds in app_module.startup_progress.phase_seconds.items()
+                },
+                "rssMB": round(rss_mb(), 1),
+                "datasetMB": round(rss_mb() - rss_before, 1),
+            },
+            "endpoints": {},
+        }
+        print(f"{len(dataset.observations)} observations, {len(dataset.species)} species: "
+              f"startup {startup:.2f}s (import {imported:.2f}s), RSS {results['startup']['rssMB']:.0f} MB")
+
+        scenarios = build_scenarios(dataset, args.requests, np.random.default_rng(args.seed))
+        selected = args.endpoints or list(scenarios)
+
+        transport = httpx.ASGITransport(app=app_module.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            print(f"{'endpoint':<22} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8} "
+                  f"{'req/s':>8} {'KB/req':>8} {'errors':>7}")
+            for name in selected:
+                urls = scenarios[name]
+                # A short warm-up keeps one-off costs out of the percentiles
+                await run_scenario(client, urls[:min(5, len(urls))], 1)
+                latencies, errors, response_bytes, wall = await run_scenario(client, urls, args.concurrency)
+                p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) * 1000
+                summary = {
+                    "requests": len(latencies),
+                    "p50Ms": round(float(p50), 3),
+                    "p95Ms": round(float(p95), 3),
+                    "p99Ms": round(float(p99), 3),
+                    "maxMs": round(float(latencies.max()) * 1000, 3),
+                    "throughput": round(len(latencies) / wall, 1),
+                    "meanBytes": int(response_bytes / len(latencies)),
+                    "errors": errors,
+                }
+                results["endpoints"][name] = summary
+                print(f"{name:<22} {p50:>8.2f} {p95:>8.2f} {p99:>8.2f} {summary['maxMs']:>8.1f} "
+                      f"{summary['throughput']:>8.0f} {summary['meanBytes'] / 1024:>8.1f} {errors:>7}")
+
+        results["peakRssMB"] = round(peak_rss_mb(), 1)
+        print(f"peak RSS {results['peakRssMB']:.0f} MB")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--data', help="Directory holding species_poland/observations_poland data files")
+    source.add_argument('--generate', help="Generate this many synthetic observations first, e.g. 1M")
+    parser.add_argument('--species', default='10k', help="Species count for --generate")
+    parser.add_argument('--requests', type=int, default=200, help="Requests per endpoint")
+    parser.add_argument('--concurrency', type=int, default=1, help="Requests in flight per endpoint")
+    parser.add_argument('--endpoints', nargs='+', help="Only run these scenarios")
+    parser.add_argument('--cache', action='store_true', help="Keep the response cache enabled")
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--json', help="Also write the results to this file")
+    args = parser.parse_args()
+
+    # Must be set before main is imported
+    if not args.cache:
+        os.environ["RESPONSE_CACHE_MB"] = "0"
+
+    with tempfile.TemporaryDirectory() as generated_dir:
+        data_dir = args.data
+        if args.generate:
+            from synthetic import generate, parse_count, write_dataset
+            start = time.perf_counter()
+            write_dataset(*generate(parse_count(args.generate), parse_count(args.species)), generated_dir)
+            print(f"Generated synthetic data in {time.perf_counter() - start:.1f}s")
+            data_dir = generated_dir
+
+        results = asyncio.run(run(args, data_dir))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Benchmark for observation response serialization
+
+Compares the original iterrows + jsonable_encoder path against the columnar
+frame_to_records + orjson path used by the API.
+
+Usage (from the backend directory):
+    python benchmarks/bench_serialization.py --sizes 1000 100000 1000000
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from serialization import OBSERVATION_FIELDS, dumps, frame_to_records
+
+
+def make_observations(n_rows: int) -> pd.DataFrame:
+    """Build an observations frame with a sprinkling of missing values"""
+    rng = np.random.default_rng(42)
+    frame = pd.DataFrame({
+        'speciesKey': np.ones(n_rows, dtype=np.int64),
+        'decimalLatitude': rng.uniform(49.0, 54.8, n_rows),
+        'decimalLongitude': rng.uniform(14.0, 24.2, n_rows),
+        'eventDate': pd.Series(pd.to_datetime('2000-01-01') + pd.to_timedelta(rng.integers(0, 8766, n_rows), unit='D')).dt.strftime('%Y-%m-%d'),
+        'year': rng.integers(2000, 2024, n_rows).astype(float),
+        'month': rng.integers(1, 13, n_rows),
+        'day': rng.integers(1, 29, n_rows),
+        'country': 'Poland',
+        'stateProvince': rng.choice(['Mazovia', 'Silesia', 'Greater Poland', 'Lesser Poland', 'Pomerania'], n_rows),
+        'locality': 'Location',
+        'basisOfRecord': rng.choice(['HUMAN_OBSERVATION', 'OBSERVATION', 'MACHINE_OBSERVATION'], n_rows),
+        'individualCount': rng.integers(1, 10, n_rows).astype(float),
+    })
+    frame.loc[frame.sample(frac=0.05, random_state=1).index, 'individualCount'] = np.nan
+    frame.loc[frame.sample(frac=0.01, random_state=2).index, 'year'] = np.nan
+    return frame
+
+
+def legacy_serialize(frame: pd.DataFrame) -> bytes:
+    """The pre-columnar path: iterrows with per-cell pd.notna checks"""
+    observations_list = []
+    for _, row in frame.iterrows():
+        observations_list.append({
+            "decimalLatitude": float(row['decimalLatitude']) if pd.notna(row['decimalLatitude']) else None,
+            "decimalLongitude": float(row['decimalLongitude']) if pd.notna(row['decimalLongitude']) else None,
+            "eventDate": row['eventDate'] if pd.notna(row['eventDate']) else None,
+            "year": int(row['year']) if pd.notna(row['year']) else None,
+            "month": int(row['month']) if pd.notna(row['month']) else None,
+            "day": int(row['day']) if pd.notna(row['day']) else None,
+            "country": row.get('country', ''),
+            "stateProvince": row.get('stateProvince', ''),
+            "locality": row.get('locality', ''),
+            "basisOfRecord": row.get('basisOfRecord', ''),
+            "individualCount": int(row['individualCount']) if pd.notna(row['individualCount']) else None
+        })
+    content = {"speciesKey": 1, "count": len(observations_list), "observations": observations_list}
+    return JSONResponse(jsonable_encoder(content)).body
+
+
+def columnar_serialize(frame: pd.DataFrame) -> bytes:
+    """The current path: bulk column conversion and a single orjson encode"""
+    observations_list = frame_to_records(frame, OBSERVATION_FIELDS)
+    return dumps({"speciesKey": 1, "count": len(observations_list), "observations": observations_list})
+
+
+def timed(func, frame: pd.DataFrame) -> float:
+    start = time.perf_counter()
+    func(frame)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1_000, 100_000, 1_000_000])
+    parser.add_argument('--skip-legacy-above', type=int, default=None,
+                        help="Skip the slow legacy path for frames larger than this")
+    args = parser.parse_args()
+
+    print(f"{'rows':>10} {'legacy (s)':>12} {'columnar (s)':>14} {'speedup':>9}")
+    for n_rows in args.sizes:
+        frame = make_observations(n_rows)
+        assert legacy_serialize(frame.head(100)) == columnar_serialize(frame.head(100))
+
+        columnar = timed(columnar_serialize, frame)
+        if args.skip_legacy_above is not None and n_rows > args.skip_legacy_above:
+            print(f"{n_rows:>10} {'skipped':>12} {columnar:>14.3f} {'-':>9}")
+            continue
+        legacy = timed(legacy_serialize, frame)
+        print(f"{n_rows:>10} {legacy:>12.3f} {columnar:>14.3f} {legacy / columnar:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,369 @@
+"""
+Load test replaying the frontend's traffic against a local uvicorn server
+
+Starts the API in a uvicorn subprocess on a free local port, serving a
+synthetic (or given) dataset, then runs virtual users that behave like the
+frontend:
+
+- every page view loads /api/dashboard/stats (App.js on mount)
+- typing a species name fires /api/species/search as SearchBar.js does,
+  once a pause between keystrokes outlasts its 300 ms debounce (or on every
+  keystroke with --debounce-ms 0), without waiting for earlier searches;
+  searches the server skips as superseded (409) are counted apart from errors
+- picking a result fetches its observations and timeline in parallel
+  (App.js on selection), reported per endpoint and as "selection", the time
+  until both have arrived
+
+Species are picked in proportion to their observation count, so hot species
+dominate as they do in production. Per-endpoint latency percentiles, error
+rates and throughput are printed and can be saved with --json; two saved
+runs are compared with --compare, which exits non-zero on a regression.
+Nothing leaves the machine.
+
+Usage (from the backend directory):
+    python benchmarks/load_test.py --generate 1M --users 50 --duration 30 --json before.json
+    python benchmarks/load_test.py --data /tmp/bench-10m --users 200 --duration 60 --json after.json
+    python benchmarks/load_test.py --compare before.json after.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(BACKEND_DIR)
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+# SearchBar.js searches from the second character, limit 10
+MIN_QUERY_LENGTH = 2
+SEARCH_LIMIT = 10
+
+ENDPOINTS = ["stats", "search", "observations", "timeline", "selection"]
+
+
+def cpu_seconds(pid: int):
+    """User plus system CPU time of a process, None where /proc is unavailable"""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+    except OSError:
+        return None
+    # utime and stime, fields 14 and 15 of stat(5), in clock ticks
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(data_dir: str, work_dir: str, port: int, env: dict) -> subprocess.Popen:
+    """Run the API under uvicorn with data/ in work_dir pointing at data_dir"""
+    # main.py reads data/species_poland etc. relative to its working directory
+    os.symlink(os.path.abspath(data_dir), os.path.join(work_dir, "data"))
+    log = open(os.path.join(work_dir, "server.log"), "wb")
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--app-dir", BACKEND_DIR,
+         "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=work_dir, env={**os.environ, **env}, stdout=log, stderr=subprocess.STDOUT
+    )
+
+
+async def wait_until_ready(client, server: subprocess.Popen, timeout: float) -> float:
+    """Poll /ready until the server has loaded its data; returns seconds waited"""
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        if server.poll() is not None:
+            raise RuntimeError(f"Server exited with status {server.returncode}")
+        try:
+            if (await client.get("/ready")).status_code == 200:
+                return time.perf_counter() - start
+        except Exception:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError(f"Server not ready after {timeout:.0f}s")
+
+
+class Recorder:
+    """Latencies and failures per endpoint, kept only once the warm-up is over"""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.skipped = defaultdict(int)
+        self.error_kinds = defaultdict(int)
+        self.recording = False
+
+    def add(self, endpoint: str, seconds: float, error: str = None):
+        if not self.recording:
+            return
+        self.latencies[endpoint].append(seconds)
+        if error == "409":
+            # Superseded by the same user's next keystroke: skipped work, not a failure
+            self.skipped[endpoint] += 1
+        elif error:
+            self.errors[endpoint] += 1
+            self.error_kinds[f"{endpoint}: {error}"] += 1
+
+
+async def timed_get(client, recorder: Recorder, endpoint: str, url: str, **params) -> bool:
+    """GET a URL, recording its latency under endpoint; True if it returned 200"""
+    start = time.perf_counter()
+    try:
+        response = await client.get(url, params=params)
+        await response.aread()
+        error = None if response.status_code == 200 else str(response.status_code)
+    except Exception as e:
+        error = type(e).__name__
+    recorder.add(endpoint, time.perf_counter() - start, error)
+    return error is None
+
+
+async def virtual_user(
+    client, recorder: Recorder, species: dict, args, rng: np.random.Generator, stop: float, user: int
+):
+    """One user loading the dashboard, searching and selecting species until stop"""
+    keys, names, weights = species["keys"], species["names"], species["weights"]
+    debounce = args.debounce_ms / 1000
+    # Like the frontend's per-tab id, so the server can drop this user's stale searches
+    client_id = f"load-test-{user}"
+    while time.perf_counter() < stop:
+        await timed_get(client, recorder, "stats", "/api/dashboard/stats")
+
+        for _ in range(int(rng.integers(1, args.selections_per_view + 1))):
+            pick = int(rng.choice(len(keys), p=weights))
+            # Users pick from the results before finishing the name
+            name = names[pick][:int(rng.integers(3, 13))]
+            gaps = rng.exponential(args.keystroke_ms / 1000, len(name))
+            searches = []
+            for length in range(1, len(name) + 1):
+                last = length == len(name)
+                pause = np.inf if last else gaps[length]
+                if length >= MIN_QUERY_LENGTH and pause >= debounce:
+                    # The debounce timer survived until the next keystroke
+                    await asyncio.sleep(debounce)
+                    searches.append(asyncio.create_task(timed_get(
+                        client, recorder, "search", "/api/species/search",
+                        query=name[:length], limit=SEARCH_LIMIT, client_id=client_id
+                    )))
+                    pause -= debounce
+                if not last:
+                    await asyncio.sleep(pause)
+            await asyncio.gather(*searches)
+
+            start = time.perf_counter()
+            ok = await asyncio.gather(
+                timed_get(client, recorder, "observations", f"/api/species/{keys[pick]}/observations"),
+                timed_get(client, recorder, "timeline", f"/api/species/{keys[pick]}/timeline")
+            )
+            recorder.add("selection", time.perf_counter() - start, None if all(ok) else "failed")
+
+            await asyncio.sleep(rng.exponential(args.think_ms / 1000))
+            if time.perf_counter() >= stop:
+                break
+
+
+def load_species(data_dir: str) -> dict:
+    """Keys, typed names and pick weights of the species a dataset holds"""
+    from storage import load_table, SPECIES_SCHEMA
+
+    table = load_table(os.path.join(data_dir, "species_poland"), SPECIES_SCHEMA)
+    if table is None:
+        raise SystemExit(f"No species table found in {data_dir}")
+    names = table['vernacularName'].astype(object).where(table['vernacularName'].notna(), table['scientificName'])
+    counts = table['observationCount'].to_numpy(dtype=np.float64, na_value=0) + 1
+    return {
+        "keys": table['speciesKey'].tolist(),
+        "names": [str(name) for name in names],
+        "weights": counts / counts.sum(),
+    }
+
+
+def summarize(recorder: Recorder, wall: float) -> dict:
+    """Percentiles, error rate and throughput per endpoint"""
+    endpoints = {}
+    for name in ENDPOINTS:
+        latencies = np.array(recorder.latencies.get(name, []))
+        if not len(latencies):
+            continue
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) * 1000
+        endpoints[name] = {
+            "requests": len(latencies),
+            "p50Ms": round(float(p50), 3),
+            "p95Ms": round(float(p95), 3),
+            "p99Ms": round(float(p99), 3),
+            "maxMs": round(float(latencies.max()) * 1000, 3),
+            "throughput": round(len(latencies) / wall, 1),
+            "errors": recorder.errors.get(name, 0),
+            "skipped": recorder.skipped.get(name, 0),
+            "errorRate": round(recorder.errors.get(name, 0) / len(latencies), 4),
+        }
+    return endpoints
+
+
+def print_summary(endpoints: dict) -> None:
+    print(f"{'endpoint':<14} {'requests':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8} "
+          f"{'req/s':>8} {'skipped':>8} {'errors':>8}")
+    for name, summary in endpoints.items():
+        print(f"{name:<14} {summary['requests']:>9} {summary['p50Ms']:>8.2f} {summary['p95Ms']:>8.2f} "
+              f"{summary['p99Ms']:>8.2f} {summary['maxMs']:>8.1f} {summary['throughput']:>8.1f} "
+              f"{summary['skipped']:>8} {summary['errorRate']:>8.2%}")
+
+
+async def run(args, data_dir: str, work_dir: str) -> dict:
+    import httpx
+
+    species = load_species(data_dir)
+    port = free_port()
+    env = {"RESPONSE_CACHE_MB": "0"} if args.no_cache else {}
+    server = start_server(data_dir, work_dir, port, env)
+    limits = httpx.Limits(max_connections=args.users * 2, max_keepalive_connections=args.users * 2)
+    try:
+        async with httpx.AsyncClient(
+            base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=args.timeout
+        ) as client:
+            startup = await wait_until_ready(client, server, args.startup_timeout)
+            print(f"Server ready on port {port} after {startup:.1f}s; {args.users} users, "
+                  f"{args.warmup:.0f}s warm-up, {args.duration:.0f}s measured")
+
+            recorder = Recorder()
+            begin = time.perf_counter()
+            stop = begin + args.warmup + args.duration
+            seeds = np.random.SeedSequence(args.seed).spawn(args.users)
+            users = [
+                asyncio.create_task(virtual_user(
+                    client, recorder, species, args, np.random.default_rng(seed), stop, user
+                ))
+                for user, seed in enumerate(seeds)
+            ]
+            await asyncio.sleep(args.warmup)
+            recorder.recording = True
+            measured = time.perf_counter()
+            cpu_before = cpu_seconds(server.pid)
+            await asyncio.gather(*users)
+            wall = time.perf_counter() - measured
+            cpu_after = cpu_seconds(server.pid)
+            server_stats = (await client.get("/cache/stats")).json()
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+    endpoints = summarize(recorder, wall)
+    print_summary(endpoints)
+    server_cpu = cpu_after - cpu_before if cpu_before is not None and cpu_after is not None else None
+    if server_cpu is not None:
+        print(f"server CPU {server_cpu:.1f}s over {wall:.1f}s ({server_cpu / wall:.0%} of one core)")
+    if "singleFlight" in server_stats:
+        print(f"coalesced requests {server_stats['singleFlight']['coalesced']}, "
+              f"superseded searches {server_stats['searches']['superseded']}")
+    for kind, count in sorted(recorder.error_kinds.items()):
+        print(f"  {count} x {kind}")
+    return {
+        "config": {
+            name: getattr(args, name)
+            for name in ["users", "duration", "warmup", "think_ms", "keystroke_ms", "debounce_ms",
+                         "selections_per_view", "no_cache", "seed"]
+        },
+        "dataset": {"species": len(species["keys"]), "source": args.data or f"synthetic {args.generate}"},
+        "startupSeconds": round(startup, 2),
+        "wallSeconds": round(wall, 2),
+        "serverCpuSeconds": round(server_cpu, 2) if server_cpu is not None else None,
+        "endpoints": endpoints,
+    }
+
+
+def compare(baseline_path: str, candidate_path: str, threshold: float, min_delta_ms: float) -> bool:
+    """Print both runs side by side; True if the candidate regressed on any endpoint
+
+    A percentile regresses when it is more than threshold (relative) and
+    min_delta_ms (absolute) slower; the absolute floor keeps sub-millisecond
+    noise from being flagged. Any rise in error rate of over a tenth of a
+    percentage point also counts.
+    """
+    with open(baseline_path) as f:
+        baseline = json.load(f)["endpoints"]
+    with open(candidate_path) as f:
+        candidate = json.load(f)["endpoints"]
+
+    regressed = False
+    print(f"{'endpoint':<14} {'metric':<10} {'baseline':>10} {'candidate':>10} {'change':>8}")
+    for name in ENDPOINTS:
+        if name not in baseline or name not in candidate:
+            continue
+        for metric in ["p50Ms", "p95Ms", "p99Ms"]:
+            before, after = baseline[name][metric], candidate[name][metric]
+            change = (after - before) / before if before else 0.0
+            flag = change > threshold and after - before > min_delta_ms
+            regressed |= flag
+            print(f"{name:<14} {metric:<10} {before:>10.2f} {after:>10.2f} {change:>+8.1%}"
+                  f"{'  REGRESSION' if flag else ''}")
+        before, after = baseline[name]["errorRate"], candidate[name]["errorRate"]
+        flag = after - before > 0.001
+        regressed |= flag
+        print(f"{name:<14} {'errorRate':<10} {before:>10.2%} {after:>10.2%} {'':>8}"
+              f"{'  REGRESSION' if flag else ''}")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--data', help="Directory holding species_poland/observations_poland data files")
+    source.add_argument('--generate', help="Generate this many synthetic observations first, e.g. 1M")
+    source.add_argument('--compare', nargs=2, metavar=('BASELINE', 'CANDIDATE'), help="Compare two --json results")
+    parser.add_argument('--species', default='10k', help="Species count for --generate")
+    parser.add_argument('--users', type=int, default=20, help="Concurrent virtual users")
+    parser.add_argument('--duration', type=float, default=30, help="Measured seconds")
+    parser.add_argument('--warmup', type=float, default=5, help="Seconds of traffic before measuring")
+    parser.add_argument('--think-ms', type=float, default=1000, help="Mean pause after viewing a species")
+    parser.add_argument('--keystroke-ms', type=float, default=150, help="Mean time between keystrokes")
+    parser.add_argument('--debounce-ms', type=float, default=300, help="Search debounce; 0 searches on every keystroke")
+    parser.add_argument('--selections-per-view', type=int, default=3, help="Most species viewed per page view")
+    parser.add_argument('--no-cache', action='store_true', help="Disable the server's response cache")
+    parser.add_argument('--timeout', type=float, default=30, help="Per-request timeout in seconds")
+    parser.add_argument('--startup-timeout', type=float, default=300, help="Seconds to wait for the server")
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--json', help="Also write the results to this file")
+    parser.add_argument('--threshold', type=float, default=0.2, help="Relative slowdown --compare flags")
+    parser.add_argument('--min-delta-ms', type=float, default=1.0, help="Absolute slowdown --compare ignores")
+    args = parser.parse_args()
+
+    if args.compare:
+        sys.exit(1 if compare(*args.compare, args.threshold, args.min_delta_ms) else 0)
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        data_dir = args.data
+        if args.generate:
+            from synthetic import generate, parse_count, write_dataset
+            start = time.perf_counter()
+            data_dir = os.path.join(work_dir, "generated")
+            write_dataset(*generate(parse_count(args.generate), parse_count(args.species)), data_dir)
+            print(f"Generated synthetic data in {time.perf_counter() - start:.1f}s")
+
+        try:
+            results = asyncio.run(run(args, data_dir, work_dir))
+        except RuntimeError as e:
+            with open(os.path.join(work_dir, "server.log"), errors="replace") as f:
+                print(f.read()[-4000:], file=sys.stderr)
+            raise SystemExit(str(e))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""
+Synthetic dataset generator for scaling benchmarks
+
+Produces species and observation tables shaped like a real GBIF extract:
+observation counts per species follow a Zipf law (a few very common species,
+a long tail of rare ones), each species is clustered around its own range
+centre, and later years are better recorded than earlier ones. Every column
+is generated with vectorized numpy, so 50M rows take seconds per column
+rather than minutes.
+
+Usage (from the backend directory):
+    python benchmarks/synthetic.py --observations 10M --species 50k --output /tmp/bench-10m
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dataset import index_arrays
+from storage import store_path, write_column_store, OBSERVATION_SCHEMA, SPECIES_SCHEMA
+
+# Poland's bounding box, as (min_lon, min_lat, max_lon, max_lat)
+POLAND_BBOX = (14.1, 49.0, 24.2, 54.8)
+
+VOIVODESHIPS = [
+    'Lower Silesia', 'Kuyavia-Pomerania', 'Lublin', 'Lubusz', 'Łódź', 'Lesser Poland',
+    'Masovia', 'Opole', 'Subcarpathia', 'Podlaskie', 'Pomerania', 'Silesia',
+    'Świętokrzyskie', 'Warmia-Masuria', 'Greater Poland', 'West Pomerania',
+]
+BASES_OF_RECORD = ['HUMAN_OBSERVATION', 'OBSERVATION', 'MACHINE_OBSERVATION', 'PRESERVED_SPECIMEN']
+BASIS_WEIGHTS = [0.85, 0.08, 0.05, 0.02]
+
+KINGDOMS = ['Animalia', 'Plantae', 'Fungi']
+SYLLABLES = np.array(['ka', 'lo', 'mi', 're', 'tu', 'sa', 'no', 'vi', 'ze', 'pa', 'ri', 'do', 'fe', 'gu', 'le', 'ba'])
+
+FIRST_YEAR, LAST_YEAR = 2000, 2023
+
+
+def parse_count(value: str) -> int:
+    """Parse counts like 50000, 10k or 1M"""
+    value = value.strip().lower()
+    scale = {'k': 1_000, 'm': 1_000_000}.get(value[-1], 1)
+    return int(float(value.rstrip('km')) * scale)
+
+
+def words(rng: np.random.Generator, n: int, syllables: int) -> np.ndarray:
+    """Random pronounceable words, built a syllable column at a time"""
+    result = SYLLABLES[rng.integers(0, len(SYLLABLES), n)].astype(object)
+    for _ in range(syllables - 1):
+        result = result + SYLLABLES[rng.integers(0, len(SYLLABLES), n)]
+    return result
+
+
+def make_species(n_species: int, rng: np.random.Generator) -> pd.DataFrame:
+    """Species table with a genus/family/order hierarchy and searchable names"""
+    n_genera = max(1, n_species // 8)
+    n_families = max(1, n_genera // 10)
+    n_orders = max(1, n_families // 10)
+
+    genus_names = pd.Series(words(rng, n_genera, 3)).str.capitalize() + 'us'
+    genus = rng.integers(0, n_genera, n_species)
+    family_of_genus = rng.integers(0, n_families, n_genera)
+    order_of_family = rng.integers(0, n_orders, n_families)
+    family = family_of_genus[genus]
+    order = order_of_family[family]
+
+    epithet = pd.Series(words(rng, n_species, 3)) + 'is'
+    genus_column = genus_names.to_numpy()[genus]
+    # Most species have a common name, some only a scientific one
+    vernacular = pd.Series(words(rng, n_species, 2)).str.capitalize() + ' ' + pd.Series(words(rng, n_species, 3))
+    vernacular[rng.random(n_species) < 0.2] = None
+
+    return pd.DataFrame({
+        'speciesKey': np.arange(1, n_species + 1, dtype=np.int32) * 7 + 1_000_000,
+        'scientificName': genus_column + ' ' + epithet,
+        'vernacularName': vernacular,
+        'kingdom': np.array(KINGDOMS)[order % len(KINGDOMS)],
+        'phylum': 'Phylum' + pd.Series(order % 12).astype(str),
+        'class': 'Class' + pd.Series(order % 40).astype(str),
+        'order': 'Order' + pd.Series(order).astype(str),
+        'family': 'Family' + pd.Series(family).astype(str) + 'idae',
+        'genus': genus_column,
+    })
+
+
+def zipf_counts(n_observations: int, n_species: int, exponent: float, rng: np.random.Generator) -> np.ndarray:
+    """Observations per species, Zipf-distributed over a random popularity ranking"""
+    weights = 1.0 / np.arange(1, n_species + 1) ** exponent
+    counts = rng.multinomial(n_observations, weights / weights.sum())
+    return rng.permutation(counts)
+
+
+def make_observations(species: pd.DataFrame, counts: np.ndarray, rng: np.random.Generator) -> pd.DataFrame:
+    """Observations grouped by speciesKey, as the backend stores them"""
+    n = int(counts.sum())
+    species_keys = species['speciesKey'].to_numpy()
+    owner = np.repeat(np.arange(len(species_keys)), counts)
+
+    # Each species lives around its own centre with its own spread
+    min_lon, min_lat, max_lon, max_lat = POLAND_BBOX
+    centre_lat = rng.uniform(min_lat, max_lat, len(species_keys))
+    centre_lon = rng.uniform(min_lon, max_lon, len(species_keys))
+    spread = rng.uniform(0.05, 2.0, len(species_keys))
+    latitude = np.clip(centre_lat[owner] + rng.standard_normal(n) * spread[owner], min_lat, max_lat)
+    longitude = np.clip(centre_lon[owner] + rng.standard_normal(n) * spread[owner] * 1.5, min_lon, max_lon)
+
+    # Recording effort grows over time, so later days are more likely
+    first_day = np.datetime64(f'{FIRST_YEAR}-01-01')
+    n_days = int((np.datetime64(f'{LAST_YEAR + 1}-01-01') - first_day).astype(int))
+    day_index = (n_days * np.sqrt(rng.random(n))).astype(np.int32)
+    dates = first_day + np.arange(n_days)
+    date_strings = pd.Index(np.datetime_as_string(dates, unit='D'))
+    event = dates[day_index]
+    years = event.astype('datetime64[Y]').astype(int) + 1970
+    months = event.astype('datetime64[M]').astype(int) % 12 + 1
+    days = (event - event.astype('datetime64[M]')).astype(int) + 1
+
+    def nullable(values: np.ndarray, dtype: str, null_fraction: float) -> pd.arrays.IntegerArray:
+        # A small share of records lack the field, as in real extracts
+        array = pd.array(values, dtype=dtype)
+        array[rng.random(n) < null_fraction] = pd.NA
+        return array
+
+    locality_names = pd.Index([f"Locality {i}" for i in range(5000)])
+    return pd.DataFrame({
+        'speciesKey': species_keys[owner].astype(np.int32),
+        'decimalLatitude': latitude.astype(np.float32),
+        'decimalLongitude': longitude.astype(np.float32),
+        'eventDate': pd.Categorical.from_codes(day_index, categories=date_strings),
+        'year': nullable(years, 'Int16', 0.01),
+        'month': nullable(months, 'Int8', 0.01),
+        'day': nullable(days, 'Int8', 0.02),
+        'country': pd.Categorical.from_codes(np.zeros(n, dtype=np.int8), categories=['Poland']),
+        'stateProvince': pd.Categorical.from_codes(
+            rng.integers(0, len(VOIVODESHIPS), n).astype(np.int8), categories=VOIVODESHIPS
+        ),
+        'locality': pd.Categorical.from_codes(
+            rng.integers(0, len(locality_names), n).astype(np.int16), categories=locality_names
+        ),
+        'basisOfRecord': pd.Categorical.from_codes(
+            rng.choice(len(BASES_OF_RECORD), n, p=BASIS_WEIGHTS).astype(np.int8), categories=BASES_OF_RECORD
+        ),
+        'individualCount': nullable(rng.geometric(0.6, n).astype(np.int32), 'Int32', 0.05),
+    })
+
+
+def generate(
+    n_observations: int, n_species: int, exponent: float = 1.1, seed: int = 42
+) -> "tuple[pd.DataFrame, pd.DataFrame]":
+    """Species and observation frames in the backend's schema"""
+    rng = np.random.default_rng(seed)
+    species = make_species(n_species, rng)
+    counts = zipf_counts(n_observations, n_species, exponent, rng)
+    observations = make_observations(species, counts, rng)
+
+    # Species table ranked by observationCount, like the real one
+    species['observationCount'] = pd.array(counts, dtype='Int64')
+    species = species[counts > 0].sort_values('observationCount', ascending=False, kind='stable').reset_index(drop=True)
+    return species, observations
+
+
+def write_dataset(species: pd.DataFrame, observations: pd.DataFrame, output_dir: str) -> None:
+    """Write both tables as column stores under the names the backend loads"""
+    os.makedirs(output_dir, exist_ok=True)
+    write_column_store(species, store_path(os.path.join(output_dir, "species_poland")), SPECIES_SCHEMA)
+    # Grouped by species with saved indexes, as scripts/ingest_gbif.py writes them
+    observations = observations.sort_values('speciesKey', kind='stable').reset_index(drop=True)
+    write_column_store(
+        observations, store_path(os.path.join(output_dir, "observations_poland")), OBSERVATION_SCHEMA,
+        index_arrays(observations, species)
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--observations', default='1M', help="Number of observations, e.g. 1M, 10M, 50M")
+    parser.add_argument('--species', default='10k', help="Number of species, e.g. 10k, 100k")
+    parser.add_argument('--exponent', type=float, default=1.1, help="Zipf exponent of species popularity")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', required=True, help="Directory to write the column stores to")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    species, observations = generate(parse_count(args.observations), parse_count(args.species), args.exponent, args.seed)
+    generated = time.perf_counter() - start
+    write_dataset(species, observations, args.output)
+    print(f"Generated {len(observations)} observations of {len(species)} species in {generated:.1f}s, "
+          f"wrote {args.output} in {time.perf_counter() - start - generated:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Hashable, Iterable, Optional, Tuple
+import hashlib
+import threading
+
+
+@dataclass(frozen=True)
+class CachedResponse:
+    """Serialized body of a successful response"""
+    body: bytes
+    media_type: str
+
+
+def cache_key(path: str, query_items: Iterable[Tuple[str, str]]) -> str:
+    """Canonical key for a GET request, independent of query parameter order"""
+    return path + "?" + "&".join(f"{name}={value}" for name, value in sorted(query_items))
+
+
+def make_etag(version: str, key: str) -> str:
+    """Strong ETag for a response that is a pure function of the dataset version and request"""
+    digest = hashlib.sha1(f"{version}\n{key}".encode()).hexdigest()[:20]
+    return f'"{digest}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header covers the given ETag"""
+    if not if_none_match:
+        return False
+    candidates = [value.strip() for value in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
+
+
+class ResponseCache:
+    """Thread-safe LRU cache of response bodies bounded by total size
+
+    Entries larger than max_entry_bytes are never stored so one huge species
+    cannot flush everything else.
+    """
+
+    def __init__(self, max_bytes: int, max_entry_bytes: int):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self._entries: "OrderedDict[Hashable, CachedResponse]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, count: bool = True) -> Optional[CachedResponse]:
+        """Entry stored under key; count=False leaves the hit and miss counters alone"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                if count:
+                    self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            if count:
+                self.hits += 1
+            return entry
+
+    def record_hit(self) -> None:
+        with self._lock:
+            self.hits += 1
+
+    def put(self, key: Hashable, entry: CachedResponse) -> None:
+        size = len(entry.body)
+        if size > self.max_entry_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous.body)
+            self._entries[key] = entry
+            self._size += size
+
+            # Evict least recently used entries until back under budget
+            while self._size > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted.body)
+                self.evictions += 1
+
+    def record_not_modified(self) -> None:
+        with self._lock:
+            self.not_modified += 1
+
+    def clear(self) -> None:
+        """Drop every entry, e.g. after the dataset is reloaded"""
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._size,
+                "maxBytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "notModified": self.not_modified,
+                "evictions": self.evictions,
+            }
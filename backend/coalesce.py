@@ -0,0 +1,82 @@
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+import asyncio
+import itertools
+import threading
+
+
+class SingleFlight:
+    """Shares one in-progress computation among concurrent callers with the same key
+
+    The first caller for a key (the leader) runs the computation; callers
+    arriving before it finishes wait for its result instead of repeating the
+    work. A result of None means "nothing to share" (e.g. an error response):
+    waiting callers then compute for themselves. Used from the event loop
+    only, so no locking is needed.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    async def run(self, key: Hashable, compute: Callable[[], Awaitable[Optional[Any]]]) -> Optional[Any]:
+        while key in self._calls:
+            # Shielded so a follower giving up doesn't cancel the leader's result
+            result = await asyncio.shield(self._calls[key])
+            if result is not None:
+                self.coalesced += 1
+                return result
+
+        future = asyncio.get_running_loop().create_future()
+        self._calls[key] = future
+        self.leaders += 1
+        result = None
+        try:
+            result = await compute()
+            return result
+        finally:
+            del self._calls[key]
+            # Also reached when the leader fails or is cancelled; followers then retry
+            future.set_result(result)
+
+    def stats(self) -> Dict[str, int]:
+        return {"inFlight": len(self._calls), "leaders": self.leaders, "coalesced": self.coalesced}
+
+
+class LatestRequests:
+    """Sequence number of each client's most recent request, to skip superseded work
+
+    A client registers every request as it arrives; a request whose client
+    has registered a newer one since can be dropped before doing its work.
+    Remembers at most max_clients clients, forgetting the least recently seen.
+    """
+
+    def __init__(self, max_clients: int = 10000):
+        self.max_clients = max_clients
+        self._latest: "OrderedDict[str, int]" = OrderedDict()
+        self._sequence = itertools.count(1)
+        self._lock = threading.Lock()
+        self.superseded = 0
+
+    def register(self, client: str) -> int:
+        """Record a new request from client and return its sequence number"""
+        with self._lock:
+            sequence = next(self._sequence)
+            self._latest[client] = sequence
+            self._latest.move_to_end(client)
+            while len(self._latest) > self.max_clients:
+                self._latest.popitem(last=False)
+            return sequence
+
+    def is_superseded(self, client: str, sequence: int) -> bool:
+        """Whether client has registered a newer request than sequence, counting it if so"""
+        with self._lock:
+            superseded = self._latest.get(client, sequence) > sequence
+            if superseded:
+                self.superseded += 1
+            return superseded
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"clients": len(self._latest), "superseded": self.superseded}
@@ -0,0 +1,103 @@
+from typing import List, Optional
+import zlib
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli is listed in requirements.txt
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - zstandard is listed in requirements.txt
+    zstandard = None
+
+# Levels favour speed: responses are compressed on the request path, and
+# cached ones only once, so a few percent of ratio isn't worth the latency
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+ZSTD_LEVEL = 3
+
+
+def available_encodings() -> List[str]:
+    """Content codings this server can produce, most preferred first"""
+    encodings = []
+    if zstandard is not None:
+        encodings.append("zstd")
+    if brotli is not None:
+        encodings.append("br")
+    encodings.append("gzip")
+    return encodings
+
+
+SUPPORTED_ENCODINGS = available_encodings()
+
+
+def negotiate(accept_encoding: Optional[str]) -> Optional[str]:
+    """Pick the best coding the client accepts, or None to send identity
+
+    Honours q-values (q=0 rejects a coding, * covers unlisted ones); ties go
+    to the server's preference order.
+    """
+    if not accept_encoding:
+        return None
+    weights = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        weights[coding.strip().lower()] = quality
+
+    best, best_quality = None, 0.0
+    for coding in SUPPORTED_ENCODINGS:
+        quality = weights.get(coding, weights.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = coding, quality
+    return best
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    """Compress a complete body with the given content coding"""
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(body)
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    if encoding == "gzip":
+        compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+        return compressor.compress(body) + compressor.flush()
+    raise ValueError(f"Unsupported content coding: {encoding}")
+
+
+class StreamCompressor:
+    """Incremental compressor for streamed bodies
+
+    Every chunk is flushed, so the client can decode each batch as soon as
+    it arrives instead of waiting for the compressor's window to fill.
+    """
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "zstd":
+            self._compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+        elif encoding == "br":
+            self._compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        elif encoding == "gzip":
+            self._compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+        else:
+            raise ValueError(f"Unsupported content coding: {encoding}")
+
+    def compress(self, chunk: bytes) -> bytes:
+        if self.encoding == "zstd":
+            return self._compressor.compress(chunk) + self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+        if self.encoding == "br":
+            return self._compressor.process(chunk) + self._compressor.flush()
+        return self._compressor.compress(chunk) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        if self.encoding == "br":
+            return self._compressor.finish()
+        return self._compressor.flush()
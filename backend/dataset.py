@@ -0,0 +1,490 @@
+import pandas as pd
+import numpy as np
+from contextlib import contextmanager
+from datetime import datetime
+from functools import cached_property
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+import itertools
+import logging
+import threading
+import time
+
+from filters import ObservationFilter, filter_mask, YearIndex
+from indexes import DashboardStats, SearchIndex, SpeciesIndex, TimelineCube, sort_observations
+from metrics import record_rows
+from segments import apply_species_delta, concat_observations, list_segments, read_segment
+from spatial import BBox, SpatialIndex
+from taxonomy import SpeciesRollup, TaxonomyIndex
+from storage import data_fingerprint, load_table, load_table_arrays, OBSERVATION_SCHEMA, SPECIES_SCHEMA
+
+logger = logging.getLogger(__name__)
+
+# Fallback versions for datasets not loaded from files (e.g. frames set in tests)
+_local_versions = itertools.count(1)
+
+# Indexes whose arrays are saved with the observations column store (see
+# index_arrays), by name prefix in the store and Dataset attribute
+STORED_INDEXES = {
+    'spatial': 'spatial_index',
+    'year': 'year_index',
+    'cube': 'timeline_cube',
+    'rollup': 'species_rollup',
+    'taxonomy': 'taxonomy_index',
+}
+
+
+class LoadProgress:
+    """Phases of a dataset load and their timings, for readiness reporting
+
+    Written by the loading thread and read by request handlers. Each update
+    replaces a whole value, so readers never see one half done.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phase_seconds: Dict[str, float] = {}
+        self.current: Optional[str] = None
+        self.error: Optional[str] = None
+        self.elapsed_seconds: Optional[float] = None
+        self.finished = threading.Event()
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """Time a phase of the load under name, adding to any earlier time under the same name"""
+        self.current = name
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = self.phase_seconds.get(name, 0.0) + time.perf_counter() - started
+            self.phase_seconds = {**self.phase_seconds, name: seconds}
+            self.current = None
+
+    def finish(self, error: Optional[str] = None) -> None:
+        self.error = error
+        self.elapsed_seconds = time.perf_counter() - self.started
+        self.finished.set()
+
+    def elapsed(self) -> float:
+        """Seconds since the load started, or its total once finished"""
+        if self.finished.is_set():
+            return self.elapsed_seconds
+        return time.perf_counter() - self.started
+
+
+class Dataset:
+    """Loaded species/observation frames together with the indexes derived from them
+
+    Indexes are built on first use and live as long as the frames they were
+    derived from, so swapping in new frames means building a new Dataset.
+    Appended segments are kept as separately indexed tiers (see
+    append_segment) that queries merge with the loaded observations.
+    """
+
+    def __init__(
+        self,
+        species: Optional[pd.DataFrame],
+        observations: Optional[pd.DataFrame],
+        version: Optional[str] = None
+    ):
+        self.species = species
+        self.observations = observations
+        # Responses are pure functions of (version, request), which makes this the ETag basis
+        self.version = version or f"local-{next(_local_versions)}"
+        # Set by load_dataset for datasets read from disk
+        self.loaded_at: Optional[datetime] = None
+        self.build_seconds: Optional[float] = None
+        # Fingerprint of the files without their segments, and the segments applied on top
+        self.base_version: Optional[str] = None
+        self.segment_names: List[str] = []
+        # One indexed Dataset per appended segment, merged into every query
+        self.segments: List["Dataset"] = []
+        # Index arrays saved with the observations column store, used instead
+        # of building those indexes (memory-mapped along with the columns)
+        self.stored_arrays: Dict[str, np.ndarray] = {}
+
+    def matches(self, species: Optional[pd.DataFrame], observations: Optional[pd.DataFrame]) -> bool:
+        """Whether this dataset was derived from exactly these frames"""
+        return self.species is species and self.observations is observations
+
+    def build_indexes(self, progress: Optional[LoadProgress] = None) -> None:
+        """Eagerly build every index the loaded frames allow, timing each as a phase of progress"""
+        progress = progress or LoadProgress()
+        if self.species is not None:
+            with progress.phase("search_index"):
+                logger.info(f"Indexed names of {len(self.search_index)} species for search")
+        if self.observations is not None:
+            with progress.phase("species_index"):
+                logger.info(f"Indexed observations for {len(self.species_index)} species")
+            with progress.phase("timeline_cube"):
+                logger.info(f"Built timeline cube with {len(self.timeline_cube)} cells")
+            with progress.phase("spatial_index"):
+                self.spatial_index
+            with progress.phase("year_index"):
+                self.year_index
+        if self.segments:
+            with progress.phase("segment_indexes"):
+                for segment in self.segments:
+                    segment.species_rollup
+                    segment.spatial_index
+                    segment.year_index
+        if self.species is not None and self.observations is not None:
+            with progress.phase("dashboard_stats"):
+                self.dashboard_stats
+            with progress.phase("taxonomy"):
+                logger.info(f"Built taxonomy tree with {len(self.taxonomy_index)} taxa")
+
+    @cached_property
+    def species_index(self) -> SpeciesIndex:
+        return SpeciesIndex(self.observations)
+
+    @cached_property
+    def search_index(self) -> SearchIndex:
+        return SearchIndex(self.species)
+
+    @cached_property
+    def dashboard_stats(self) -> DashboardStats:
+        return DashboardStats(self.species, self.observations, self.species_index)
+
+    def _stored(self, prefix: str, names: Optional[Tuple[str, ...]] = None) -> Optional[Dict[str, np.ndarray]]:
+        """Saved arrays of one index by name, or None if any of names (or all, without names) is missing"""
+        if names is None:
+            start = f"{prefix}."
+            arrays = {key[len(start):]: values for key, values in self.stored_arrays.items() if key.startswith(start)}
+            return arrays or None
+        arrays = {name: self.stored_arrays.get(f"{prefix}.{name}") for name in names}
+        if any(values is None for values in arrays.values()):
+            return None
+        return arrays
+
+    @cached_property
+    def spatial_index(self) -> SpatialIndex:
+        return SpatialIndex(self.species_index, self._stored('spatial', SpatialIndex.STORED))
+
+    @cached_property
+    def year_index(self) -> YearIndex:
+        return YearIndex(self.species_index, self._stored('year', YearIndex.STORED))
+
+    @cached_property
+    def timeline_cube(self) -> TimelineCube:
+        return TimelineCube(self.observations, self._stored('cube'))
+
+    @cached_property
+    def species_rollup(self) -> SpeciesRollup:
+        return SpeciesRollup(self.species_index, self.timeline_cube, self._stored('rollup', SpeciesRollup.STORED))
+
+    @cached_property
+    def taxonomy_index(self) -> TaxonomyIndex:
+        rollups = [self.species_rollup] + [segment.species_rollup for segment in self.segments]
+        # The saved tree only counts the loaded observations, not appended segments
+        stored = None if self.segments else self._stored('taxonomy', TaxonomyIndex.STORED)
+        return TaxonomyIndex(self.species, rollups, stored)
+
+    def append_segment(self, observations: pd.DataFrame, species_delta: pd.DataFrame, name: str) -> "Dataset":
+        """A new dataset with a segment of observations appended, leaving this one as is
+
+        Only the segment's rows are indexed; indexes over the existing
+        observations are shared, and the species table and dashboard
+        aggregates are updated from the delta. Name-based indexes are rebuilt
+        lazily from the (small) species table.
+        """
+        species = apply_species_delta(self.species, species_delta)
+        observations = sort_observations(observations)
+        if self.observations is None:
+            appended = Dataset(species, observations, version=self.version)
+        else:
+            appended = Dataset(species, self.observations, version=self.version)
+            appended.stored_arrays = self.stored_arrays
+            segment = Dataset(None, observations)
+            appended.segments = self.segments + [segment]
+            # The loaded observations haven't changed, so neither have their indexes
+            for shared in ('species_index', 'timeline_cube', 'spatial_index', 'year_index', 'species_rollup'):
+                if shared in self.__dict__:
+                    appended.__dict__[shared] = self.__dict__[shared]
+            stats = self.dashboard_stats if self.species is not None else DashboardStats(
+                species, self.observations, self.species_index
+            )
+            appended.dashboard_stats = stats.appended(species, observations)
+        appended.base_version = self.base_version
+        appended.segment_names = self.segment_names + [name]
+        return appended
+
+    def search_species(self, query: str, limit: int) -> pd.DataFrame:
+        """Species rows matching a name query, word-prefix hits first"""
+        rows = self.search_index.search(query, limit)
+        return self.species.iloc[rows]
+
+    def species_observations(
+        self,
+        species_key: int,
+        bbox: Optional[BBox] = None,
+        filters: Optional[ObservationFilter] = None
+    ) -> pd.DataFrame:
+        """Observations for a species without scanning the full table
+
+        A bbox is resolved through the spatial index and a year range through
+        the year index, so only rows in the covered grid cells or years are
+        read; the other filters are checked on those rows alone. Rows keep
+        their table order, with rows from appended segments following the
+        loaded ones.
+        """
+        filters = filters or ObservationFilter()
+        observations = self._own_observations(species_key, bbox, filters)
+        parts = [
+            segment._own_observations(species_key, bbox, filters)
+            for segment in self.segments if species_key in segment.species_index
+        ]
+        if not parts:
+            return observations
+        return concat_observations([observations] + parts)
+
+    def _own_observations(self, species_key: int, bbox: Optional[BBox], filters: ObservationFilter) -> pd.DataFrame:
+        """Observations for a species from this dataset's frame only"""
+        frame = self.species_index.frame
+        if bbox is not None:
+            positions = self.spatial_index.query(species_key, bbox)
+        elif filters.has_years and 'year' in frame.columns:
+            positions = self.year_index.query(species_key, filters)
+        elif filters:
+            start, end = self.species_index.bounds(species_key)
+            positions = np.arange(start, end)
+        else:
+            observations = self.species_index.lookup(species_key)
+            record_rows(scanned=len(observations))
+            return observations
+        record_rows(scanned=len(positions))
+
+        # The year index has already applied the year bounds
+        check_years = bbox is not None or 'year' not in frame.columns
+        if filters.has_attributes or (filters.has_years and check_years):
+            positions = positions[filter_mask(frame, positions, filters, years=check_years)]
+        return frame.take(positions)
+
+    def species_timeline(
+        self,
+        species_key: int,
+        interval: str = "year",
+        split_by: Optional[str] = None,
+        filters: Optional[ObservationFilter] = None
+    ) -> pd.DataFrame:
+        """Timeline of a species from the timeline cubes of the loaded data and every segment"""
+        timeline = self.timeline_cube.timeline(species_key, interval, split_by, filters)
+        parts = [
+            segment.timeline_cube.timeline(species_key, interval, split_by, filters)
+            for segment in self.segments if species_key in segment.species_index
+        ]
+        if not parts:
+            return timeline
+        merged = concat_observations([timeline] + parts)
+        group_fields = [name for name in merged.columns if name != 'count']
+        return merged.groupby(group_fields, dropna=False, observed=True, sort=True)['count'].sum().reset_index()
+
+    def species_batch(self, species_keys: List[int], interval: str = "year") -> Tuple[pd.DataFrame, pd.DataFrame]:
+        """Summaries and timelines for many species, each from a single pass
+
+        The needed columns of every species are gathered with one take() and
+        reduced per species block with ufunc.reduceat, so there is no per-species
+        loop or groupby over the gathered rows. Timelines come from one
+        aggregation over the gathered timeline cube cells, sorted by speciesKey.
+        Segments contribute partial aggregates that are combined per species.
+        Species without observations are left out of the summaries.
+        """
+        tiers = [self] + self.segments
+        partials = [tier._batch_partials(species_keys) for tier in tiers]
+        counts = sum(partial['count'] for partial in partials)
+        present = counts > 0
+
+        def combined(name: str, ufunc) -> np.ndarray:
+            return ufunc.reduce([partial[name] for partial in partials])[present]
+
+        summaries = {
+            'speciesKey': [key for key, found in zip(species_keys, present.tolist()) if found],
+            'observationCount': counts[present],
+            'yearMin': combined('yearMin', np.fmin),
+            'yearMax': combined('yearMax', np.fmax),
+        }
+        for label in ('Latitude', 'Longitude'):
+            summaries[f'min{label}'] = combined(f'min{label}', np.fmin)
+            summaries[f'max{label}'] = combined(f'max{label}', np.fmax)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                summaries[f'centroid{label}'] = combined(f'sum{label}', np.add) / combined(f'valid{label}', np.add)
+            # Back in the coordinates' own dtype, so float32 widening noise is
+            # rounded away when serialized, as for the observations themselves
+            dtype = self.observations[f'decimal{label}'].dtype
+            for name in (f'min{label}', f'max{label}', f'centroid{label}'):
+                summaries[name] = summaries[name].astype(dtype, copy=False)
+
+        timelines = [tier.timeline_cube.timelines(species_keys, interval) for tier in tiers]
+        if len(timelines) == 1:
+            return pd.DataFrame(summaries), timelines[0]
+        merged = concat_observations(timelines)
+        group_fields = [name for name in merged.columns if name != 'count']
+        timeline = merged.groupby(group_fields, observed=True, sort=True)['count'].sum().reset_index()
+        return pd.DataFrame(summaries), timeline
+
+    def _batch_partials(self, species_keys: List[int]) -> dict:
+        """Per-species counts, extremes and coordinate sums of this dataset's rows, aligned with species_keys"""
+        bounds = np.array([self.species_index.bounds(key) for key in species_keys], dtype=np.int64).reshape(-1, 2)
+        lengths = bounds[:, 1] - bounds[:, 0]
+        present = lengths > 0
+        # Start of each species' run within the gathered arrays
+        offsets = np.cumsum(lengths[present]) - lengths[present]
+
+        positions = self.species_index.positions([key for key, found in zip(species_keys, present.tolist()) if found])
+        record_rows(scanned=len(positions))
+        frame = self.species_index.frame
+
+        def gathered(name: str) -> np.ndarray:
+            return frame[name].take(positions).to_numpy(dtype=np.float64, na_value=np.nan)
+
+        def reduced(ufunc, values: np.ndarray, empty: float) -> np.ndarray:
+            result = np.full(len(species_keys), empty)
+            if len(offsets):
+                result[present] = ufunc.reduceat(values, offsets)
+            return result
+
+        partials = {'count': lengths}
+        years = gathered('year')
+        partials['yearMin'] = reduced(np.fmin, years, np.nan)
+        partials['yearMax'] = reduced(np.fmax, years, np.nan)
+        for name, label in (('decimalLatitude', 'Latitude'), ('decimalLongitude', 'Longitude')):
+            values = gathered(name)
+            valid = ~np.isnan(values)
+            partials[f'min{label}'] = reduced(np.fmin, values, np.nan)
+            partials[f'max{label}'] = reduced(np.fmax, values, np.nan)
+            partials[f'sum{label}'] = reduced(np.add, np.where(valid, values, 0.0), 0.0)
+            partials[f'valid{label}'] = reduced(np.add, valid.astype(np.float64), 0.0)
+        return partials
+
+
+def index_arrays(observations: pd.DataFrame, species: Optional[pd.DataFrame] = None) -> Dict[str, np.ndarray]:
+    """Arrays of the STORED_INDEXES over observations, to save with their column store
+
+    The arrays refer to row positions, so observations must already be in
+    stored order, grouped by speciesKey. The taxonomy is only included when
+    the species table it is built from is given.
+    """
+    if not observations['speciesKey'].is_monotonic_increasing:
+        raise ValueError("Observations must be sorted by speciesKey")
+    # Indexed in the dtypes the store writes, so e.g. category codes in the
+    # timeline cube match the loaded columns
+    observations = observations.astype(
+        {name: dtype for name, dtype in OBSERVATION_SCHEMA.items() if name in observations.columns}
+    )
+    dataset = Dataset(species, observations)
+    arrays = {}
+    for prefix, attribute in STORED_INDEXES.items():
+        if attribute == 'taxonomy_index' and species is None:
+            continue
+        index = getattr(dataset, attribute)
+        arrays.update({f"{prefix}.{name}": values for name, values in index.stored().items()})
+    return arrays
+
+
+def load_dataset(
+    species_path: str,
+    observations_path: str,
+    mmap: bool = False,
+    progress: Optional[LoadProgress] = None,
+    on_species: Optional[Callable[[Dataset], None]] = None
+) -> Dataset:
+    """Read both tables from disk and build every index before returning
+
+    Nothing here touches the dataset currently being served, so this can run
+    in a background thread while requests keep using the old one. The small
+    species table is read first: on_species, if given, receives a dataset
+    holding just it (searchable, without observations) before the
+    observations are read. Each step is timed as a phase of progress.
+    """
+    progress = progress or LoadProgress()
+    started = time.perf_counter()
+    # Fingerprint before reading: a write racing the load changes it again
+    version = data_fingerprint([species_path, observations_path])
+
+    # Load species data (column store if converted, CSV otherwise)
+    with progress.phase("species"):
+        species = load_table(species_path, SPECIES_SCHEMA)
+    if species is not None:
+        logger.info(f"Loaded {len(species)} species records")
+    else:
+        logger.warning("Species data file not found")
+
+    species_only = Dataset(species, None, version=f"{version}+species")
+    if on_species is not None and species is not None:
+        with progress.phase("search_index"):
+            species_only.search_index
+        on_species(species_only)
+
+    # Load observations data
+    stored_arrays = {}
+    with progress.phase("observations"):
+        observations = load_table(observations_path, OBSERVATION_SCHEMA, mmap=mmap)
+        if observations is not None:
+            # Keep each species contiguous so lookups are plain slices
+            stored_order = observations
+            observations = sort_observations(observations)
+            # Saved index arrays refer to the stored row order
+            if observations is stored_order:
+                stored_arrays = load_table_arrays(observations_path, mmap=mmap)
+    if observations is not None:
+        logger.info(f"Loaded {len(observations)} observation records")
+    else:
+        logger.warning("Observations data file not found")
+
+    dataset = Dataset(species, observations, version=version)
+    dataset.stored_arrays = stored_arrays
+    dataset.base_version = data_fingerprint([species_path, observations_path], segments=False)
+    if 'search_index' in species_only.__dict__:
+        dataset.search_index = species_only.search_index
+    # Segments stay separate tiers rather than being merged and re-sorted,
+    # so a memory-mapped base stays mapped
+    segment_names = list_segments(observations_path)
+    if segment_names:
+        with progress.phase("segments"):
+            for name in segment_names:
+                dataset = dataset.append_segment(*read_segment(observations_path, name, mmap=mmap), name)
+        logger.info(f"Applied {len(dataset.segment_names)} appended segments")
+
+    dataset.build_indexes(progress)
+    dataset.loaded_at = datetime.now()
+    dataset.build_seconds = time.perf_counter() - started
+    logger.info(f"Dataset {version} ready in {dataset.build_seconds:.2f}s")
+    return dataset
+
+
+def refresh_dataset(current: Optional[Dataset], species_path: str, observations_path: str, mmap: bool = False) -> Dataset:
+    """Bring a dataset up to date with the files on disk
+
+    When the only change since current was loaded is newly appended
+    segments, they are applied on top of it, in time proportional to the new
+    rows rather than the whole history. Any other change (or no current
+    dataset read from disk) means a full load_dataset.
+    """
+    started = time.perf_counter()
+    names = list_segments(observations_path)
+    if (
+        current is None
+        or current.base_version is None
+        or current.base_version != data_fingerprint([species_path, observations_path], segments=False)
+        or names[:len(current.segment_names)] != current.segment_names
+    ):
+        return load_dataset(species_path, observations_path, mmap=mmap)
+
+    new_names = names[len(current.segment_names):]
+    if not new_names:
+        return current
+
+    version = data_fingerprint([species_path, observations_path])
+    dataset = current
+    for name in new_names:
+        observations, species_delta = read_segment(observations_path, name, mmap=mmap)
+        dataset = dataset.append_segment(observations, species_delta, name)
+        logger.info(f"Applied segment {name} with {len(observations)} observations")
+    dataset.version = version
+
+    dataset.build_indexes()
+    dataset.loaded_at = datetime.now()
+    dataset.build_seconds = time.perf_counter() - started
+    logger.info(f"Dataset {version} ready in {dataset.build_seconds:.2f}s")
+    return dataset
+
@@ -0,0 +1,84 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+import asyncio
+import contextvars
+import threading
+import time
+
+
+class QueryQueueFull(Exception):
+    """Raised when too many queries are already waiting for a worker"""
+
+
+class QueryExecutor:
+    """Bounded thread pool for CPU-bound query work, off the event loop
+
+    At most max_workers queries run at once; up to max_queue more may wait
+    (0 means no limit) and anything beyond that is rejected immediately so
+    a burst of heavy requests cannot pile up unbounded latency. Time spent
+    waiting for a worker is recorded separately from run time.
+    """
+
+    def __init__(self, max_workers: int, max_queue: int = 0):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="query")
+        self._lock = threading.Lock()
+        self._waiting = 0
+        self._active = 0
+        self.completed = 0
+        self.rejected = 0
+        self.queue_seconds_total = 0.0
+        self.queue_seconds_max = 0.0
+        self.run_seconds_total = 0.0
+
+    async def run(self, func: Callable[..., Any], *args: Any, reject: bool = True) -> Any:
+        """Run func(*args) on the pool and await its result
+
+        reject=False waits past max_queue, for follow-up work of a query that
+        was already admitted (e.g. the next batch of a stream it has started).
+        """
+        submitted = time.perf_counter()
+        with self._lock:
+            if reject and self.max_queue and self._waiting >= self.max_queue:
+                self.rejected += 1
+                raise QueryQueueFull()
+            self._waiting += 1
+
+        def timed() -> Any:
+            started = time.perf_counter()
+            waited = started - submitted
+            with self._lock:
+                self._waiting -= 1
+                self._active += 1
+                self.queue_seconds_total += waited
+                self.queue_seconds_max = max(self.queue_seconds_max, waited)
+            try:
+                return func(*args)
+            finally:
+                with self._lock:
+                    self._active -= 1
+                    self.completed += 1
+                    self.run_seconds_total += time.perf_counter() - started
+
+        # Carry the request's context (e.g. its metrics collector) into the worker
+        context = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(self._pool, context.run, timed)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            completed = self.completed
+            return {
+                "maxWorkers": self.max_workers,
+                "maxQueue": self.max_queue,
+                "active": self._active,
+                "waiting": self._waiting,
+                "completed": completed,
+                "rejected": self.rejected,
+                "queueSecondsMean": self.queue_seconds_total / completed if completed else 0.0,
+                "queueSecondsMax": self.queue_seconds_max,
+                "runSecondsMean": self.run_seconds_total / completed if completed else 0.0,
+            }
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=False, cancel_futures=True)
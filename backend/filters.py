@@ -0,0 +1,120 @@
+import pandas as pd
+import numpy as np
+from typing import Dict, NamedTuple, Optional
+
+# Categorical observation fields that can be filtered on, by filter attribute
+CATEGORY_FILTERS = {
+    'basis_of_record': 'basisOfRecord',
+    'state_province': 'stateProvince',
+}
+
+
+class ObservationFilter(NamedTuple):
+    """Attribute filters for a species' observations; None leaves a field unfiltered
+
+    Year bounds are inclusive. Rows with a missing value never match a
+    filter on that field.
+    """
+
+    year_from: Optional[int] = None
+    year_to: Optional[int] = None
+    month: Optional[int] = None
+    basis_of_record: Optional[str] = None
+    state_province: Optional[str] = None
+
+    @property
+    def has_years(self) -> bool:
+        return self.year_from is not None or self.year_to is not None
+
+    @property
+    def has_attributes(self) -> bool:
+        """Whether any filter other than the year range is set"""
+        return self.month is not None or any(getattr(self, name) is not None for name in CATEGORY_FILTERS)
+
+    def __bool__(self) -> bool:
+        return self.has_years or self.has_attributes
+
+
+def year_bounds(years: np.ndarray, filters: ObservationFilter) -> tuple:
+    """Range [lo, hi) of ascending years (missing years last) inside the filter's bounds"""
+    lo = 0 if filters.year_from is None else int(np.searchsorted(years, filters.year_from, side='left'))
+    if filters.year_to is None:
+        # NaN sorts last, so this stops before the rows without a year
+        hi = int(np.searchsorted(years, np.nan, side='left'))
+    else:
+        hi = int(np.searchsorted(years, filters.year_to, side='right'))
+    return lo, max(lo, hi)
+
+
+def category_mask(column: pd.Series, positions: np.ndarray, value: str) -> np.ndarray:
+    """Rows at positions whose value equals value, compared as categorical codes"""
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        code = column.cat.categories.get_indexer([value])[0]
+        if code < 0:
+            return np.zeros(len(positions), dtype=bool)
+        return column.array.codes[positions] == code
+    return column.take(positions).to_numpy() == value
+
+
+def filter_mask(frame: pd.DataFrame, positions: np.ndarray, filters: ObservationFilter, years: bool = True) -> np.ndarray:
+    """Rows at positions of frame matching the filters, reading only those rows
+
+    years=False skips the year bounds for callers that already applied them.
+    A filter on a field the frame lacks matches nothing.
+    """
+    mask = np.ones(len(positions), dtype=bool)
+    bounds = [('month', filters.month, np.equal)]
+    if years:
+        bounds += [('year', filters.year_from, np.greater_equal), ('year', filters.year_to, np.less_equal)]
+    for name, value, compare in bounds:
+        if value is None:
+            continue
+        if name not in frame.columns:
+            return np.zeros(len(positions), dtype=bool)
+        # Missing values become NaN, which fails every comparison
+        values = frame[name].take(positions).to_numpy(dtype=np.float64, na_value=np.nan)
+        mask &= compare(values, value)
+
+    for attribute, name in CATEGORY_FILTERS.items():
+        value = getattr(filters, attribute)
+        if value is None:
+            continue
+        if name not in frame.columns:
+            return np.zeros(len(positions), dtype=bool)
+        mask &= category_mask(frame[name], positions, value)
+    return mask
+
+
+class YearIndex:
+    """Per-species year order over observations
+
+    Within each species block (see indexes.SpeciesIndex) row positions are
+    ordered by year, with missing years last, so a year range is a pair of
+    binary searches and reading it costs only the rows it holds. Like
+    spatial.SpatialIndex it can be built from arrays saved with the column store.
+    """
+
+    # Arrays making up the index, as saved with the column store
+    STORED = ('order', 'sorted_years')
+
+    def __init__(self, species_index, stored: Optional[Dict[str, np.ndarray]] = None):
+        self.species_index = species_index
+        if stored is not None:
+            self.order, self.sorted_years = stored['order'], stored['sorted_years']
+            return
+        frame = species_index.frame
+        years = frame['year'].to_numpy(dtype=np.float32, na_value=np.nan)
+        species_keys = frame['speciesKey'].to_numpy()
+        position_dtype = np.int32 if len(frame) < np.iinfo(np.int32).max else np.int64
+        self.order = np.lexsort((years, species_keys)).astype(position_dtype)
+        self.sorted_years = years[self.order]
+
+    def stored(self) -> Dict[str, np.ndarray]:
+        """The STORED arrays by name, to save with the column store"""
+        return {name: getattr(self, name) for name in self.STORED}
+
+    def query(self, species_key, filters: ObservationFilter) -> np.ndarray:
+        """Ascending row positions (into the species index frame) of a species within the year bounds"""
+        start, end = self.species_index.bounds(species_key)
+        lo, hi = year_bounds(self.sorted_years[start:end], filters)
+        return np.sort(self.order[start + lo:start + hi])
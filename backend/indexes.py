@@ -0,0 +1,397 @@
+import pandas as pd
+import numpy as np
+from bisect import bisect_left
+from collections import defaultdict
+from typing import Dict, Iterator, List, Optional, Tuple
+import copy
+import heapq
+import re
+import unicodedata
+
+from filters import ObservationFilter, filter_mask, year_bounds
+from metrics import record_rows
+
+# Start of each word in a normalized name
+WORD_START = re.compile(r"\b\w")
+
+
+def sort_observations(observations: pd.DataFrame) -> pd.DataFrame:
+    """Return observations ordered by speciesKey so each species is a contiguous block"""
+    if observations['speciesKey'].is_monotonic_increasing:
+        return observations
+    return observations.sort_values('speciesKey', kind='stable').reset_index(drop=True)
+
+
+def expand_ranges(starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    """Positions of the ranges [start, end) concatenated, without a Python loop"""
+    lengths = ends - starts
+    # Each output position is its range's start plus its offset within the range
+    block_starts = np.cumsum(lengths) - lengths
+    return np.repeat(starts - block_starts, lengths) + np.arange(lengths.sum())
+
+
+class SpeciesIndex:
+    """Offsets table mapping speciesKey to its contiguous row range in the observations"""
+
+    def __init__(self, observations: pd.DataFrame):
+        self.frame = sort_observations(observations)
+
+        # Run-length encode the sorted keys into (start, end) row offsets.
+        # Boundaries are where the key changes, found in one linear pass.
+        keys = self.frame['speciesKey'].to_numpy()
+        starts = np.flatnonzero(np.diff(keys) != 0) + 1
+        if len(keys):
+            starts = np.concatenate(([0], starts))
+        ends = np.append(starts[1:], len(keys))
+        unique_keys = keys[starts]
+
+        self.offsets: Dict[int, Tuple[int, int]] = dict(
+            zip(unique_keys.tolist(), zip(starts.tolist(), ends.tolist()))
+        )
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def __contains__(self, species_key) -> bool:
+        return species_key in self.offsets
+
+    def bounds(self, species_key) -> Tuple[int, int]:
+        """Row range [start, end) for a species, empty if it has no observations"""
+        return self.offsets.get(species_key, (0, 0))
+
+    def lookup(self, species_key) -> pd.DataFrame:
+        """Observations for a species as a zero-copy positional slice"""
+        start, end = self.bounds(species_key)
+        return self.frame.iloc[start:end]
+
+    def positions(self, species_keys: List[int]) -> np.ndarray:
+        """Row positions of several species' blocks, concatenated in the given order
+
+        Built as one vectorized range expansion, so gathering many species
+        costs a single take() rather than one slice and concat per species.
+        """
+        bounds = np.array([self.bounds(key) for key in species_keys], dtype=np.int64).reshape(-1, 2)
+        return expand_ranges(bounds[:, 0], bounds[:, 1])
+
+    def gather(self, species_keys: List[int]) -> pd.DataFrame:
+        """Observations of several species in one gather, grouped by species"""
+        return self.frame.take(self.positions(species_keys))
+
+
+def normalize_name(value) -> str:
+    """Lowercase a name and strip diacritics so 'Żubr' matches 'zubr'"""
+    if not isinstance(value, str):
+        return ""
+    decomposed = unicodedata.normalize("NFKD", value.lower())
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+
+class SearchIndex:
+    """Prefix and trigram index over species vernacular and scientific names
+
+    Rows are identified by their position in the species table, and every
+    result list is in table order, so ties keep the table's ranking.
+    """
+
+    # Joins the two names of a row so grams never span both
+    SEPARATOR = "\x00"
+
+    def __init__(self, species: pd.DataFrame):
+        vernacular = species['vernacularName'].tolist() if 'vernacularName' in species.columns else [None] * len(species)
+        scientific = species['scientificName'].tolist() if 'scientificName' in species.columns else [None] * len(species)
+        self.texts: List[str] = [
+            normalize_name(v) + self.SEPARATOR + normalize_name(s) for v, s in zip(vernacular, scientific)
+        ]
+
+        # Sorted suffixes starting at each word, so a prefix query is a bisect range
+        prefix_entries = []
+        for row, text in enumerate(self.texts):
+            for match in WORD_START.finditer(text):
+                prefix_entries.append((text[match.start():], row))
+        prefix_entries.sort()
+        self.prefix_keys: List[str] = [key for key, _ in prefix_entries]
+        self.prefix_rows = np.array([row for _, row in prefix_entries], dtype=np.int32)
+
+        # Posting lists of rows (ascending) for every bigram and trigram
+        postings: Dict[str, List[int]] = defaultdict(list)
+        for row, text in enumerate(self.texts):
+            grams = set()
+            for size in (2, 3):
+                grams.update(text[i:i + size] for i in range(len(text) - size + 1))
+            grams = {gram for gram in grams if self.SEPARATOR not in gram}
+            for gram in grams:
+                postings[gram].append(row)
+        self.postings: Dict[str, np.ndarray] = {
+            gram: np.array(rows, dtype=np.int32) for gram, rows in postings.items()
+        }
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    def prefix_matches(self, query: str, limit: int) -> np.ndarray:
+        """First `limit` rows with a word in either name starting with the (normalized) query"""
+        lo = bisect_left(self.prefix_keys, query)
+        hi = bisect_left(self.prefix_keys, query + "\U0010ffff", lo)
+        rows = self.prefix_rows[lo:hi]
+
+        # A row repeats once per matching word, so the few smallest entries
+        # usually hold `limit` distinct rows without sorting the whole range
+        sample = 4 * limit
+        if len(rows) > sample:
+            smallest = np.unique(np.partition(rows, sample)[:sample])
+            if len(smallest) >= limit:
+                return smallest[:limit]
+        return np.unique(rows)[:limit]
+
+    def _candidates(self, query: str) -> Iterator[int]:
+        """Rows that may contain the query, ascending"""
+        if len(query) < 2:
+            yield from range(len(self.texts))
+            return
+
+        size = min(len(query), 3)
+        grams = {query[i:i + size] for i in range(len(query) - size + 1)}
+        lists = sorted((self.postings.get(gram) for gram in grams), key=lambda rows: 0 if rows is None else len(rows))
+        if lists[0] is None:
+            return
+
+        # Intersect from the rarest gram until few candidates remain;
+        # the substring check on each candidate does the rest
+        candidates = lists[0]
+        for rows in lists[1:]:
+            if len(candidates) <= 256:
+                break
+            candidates = np.intersect1d(candidates, rows, assume_unique=True)
+        for start in range(0, len(candidates), 256):
+            yield from candidates[start:start + 256].tolist()
+
+    def search(self, query: str, limit: int) -> List[int]:
+        """Top `limit` rows containing the query, word-prefix hits first"""
+        query = normalize_name(query)
+        if limit <= 0:
+            return []
+
+        results = self.prefix_matches(query, limit).tolist() if query else []
+        if len(results) >= limit:
+            return results
+
+        seen = set(results)
+        for row in self._candidates(query):
+            if row not in seen and query in self.texts[row]:
+                results.append(row)
+                if len(results) >= limit:
+                    break
+        return results
+
+
+class DashboardStats:
+    """Dataset-wide aggregates behind the dashboard, kept up to date incrementally
+
+    Per-species counts and the year range are computed once from the loaded
+    data; update() folds in newly appended observations using only the delta.
+    """
+
+    TOP_N = 10
+
+    def __init__(self, species: pd.DataFrame, observations: pd.DataFrame, species_index: SpeciesIndex):
+        self.total_species = len(species)
+
+        # speciesKey -> (scientificName, vernacularName), first row wins like the old lookup
+        self.names: Dict[int, Tuple[Optional[str], Optional[str]]] = {}
+        self._add_names(species)
+
+        # Counts come straight from the species index offsets, no groupby needed
+        self.counts: Dict[int, int] = {
+            key: end - start for key, (start, end) in species_index.offsets.items()
+        }
+        self.total_observations = len(observations)
+        self.year_min, self.year_max = self._year_range(observations)
+        self._refresh()
+
+    def _add_names(self, species: pd.DataFrame) -> None:
+        """Record names of species not seen yet"""
+        keys = species['speciesKey'].tolist()
+        scientific = species['scientificName'].tolist() if 'scientificName' in species.columns else [None] * len(keys)
+        vernacular = species['vernacularName'].tolist() if 'vernacularName' in species.columns else [None] * len(keys)
+        for key, sci, vern in zip(keys, scientific, vernacular):
+            if key not in self.names:
+                self.names[key] = (sci if isinstance(sci, str) else None, vern if isinstance(vern, str) else None)
+
+    @staticmethod
+    def _year_range(observations: pd.DataFrame) -> Tuple[Optional[int], Optional[int]]:
+        years = observations['year'].dropna()
+        if years.empty:
+            return None, None
+        return int(years.min()), int(years.max())
+
+    def update(self, new_observations: pd.DataFrame) -> None:
+        """Fold appended observations into the aggregates without rescanning old rows"""
+        keys, counts = np.unique(new_observations['speciesKey'].to_numpy(), return_counts=True)
+        for key, count in zip(keys.tolist(), counts.tolist()):
+            self.counts[key] = self.counts.get(key, 0) + count
+        self.total_observations += len(new_observations)
+
+        year_min, year_max = self._year_range(new_observations)
+        if year_min is not None:
+            self.year_min = year_min if self.year_min is None else min(self.year_min, year_min)
+            self.year_max = year_max if self.year_max is None else max(self.year_max, year_max)
+        self._refresh()
+
+    def appended(self, species: pd.DataFrame, new_observations: pd.DataFrame) -> "DashboardStats":
+        """A copy with appended observations folded in, leaving this one untouched
+
+        species is the updated species table; only the names of species it
+        adds are read, so the cost follows the delta and the species count.
+        """
+        stats = copy.copy(self)
+        stats.names = dict(self.names)
+        stats.counts = dict(self.counts)
+        stats.total_species = len(species)
+        stats._add_names(species[~species['speciesKey'].isin(list(self.names))])
+        stats.update(new_observations)
+        return stats
+
+    def _refresh(self) -> None:
+        """Rebuild the cached response after the aggregates change"""
+        # Highest count first, ties by speciesKey; species missing from the table are skipped
+        top = heapq.nlargest(
+            self.TOP_N,
+            ((count, -key) for key, count in self.counts.items() if key in self.names)
+        )
+        top_species = []
+        for count, negated_key in top:
+            scientific, vernacular = self.names[-negated_key]
+            top_species.append({
+                "speciesKey": int(-negated_key),
+                "scientificName": scientific,
+                "vernacularName": vernacular,
+                "observationCount": int(count)
+            })
+
+        self.response = {
+            "totalSpecies": self.total_species,
+            "totalObservations": self.total_observations,
+            "topSpecies": top_species,
+            "yearRange": {"min": self.year_min, "max": self.year_max}
+        }
+
+
+class TimelineCube:
+    """Observation counts pre-aggregated by species, year, month, record basis and province
+
+    Each species owns a contiguous block of cells, so a timeline query only
+    re-aggregates that block (bounded by years x months x categories) rather
+    than the species' raw observations. The cells can be saved with the
+    column store (see stored) and passed back in instead of regrouping.
+    """
+
+    DIMENSIONS = ['speciesKey', 'year', 'month', 'basisOfRecord', 'stateProvince']
+    SPLIT_FIELDS = ['basisOfRecord', 'stateProvince']
+
+    def __init__(self, observations: pd.DataFrame, stored: Optional[Dict[str, np.ndarray]] = None):
+        self.dimensions = [name for name in self.DIMENSIONS if name in observations.columns]
+        if stored is not None and all(name in stored for name in self.dimensions + ['count']):
+            cells = self._from_stored(observations, stored)
+        else:
+            cells = (
+                observations.groupby(self.dimensions, dropna=False, observed=True, sort=True)
+                .size()
+                .reset_index(name='count')
+            )
+        self.index = SpeciesIndex(cells)
+
+    def stored(self) -> Dict[str, np.ndarray]:
+        """The cells as flat arrays, encoded like column store columns
+
+        Categorical columns are saved as codes into the observations' own
+        categories, and nullable integers as values plus a "<name>.mask" array.
+        """
+        arrays = {}
+        for name, column in self.index.frame.items():
+            if isinstance(column.dtype, pd.CategoricalDtype):
+                arrays[name] = column.cat.codes.to_numpy()
+            elif isinstance(column.dtype, pd.api.extensions.ExtensionDtype):
+                arrays[name] = column.to_numpy(dtype=column.dtype.numpy_dtype, na_value=0)
+                arrays[f"{name}.mask"] = column.isna().to_numpy()
+            else:
+                arrays[name] = column.to_numpy()
+        return arrays
+
+    def _from_stored(self, observations: pd.DataFrame, stored: Dict[str, np.ndarray]) -> pd.DataFrame:
+        """Cells frame decoded from the arrays of stored, sharing their memory"""
+        columns = {}
+        for name in self.dimensions + ['count']:
+            values = stored[name]
+            if f"{name}.mask" in stored:
+                columns[name] = pd.arrays.IntegerArray(values, stored[f"{name}.mask"])
+            elif name in observations.columns and isinstance(observations[name].dtype, pd.CategoricalDtype):
+                columns[name] = pd.Categorical.from_codes(values, dtype=observations[name].dtype)
+            else:
+                columns[name] = values
+        return pd.DataFrame(columns, copy=False)
+
+    def __len__(self) -> int:
+        return len(self.index.frame)
+
+    def timeline(
+        self,
+        species_key,
+        interval: str = "year",
+        split_by: Optional[str] = None,
+        filters: Optional[ObservationFilter] = None
+    ) -> pd.DataFrame:
+        """Counts per year (or year and month), optionally split by a categorical field
+
+        Filters are applied to the species' cells, not its raw observations.
+        """
+        cells = self.index.lookup(species_key)
+        if filters:
+            cells = self._filtered(cells, filters)
+        record_rows(scanned=len(cells))
+
+        time_fields = ['year', 'month'] if interval == "month" else ['year']
+        # Rows without a date cannot be placed on the timeline
+        cells = cells.dropna(subset=[name for name in time_fields if name in cells.columns])
+        group_fields = time_fields + ([split_by] if split_by else [])
+        if cells.empty or any(name not in cells.columns for name in group_fields):
+            return pd.DataFrame(columns=group_fields + ['count'])
+
+        return (
+            cells.groupby(group_fields, dropna=False, observed=True, sort=True)['count']
+            .sum()
+            .reset_index()
+        )
+
+    @staticmethod
+    def _filtered(cells: pd.DataFrame, filters: ObservationFilter) -> pd.DataFrame:
+        """Cells of one species matching the filters
+
+        Cells are grouped in sort order, so within a species block they are
+        ascending by year and a year range is found by binary search.
+        """
+        lo, hi = 0, len(cells)
+        if filters.has_years:
+            if 'year' not in cells.columns:
+                return cells.iloc[0:0]
+            lo, hi = year_bounds(cells['year'].to_numpy(dtype=np.float64, na_value=np.nan), filters)
+        cells = cells.iloc[lo:hi]
+        if not filters.has_attributes:
+            return cells
+        return cells[filter_mask(cells, np.arange(len(cells)), filters, years=False)]
+
+    def timelines(self, species_keys: List[int], interval: str = "year") -> pd.DataFrame:
+        """Counts per species and year (or year and month) for many species in one aggregation"""
+        cells = self.index.gather(species_keys)
+        record_rows(scanned=len(cells))
+
+        time_fields = ['year', 'month'] if interval == "month" else ['year']
+        cells = cells.dropna(subset=[name for name in time_fields if name in cells.columns])
+        group_fields = ['speciesKey'] + time_fields
+        if cells.empty or any(name not in cells.columns for name in group_fields):
+            return pd.DataFrame(columns=group_fields + ['count'])
+
+        return (
+            cells.groupby(group_fields, observed=True, sort=True)['count']
+            .sum()
+            .reset_index()
+        )
@@ -1,240 +1,894 @@
-from fastapi import FastAPI, HTTPException, Query
+from fastapi import FastAPI, Header, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-import pandas as pd
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 import numpy as np
-from typing import List, Optional, Dict, Any
+from typing import AsyncIterator, Iterator, List, Optional, Literal, Tuple
+import base64
 import json
 import os
+import threading
 from datetime import datetime
 import logging
 from contextlib import asynccontextmanager
 
+from cache import CachedResponse, ResponseCache, cache_key, etag_matches, make_etag
+from coalesce import LatestRequests, SingleFlight
+from compress import StreamCompressor, compress, negotiate
+from dataset import Dataset, LoadProgress, load_dataset, refresh_dataset
+from filters import ObservationFilter
+from executor import QueryExecutor, QueryQueueFull
+from metrics import MetricsMiddleware, MetricsRegistry, record_rows, stage
+from storage import data_fingerprint
+from serialization import (
+    FastJSONResponse, frame_to_columnar, frame_to_columns, frame_to_records, iter_ndjson, timeline_fields,
+    GRID_BIN_FIELDS, OBSERVATION_FIELDS, SPECIES_FIELDS, SPECIES_SUMMARY_FIELDS
+)
+from spatial import grid_bins, parse_bbox
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Map the column store read-only instead of loading it, so that every worker
+# process on the host shares one copy of the observation columns
+DATA_MMAP = os.getenv("DATA_MMAP", "false").lower() in ("1", "true", "yes")
+
+# Data files, without extension (column store or CSV, see storage.load_table)
+SPECIES_PATH = "data/species_poland"
+OBSERVATIONS_PATH = "data/observations_poland"
+
+# Poll the data files every N seconds and reload when they change (0 disables)
+DATA_WATCH_INTERVAL = float(os.getenv("DATA_WATCH_INTERVAL", "0"))
+
+# Required as X-Admin-Token on admin endpoints; while unset they are disabled
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+# Serialized API responses, bounded by total size (MB)
+response_cache = ResponseCache(
+    max_bytes=int(os.getenv("RESPONSE_CACHE_MB", "256")) * 1024 * 1024,
+    max_entry_bytes=int(os.getenv("RESPONSE_CACHE_ENTRY_MB", "32")) * 1024 * 1024
+)
+
+# Concurrent identical API GETs that miss the cache share one computation
+in_flight = SingleFlight()
+
+# Latest search per client, so searches overtaken by a newer keystroke are
+# skipped rather than computed for nobody
+latest_searches = LatestRequests()
+# Query parameter naming a search's client (a browser tab). A parameter rather
+# than a header keeps searches simple CORS requests, with no preflight per query;
+# it names the sender, not the result, so it is left out of cache keys
+CLIENT_ID_PARAM = "client_id"
+
+# API responses smaller than this are sent uncompressed
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+# Larger bodies are compressed on a worker thread rather than the event loop
+COMPRESS_INLINE_BYTES = 256 * 1024
+
+# Most species one batch request may ask for
+BATCH_MAX_SPECIES = 100
+
+# Pool for CPU-bound query work, so cheap endpoints keep answering while
+# heavy filters and serialization run (0 queue limit means unbounded)
+query_executor = QueryExecutor(
+    max_workers=int(os.getenv("QUERY_WORKERS", str(min(4, os.cpu_count() or 1)))),
+    max_queue=int(os.getenv("QUERY_QUEUE_LIMIT", "64"))
+)
+
+# Per-route latency, size and row histograms served on /metrics
+metrics_registry = MetricsRegistry()
+
+# Honour X-Profile: 1 by returning a sampled profile instead of the response body
+PROFILE_REQUESTS = os.getenv("PROFILE_REQUESTS", "false").lower() in ("1", "true", "yes")
+
 # Global variables for data
 species_data = None
 observations_data = None
 
-@asynccontextmanager
-async def lifespan(app: FastAPI):
-    """Load biodiversity data on startup"""
-    global species_data, observations_data
+# Indexes derived from the frames above, rebuilt whenever they are replaced
+_dataset = None
+
+# Guards publishing a new dataset; held only for the swap itself
+_swap_lock = threading.Lock()
+# Held for the whole of a reload so only one runs at a time
+_reload_lock = threading.Lock()
+
+# Phases of the load started with the app, reported by /ready and /metrics
+startup_progress: Optional[LoadProgress] = None
+
+def get_dataset() -> Dataset:
+    """Return the indexed view of the currently loaded data
+
+    Handlers take this snapshot once per request and use only it, so a
+    concurrent reload can never mix old and new data within a response.
+    """
+    global _dataset
+    dataset = _dataset
+    if dataset is not None and dataset.matches(species_data, observations_data):
+        return dataset
     
+    with _swap_lock:
+        # A swap may have been in flight when the fast path looked
+        dataset = _dataset
+        if dataset is None or not dataset.matches(species_data, observations_data):
+            dataset = Dataset(species_data, observations_data)
+            _dataset = dataset
+            response_cache.clear()
+        return dataset
+
+def install_dataset(dataset: Dataset) -> None:
+    """Atomically publish a fully built dataset to request handlers"""
+    global species_data, observations_data, _dataset
+    with _swap_lock:
+        species_data = dataset.species
+        observations_data = dataset.observations
+        _dataset = dataset
+        response_cache.clear()
+
+def _reload_holding_lock(full: bool = False) -> None:
+    """Load the data files (or just newly appended segments) and swap them in; the caller holds _reload_lock"""
     try:
-        # Load species data
-        species_file = "data/species_poland.csv"
-        if os.path.exists(species_file):
-            species_data = pd.read_csv(species_file)
-            logger.info(f"Loaded {len(species_data)} species records")
+        if full:
+            dataset = load_dataset(SPECIES_PATH, OBSERVATIONS_PATH, mmap=DATA_MMAP)
         else:
-            logger.warning("Species data file not found")
-            
-        # Load observations data
-        obs_file = "data/observations_poland.csv"
-        if os.path.exists(obs_file):
-            observations_data = pd.read_csv(obs_file)
-            logger.info(f"Loaded {len(observations_data)} observation records")
-        else:
-            logger.warning("Observations data file not found")
-            
+            dataset = refresh_dataset(_dataset, SPECIES_PATH, OBSERVATIONS_PATH, mmap=DATA_MMAP)
+        if dataset is not _dataset:
+            install_dataset(dataset)
     except Exception as e:
         logger.error(f"Error loading data: {e}")
+    finally:
+        _reload_lock.release()
+
+def _startup_load_holding_lock(progress: LoadProgress) -> None:
+    """Load the data files at startup, publishing the species table first; the caller holds _reload_lock"""
+    try:
+        # Search works as soon as the species table is in; the rest follows
+        install_dataset(load_dataset(
+            SPECIES_PATH, OBSERVATIONS_PATH, mmap=DATA_MMAP, progress=progress, on_species=install_dataset
+        ))
+        progress.finish()
+        logger.info(f"Ready {progress.elapsed():.2f}s after startup")
+    except Exception as e:
+        logger.error(f"Error loading data: {e}")
+        progress.finish(error=str(e))
+    finally:
+        _reload_lock.release()
+
+def start_background_reload(full: bool = False) -> bool:
+    """Rebuild the dataset in a background thread; False if a reload is already running"""
+    if not _reload_lock.acquire(blocking=False):
+        return False
+    threading.Thread(target=_reload_holding_lock, args=(full,), name="data-reload", daemon=True).start()
+    return True
+
+def watch_data_files(stop: threading.Event) -> None:
+    """Reload whenever the data files' fingerprint differs from the served version"""
+    last_attempted = None
+    while not stop.wait(DATA_WATCH_INTERVAL):
+        fingerprint = data_fingerprint([SPECIES_PATH, OBSERVATIONS_PATH])
+        current = _dataset.version if _dataset is not None else None
+        # Don't retry the same broken files on every poll
+        if fingerprint != current and fingerprint != last_attempted:
+            if start_background_reload():
+                logger.info(f"Data files changed ({current} -> {fingerprint}), reloading")
+                last_attempted = fingerprint
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Load biodiversity data on startup"""
+    # Serve /health and /ready at once while the data and every index are
+    # built in the background, rather than on the first request
+    global startup_progress
+    startup_progress = LoadProgress()
+    _reload_lock.acquire()
+    threading.Thread(
+        target=_startup_load_holding_lock, args=(startup_progress,), name="data-load", daemon=True
+    ).start()
+    
+    stop_watching = threading.Event()
+    if DATA_WATCH_INTERVAL > 0:
+        threading.Thread(
+            target=watch_data_files, args=(stop_watching,), name="data-watch", daemon=True
+        ).start()
     
     yield
     
-    # Cleanup code here if needed
+    stop_watching.set()
+    query_executor.shutdown()
 
 app = FastAPI(title="Biodiversity Dashboard API", version="1.0.0", lifespan=lifespan)
 
-# CORS middleware
+def wants_profile(request: Request) -> bool:
+    """Whether this request asked for (and may have) a sampled profile"""
+    if not PROFILE_REQUESTS or request.headers.get("x-profile") != "1":
+        return False
+    return not ADMIN_TOKEN or request.headers.get("x-admin-token") == ADMIN_TOKEN
+
+async def compress_body(body: bytes, encoding: str) -> bytes:
+    """Compress a response body, off the event loop when it is large"""
+    if len(body) > COMPRESS_INLINE_BYTES:
+        return await run_in_threadpool(compress, body, encoding)
+    return compress(body, encoding)
+
+def compress_stream(response: Response, encoding: str) -> Response:
+    """Compress a streamed response chunk by chunk as it is sent"""
+    body = response.body_iterator
+    
+    async def compressed_body():
+        compressor = StreamCompressor(encoding)
+        async for chunk in body:
+            data = await run_in_threadpool(compressor.compress, chunk)
+            if data:
+                yield data
+        yield compressor.finish()
+    
+    response.body_iterator = compressed_body()
+    if "content-length" in response.headers:
+        del response.headers["content-length"]
+    response.headers["Content-Encoding"] = encoding
+    response.headers["Vary"] = "Accept-Encoding"
+    return response
+
+@app.middleware("http")
+async def cache_responses(request: Request, call_next):
+    """Serve repeated API GETs from the response cache, compressed, and answer If-None-Match with 304"""
+    if request.method != "GET" or not request.url.path.startswith("/api/"):
+        return await call_next(request)
+    
+    # Numbered on arrival, so the handler can tell whether a newer one came in meanwhile
+    client = request.query_params.get(CLIENT_ID_PARAM)
+    if client and request.url.path == "/api/species/search":
+        request.state.search = (client, latest_searches.register(client))
+    
+    encoding = negotiate(request.headers.get("accept-encoding"))
+    # Streams are not buffered, so they bypass the cache but are still compressed
+    # on the fly; profiles need the real work and are replaced by text anyway
+    if wants_profile(request):
+        return await call_next(request)
+    if request.query_params.get("format") == "ndjson":
+        response = await call_next(request)
+        if encoding is None or response.status_code != 200:
+            return response
+        return compress_stream(response, encoding)
+    
+    dataset = get_dataset()
+    key = cache_key(
+        request.url.path, [(name, value) for name, value in request.query_params.multi_items() if name != CLIENT_ID_PARAM]
+    )
+    # Each content coding is a separate representation with its own strong ETag
+    etag = make_etag(dataset.version, key if encoding is None else f"{key}\n{encoding}")
+    headers = {"ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    
+    # Revalidation needs no data access at all
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        response_cache.record_not_modified()
+        return Response(status_code=304, headers=headers)
+    
+    # Hot responses are kept precompressed, so hits cost no compression CPU;
+    # a request counts as one hit or miss, decided by the uncompressed entry below
+    if encoding is not None:
+        entry = response_cache.get((dataset.version, key, encoding), count=False)
+        if entry is not None:
+            response_cache.record_hit()
+            headers["Content-Encoding"] = encoding
+            return Response(content=entry.body, media_type=entry.media_type, headers=headers)
+    
+    entry = response_cache.get((dataset.version, key))
+    if entry is None:
+        response = None
+        
+        async def compute() -> Optional[CachedResponse]:
+            nonlocal response
+            response = await call_next(request)
+            # Only cache (or share) what was computed from the dataset the ETag names
+            if response.status_code != 200 or get_dataset() is not dataset:
+                return None
+            
+            body = b"".join([chunk async for chunk in response.body_iterator])
+            computed = CachedResponse(body, response.headers.get("content-type"))
+            response_cache.put((dataset.version, key), computed)
+            headers.update({name: value for name, value in response.headers.items() if name != "content-length"})
+            return computed
+        
+        # A burst of requests for the same hot species scans and serializes it once
+        entry = await in_flight.run((dataset.version, key), compute)
+        if entry is None:
+            return response
+    
+    # Small bodies gain little from compression and cost a round of CPU
+    if encoding is None or len(entry.body) < COMPRESS_MIN_BYTES:
+        return Response(content=entry.body, media_type=entry.media_type, headers=headers)
+    
+    compressed = CachedResponse(await compress_body(entry.body, encoding), entry.media_type)
+    response_cache.put((dataset.version, key, encoding), compressed)
+    headers["Content-Encoding"] = encoding
+    return Response(content=compressed.body, media_type=compressed.media_type, headers=headers)
+
+# Plain ASGI middleware rather than @app.middleware: it adds no extra task or
+# body re-streaming per request, which keeps /health-class overhead negligible
+app.add_middleware(MetricsMiddleware, registry=metrics_registry, profile_requested=wants_profile)
+
+# CORS middleware (added last so it also wraps cached and 304 responses)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://localhost:3000", "http://127.0.0.1:3000"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Total-Count", "X-Next-Cursor", "Server-Timing"],
 )
 
 
+def encode_cursor(offset: int, version: str) -> str:
+    """Opaque pagination cursor for the next page of the data at version"""
+    return base64.urlsafe_b64encode(json.dumps({"offset": offset, "version": version}).encode()).decode()
+
+def decode_cursor(cursor: Optional[str]) -> Tuple[int, Optional[str]]:
+    """Row offset and data version encoded in a cursor, raising ValueError if it is not one of ours"""
+    if cursor is None:
+        return 0, None
+    try:
+        decoded = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        offset, version = decoded["offset"], decoded["version"]
+    except Exception:
+        raise ValueError("malformed cursor")
+    if not isinstance(offset, int) or offset < 0 or not isinstance(version, str):
+        raise ValueError("malformed cursor")
+    return offset, version
+
+def parse_species_keys(value: str) -> List[int]:
+    """Parse a comma-separated list of species keys, dropping repeats, raising ValueError if malformed"""
+    try:
+        keys = [int(part) for part in value.split(",") if part.strip()]
+    except ValueError:
+        raise ValueError("keys must be comma-separated integers")
+    if not keys:
+        raise ValueError("at least one species key is required")
+    keys = list(dict.fromkeys(keys))
+    if len(keys) > BATCH_MAX_SPECIES:
+        raise ValueError(f"at most {BATCH_MAX_SPECIES} species per request")
+    return keys
+
+async def run_query(func):
+    """Run CPU-bound handler work on the query pool, turning a full queue into 503"""
+    try:
+        return await query_executor.run(func)
+    except QueryQueueFull:
+        raise HTTPException(status_code=503, detail="Too many queries in progress", headers={"Retry-After": "1"})
+
+async def stream_on_pool(chunks: Iterator[bytes]) -> AsyncIterator[bytes]:
+    """Yield a sync iterator's chunks, producing each one on the query pool"""
+    while True:
+        # The stream has already started, so later chunks wait rather than being refused
+        chunk = await query_executor.run(next, chunks, None, reject=False)
+        if chunk is None:
+            return
+        yield chunk
+
+
 @app.get("/")
 async def root():
     return {"message": "Biodiversity Dashboard API"}
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy", "timestamp": datetime.now().isoformat()}
+    dataset = get_dataset()
+    return {
+        "status": "healthy",
+        "ready": is_ready(dataset),
+        "timestamp": datetime.now().isoformat(),
+        "dataVersion": dataset.version,
+        "loadedAt": dataset.loaded_at.isoformat() if dataset.loaded_at else None,
+        "buildSeconds": dataset.build_seconds,
+        "segments": len(dataset.segment_names),
+        "reloading": _reload_lock.locked()
+    }
+
+def is_ready(dataset: Dataset) -> bool:
+    """Whether a dataset can serve every endpoint"""
+    return dataset.species is not None and dataset.observations is not None
+
+def still_loading() -> bool:
+    """Whether the startup load is still running"""
+    return startup_progress is not None and not startup_progress.finished.is_set()
+
+def require_data(loaded: bool, detail: str) -> None:
+    """Raise unless loaded: 503 while the startup load is still running, 500 with detail after it"""
+    if loaded:
+        return
+    if still_loading():
+        raise HTTPException(status_code=503, detail="Data still loading", headers={"Retry-After": "5"})
+    raise HTTPException(status_code=500, detail=detail)
+
+@app.get("/ready")
+async def readiness_check():
+    """Readiness probe: 200 once every endpoint can be served, 503 with load progress until then"""
+    dataset = get_dataset()
+    progress = startup_progress
+    body = {
+        "ready": is_ready(dataset),
+        "searchReady": dataset.species is not None,
+        "dataVersion": dataset.version,
+        "loading": still_loading(),
+        "phase": progress.current if progress else None,
+        "phaseSeconds": {
+            name: round(seconds, 3) for name, seconds in progress.phase_seconds.items()
+        } if progress else {},
+        "elapsedSeconds": round(progress.elapsed(), 3) if progress else None,
+        "error": progress.error if progress else None
+    }
+    return JSONResponse(body, status_code=200 if body["ready"] else 503)
+
+@app.post("/admin/reload", status_code=202)
+async def reload_data(
+    full: bool = Query(False, description="Reload everything even if only segments were appended"),
+    x_admin_token: Optional[str] = Header(None)
+):
+    """Reload the data files in the background and swap them in when ready"""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled until ADMIN_TOKEN is set")
+    if x_admin_token != ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+    if not start_background_reload(full):
+        raise HTTPException(status_code=409, detail="Reload already in progress")
+    return {"status": "reloading", "dataVersion": get_dataset().version}
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """Response cache size and hit/miss counters, plus coalesced and superseded requests"""
+    return {
+        **response_cache.stats(),
+        "singleFlight": in_flight.stats(),
+        "searches": latest_searches.stats()
+    }
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus-format request metrics plus cache and query pool gauges"""
+    gauges = {f"response_cache_{name}": value for name, value in response_cache.stats().items()}
+    gauges.update({f"query_pool_{name}": value for name, value in query_executor.stats().items()})
+    gauges.update({f"single_flight_{name}": value for name, value in in_flight.stats().items()})
+    gauges.update({f"search_{name}": value for name, value in latest_searches.stats().items()})
+    progress = startup_progress
+    if progress is not None:
+        gauges.update({f"startup_{name}_seconds": value for name, value in progress.phase_seconds.items()})
+        if progress.finished.is_set():
+            gauges["startup_ready_seconds"] = progress.elapsed()
+    return PlainTextResponse(metrics_registry.render(gauges), media_type="text/plain; version=0.0.4")
+
+@app.get("/executor/stats")
+async def executor_stats():
+    """Query pool occupancy and queue-time counters"""
+    return query_executor.stats()
 
 @app.get("/api/species/search")
 async def search_species(
-    query: str = Query(..., description="Search term for species name"),
-    limit: int = Query(10, description="Maximum number of results")
+    request: Request,
+    # Shorter queries match most names and have no gram postings; the search bar doesn't send them either
+    query: str = Query(..., min_length=2, description="Search term for species name, at least 2 characters"),
+    limit: int = Query(10, description="Maximum number of results"),
+    client_id: Optional[str] = Query(
+        None, description="Id of the sending client; its searches overtaken by a newer one are answered 409"
+    )
 ):
     """Search for species by vernacular or scientific name"""
-    if species_data is None:
-        raise HTTPException(status_code=500, detail="Species data not loaded")
+    dataset = get_dataset()
+    require_data(dataset.species is not None, "Species data not loaded")
+    
+    # The client has typed on since sending this; nobody will read the result
+    search = getattr(request.state, "search", None)
+    if search is not None and latest_searches.is_superseded(*search):
+        raise HTTPException(status_code=409, detail="Superseded by a newer search from this client")
     
     try:
-        # Search in both vernacular and scientific names
-        query_lower = query.lower()
-        
-        # Create search mask
-        vernacular_mask = species_data['vernacularName'].str.lower().str.contains(query_lower, na=False)
-        scientific_mask = species_data['scientificName'].str.lower().str.contains(query_lower, na=False)
-        
-        # Combine masks
-        search_mask = vernacular_mask | scientific_mask
-        
-        # Get results
-        results = species_data[search_mask].head(limit)
+        # Search in both vernacular and scientific names via the prebuilt index
+        with stage("filter"):
+            results = dataset.search_species(query, limit)
+        record_rows(returned=len(results))
         
         # Convert to list of dictionaries
-        species_list = []
-        for _, row in results.iterrows():
-            species_list.append({
-                "scientificName": row['scientificName'],
-                "vernacularName": row['vernacularName'],
-                "speciesKey": row['speciesKey'],
-                "kingdom": row.get('kingdom', ''),
-                "phylum": row.get('phylum', ''),
-                "class": row.get('class', ''),
-                "order": row.get('order', ''),
-                "family": row.get('family', ''),
-                "genus": row.get('genus', '')
+        with stage("serialize"):
+            species_list = frame_to_records(results, SPECIES_FIELDS)
+            
+            return FastJSONResponse({
+                "query": query,
+                "count": len(species_list),
+                "species": species_list
             })
         
-        return {
-            "query": query,
-            "count": len(species_list),
-            "species": species_list
-        }
-        
     except Exception as e:
         logger.error(f"Error searching species: {e}")
         raise HTTPException(status_code=500, detail=f"Error searching species: {str(e)}")
 
+@app.get("/api/species/batch")
+async def get_species_batch(
+    keys: str = Query(..., description="Comma-separated speciesKeys"),
+    interval: Literal["year", "month"] = Query("year", description="Timeline counts per year or per month")
+):
+    """Get summaries and timelines for several species in one request"""
+    dataset = get_dataset()
+    require_data(is_ready(dataset), "Data not loaded")
+    
+    try:
+        species_keys = parse_species_keys(keys)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=f"Invalid keys: {str(e)}")
+    
+    try:
+        def build_response():
+            # One gather and one grouped aggregation for all species
+            with stage("aggregate"):
+                summaries, timelines = dataset.species_batch(species_keys, interval)
+            record_rows(returned=len(summaries) + len(timelines))
+            
+            with stage("serialize"):
+                summary_columns = frame_to_columns(summaries, SPECIES_SUMMARY_FIELDS)
+                summary_rows = {
+                    key: row for row, key in enumerate(summaries['speciesKey'].tolist())
+                }
+                
+                # Timelines are sorted by species, so each one is a contiguous run
+                fields = timeline_fields(interval)
+                timeline_keys = timelines['speciesKey'].to_numpy(dtype=np.int64)
+                timeline_records = frame_to_records(timelines, fields)
+                
+                names = dataset.dashboard_stats.names
+                species_list = []
+                for key in species_keys:
+                    scientific, vernacular = names.get(key, (None, None))
+                    row = summary_rows.get(key)
+                    summary = {name: values[row] for name, values in summary_columns.items()} if row is not None else {}
+                    start = int(np.searchsorted(timeline_keys, key, side='left'))
+                    end = int(np.searchsorted(timeline_keys, key, side='right'))
+                    species_list.append({
+                        "speciesKey": key,
+                        "scientificName": scientific,
+                        "vernacularName": vernacular,
+                        "observationCount": summary.get("observationCount", 0),
+                        "yearRange": {"min": summary.get("yearMin"), "max": summary.get("yearMax")},
+                        "extent": {
+                            name: summary[name]
+                            for name in ["minLatitude", "maxLatitude", "minLongitude", "maxLongitude"]
+                        } if summary else None,
+                        "centroid": {
+                            "decimalLatitude": summary["centroidLatitude"],
+                            "decimalLongitude": summary["centroidLongitude"]
+                        } if summary else None,
+                        "timeline": timeline_records[start:end]
+                    })
+                
+                return FastJSONResponse({
+                    "interval": interval,
+                    "count": len(species_list),
+                    "species": species_list
+                })
+        
+        return await run_query(build_response)
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error getting species batch: {e}")
+        raise HTTPException(status_code=500, detail=f"Error getting species batch: {str(e)}")
+
 @app.get("/api/species/{species_key}/observations")
-async def get_species_observations(species_key: int):
+async def get_species_observations(
+    species_key: int,
+    bbox: Optional[str] = Query(None, description="Viewport as min_lon,min_lat,max_lon,max_lat"),
+    year_from: Optional[int] = Query(None, description="Earliest year to include"),
+    year_to: Optional[int] = Query(None, description="Latest year to include"),
+    month: Optional[int] = Query(None, ge=1, le=12, description="Only observations from this month"),
+    basis_of_record: Optional[str] = Query(None, description="Only observations with this basisOfRecord"),
+    state_province: Optional[str] = Query(None, description="Only observations from this stateProvince"),
+    limit: Optional[int] = Query(None, ge=1, description="Maximum number of observations per page"),
+    cursor: Optional[str] = Query(None, description="nextCursor from the previous page"),
+    response_format: Literal["json", "ndjson", "columnar"] = Query(
+        "json", alias="format",
+        description="ndjson streams one observation per line; columnar packs each field into a typed buffer"
+    )
+):
     """Get observations for a specific species"""
-    if observations_data is None:
-        raise HTTPException(status_code=500, detail="Observations data not loaded")
+    dataset = get_dataset()
+    require_data(dataset.observations is not None, "Observations data not loaded")
     
     try:
-        # Filter observations for the species
-        species_obs = observations_data[observations_data['speciesKey'] == species_key].copy()
-        
-        if species_obs.empty:
-            return {
-                "speciesKey": species_key,
-                "count": 0,
-                "observations": []
-            }
+        viewport = parse_bbox(bbox)
+        offset, cursor_version = decode_cursor(cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=f"Invalid query: {str(e)}")
+    
+    # Offsets only hold for the rows they were counted in; after a reload or
+    # an appended segment the same offset would skip or repeat rows
+    if cursor is not None and cursor_version != dataset.version:
+        raise HTTPException(status_code=409, detail="Cursor is from an older version of the data; start from the first page")
+    
+    try:
+        def build_response():
+            # Filter observations for the species, viewport and attributes
+            with stage("filter"):
+                filters = ObservationFilter(year_from, year_to, month, basis_of_record, state_province)
+                species_obs = dataset.species_observations(species_key, viewport, filters)
+                total = len(species_obs)
+                
+                # Page through the filtered rows; slicing keeps this a view
+                end = total if limit is None else min(offset + limit, total)
+                page = species_obs.iloc[offset:end]
+                next_cursor = encode_cursor(end, dataset.version) if end < total else None
+            record_rows(returned=len(page))
+            
+            if response_format == "ndjson":
+                # Stream batches as they are converted so memory stays bounded
+                headers = {"X-Total-Count": str(total)}
+                if next_cursor is not None:
+                    headers["X-Next-Cursor"] = next_cursor
+                return StreamingResponse(
+                    stream_on_pool(iter_ndjson(page, OBSERVATION_FIELDS)), media_type="application/x-ndjson",
+                    headers=headers
+                )
+            
+            if response_format == "columnar":
+                # Parallel typed columns instead of one object per observation
+                with stage("serialize"):
+                    return FastJSONResponse({
+                        "speciesKey": species_key,
+                        "count": len(page),
+                        "total": total,
+                        "nextCursor": next_cursor,
+                        "columns": frame_to_columnar(page, OBSERVATION_FIELDS)
+                    })
+            
+            # Convert to list of dictionaries
+            with stage("serialize"):
+                observations_list = frame_to_records(page, OBSERVATION_FIELDS)
+                
+                return FastJSONResponse({
+                    "speciesKey": species_key,
+                    "count": len(observations_list),
+                    "total": total,
+                    "nextCursor": next_cursor,
+                    "observations": observations_list
+                })
         
-        # Convert to list of dictionaries
-        observations_list = []
-        for _, row in species_obs.iterrows():
-            obs = {
-                "decimalLatitude": float(row['decimalLatitude']) if pd.notna(row['decimalLatitude']) else None,
-                "decimalLongitude": float(row['decimalLongitude']) if pd.notna(row['decimalLongitude']) else None,
-                "eventDate": row['eventDate'] if pd.notna(row['eventDate']) else None,
-                "year": int(row['year']) if pd.notna(row['year']) else None,
-                "month": int(row['month']) if pd.notna(row['month']) else None,
-                "day": int(row['day']) if pd.notna(row['day']) else None,
-                "country": row.get('country', ''),
-                "stateProvince": row.get('stateProvince', ''),
-                "locality": row.get('locality', ''),
-                "basisOfRecord": row.get('basisOfRecord', ''),
-                "individualCount": int(row['individualCount']) if pd.notna(row['individualCount']) else None
-            }
-            observations_list.append(obs)
-        
-        return {
-            "speciesKey": species_key,
-            "count": len(observations_list),
-            "observations": observations_list
-        }
+        # Filtering and serialization run off the event loop
+        return await run_query(build_response)
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error getting species observations: {e}")
         raise HTTPException(status_code=500, detail=f"Error getting species observations: {str(e)}")
 
+@app.get("/api/species/{species_key}/observations/grid")
+async def get_species_observation_grid(
+    species_key: int,
+    zoom: int = Query(6, ge=0, le=20, description="Map zoom level the bins are sized for"),
+    bbox: Optional[str] = Query(None, description="Viewport as min_lon,min_lat,max_lon,max_lat"),
+    max_bins: int = Query(5000, ge=1, le=20000, description="Upper bound on the number of bins")
+):
+    """Get observations of a species aggregated into map grid cells"""
+    dataset = get_dataset()
+    require_data(dataset.observations is not None, "Observations data not loaded")
+    
+    try:
+        viewport = parse_bbox(bbox)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=f"Invalid bbox: {str(e)}")
+    
+    try:
+        def build_response():
+            with stage("filter"):
+                species_obs = dataset.species_observations(species_key, bbox=viewport)
+            
+            # Vectorized binning; coarsens the grid if it would exceed max_bins
+            with stage("aggregate"):
+                bins, level = grid_bins(species_obs, zoom, max_bins)
+            record_rows(returned=len(bins))
+            
+            with stage("serialize"):
+                return FastJSONResponse({
+                    "speciesKey": species_key,
+                    "zoom": zoom,
+                    "level": level,
+                    "count": int(bins['count'].sum()),
+                    "bins": frame_to_records(bins, GRID_BIN_FIELDS)
+                })
+        
+        return await run_query(build_response)
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error getting species observation grid: {e}")
+        raise HTTPException(status_code=500, detail=f"Error getting species observation grid: {str(e)}")
+
 @app.get("/api/species/{species_key}/timeline")
-async def get_species_timeline(species_key: int):
+async def get_species_timeline(
+    species_key: int,
+    interval: Literal["year", "month"] = Query("year", description="Count per year or per month"),
+    split_by: Optional[Literal["basisOfRecord", "stateProvince"]] = Query(
+        None, description="Split each count by record basis or province"
+    ),
+    year_from: Optional[int] = Query(None, description="Earliest year to include"),
+    year_to: Optional[int] = Query(None, description="Latest year to include"),
+    month: Optional[int] = Query(None, ge=1, le=12, description="Only observations from this month"),
+    basis_of_record: Optional[str] = Query(None, description="Only observations with this basisOfRecord"),
+    state_province: Optional[str] = Query(None, description="Only observations from this stateProvince")
+):
     """Get timeline data for a specific species"""
-    if observations_data is None:
-        raise HTTPException(status_code=500, detail="Observations data not loaded")
+    dataset = get_dataset()
+    require_data(dataset.observations is not None, "Observations data not loaded")
+    
+    try:
+        def build_response():
+            # Aggregate the species' block of the precomputed timeline cube
+            with stage("aggregate"):
+                filters = ObservationFilter(year_from, year_to, month, basis_of_record, state_province)
+                timeline_data = dataset.species_timeline(species_key, interval, split_by, filters)
+            record_rows(returned=len(timeline_data))
+            
+            # Convert to list of dictionaries
+            with stage("serialize"):
+                timeline = frame_to_records(timeline_data, timeline_fields(interval, split_by))
+                
+                return FastJSONResponse({
+                    "speciesKey": species_key,
+                    "interval": interval,
+                    "splitBy": split_by,
+                    "timeline": timeline
+                })
+        
+        return await run_query(build_response)
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error getting species timeline: {e}")
+        raise HTTPException(status_code=500, detail=f"Error getting species timeline: {str(e)}")
+
+def get_taxonomy(dataset: Dataset, taxon_id: Optional[int] = None):
+    """Taxonomy tree of a dataset, raising 404 for an unknown taxon id"""
+    require_data(is_ready(dataset), "Data not loaded")
+    taxonomy = dataset.taxonomy_index
+    if taxon_id is not None and taxon_id not in taxonomy:
+        raise HTTPException(status_code=404, detail=f"Unknown taxon: {taxon_id}")
+    return taxonomy
+
+@app.get("/api/taxonomy")
+async def list_taxa(
+    rank: Optional[Literal["kingdom", "phylum", "class", "order", "family", "genus", "species"]] = Query(
+        None, description="Only taxa of this rank"
+    ),
+    name: Optional[str] = Query(None, description="Only taxa with exactly this name"),
+    limit: int = Query(100, ge=1, le=1000, description="Maximum number of taxa, most observed first")
+):
+    """Browse the taxonomy: the kingdoms, or the taxa matching a rank and/or name"""
+    dataset = get_dataset()
+    taxonomy = get_taxonomy(dataset)
     
     try:
-        # Filter observations for the species
-        species_obs = observations_data[observations_data['speciesKey'] == species_key].copy()
+        def build_response():
+            # Ranks and children are ranked by observations at build time, so
+            # only the returned taxa are summarized
+            if name is not None:
+                nodes = taxonomy.find(name, rank)
+                count, top = len(nodes), taxonomy.top(nodes, limit)
+            elif rank is not None:
+                count, top = taxonomy.count_at(rank), taxonomy.top_at(rank, limit)
+            else:
+                count, top = taxonomy.child_count(-1), taxonomy.top_children(-1, limit)
+            
+            return FastJSONResponse({
+                "count": count,
+                "taxa": [taxonomy.summary(node) for node in top]
+            })
+        
+        return await run_query(build_response)
         
-        if species_obs.empty:
-            return {
-                "speciesKey": species_key,
-                "timeline": []
-            }
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error listing taxa: {e}")
+        raise HTTPException(status_code=500, detail=f"Error listing taxa: {str(e)}")
+
+@app.get("/api/taxonomy/{taxon_id}")
+async def get_taxon(
+    taxon_id: int,
+    limit: int = Query(1000, ge=1, le=10000, description="Maximum number of children, most observed first")
+):
+    """Get a taxon with its lineage and children"""
+    dataset = get_dataset()
+    taxonomy = get_taxonomy(dataset, taxon_id)
+    
+    try:
+        def build_response():
+            return FastJSONResponse({
+                **taxonomy.summary(taxon_id),
+                "lineage": [
+                    {"id": node, "rank": taxonomy.node_rank[node], "name": taxonomy.node_name[node]}
+                    for node in taxonomy.lineage(taxon_id)
+                ],
+                "children": [taxonomy.summary(node) for node in taxonomy.top_children(taxon_id, limit)]
+            })
         
-        # Group by year and count observations
-        timeline_data = species_obs.groupby('year').size().reset_index(name='count')
-        timeline_data = timeline_data.sort_values('year')
+        return await run_query(build_response)
         
-        # Convert to list of dictionaries
-        timeline = []
-        for _, row in timeline_data.iterrows():
-            timeline.append({
-                "year": int(row['year']),
-                "count": int(row['count'])
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error getting taxon: {e}")
+        raise HTTPException(status_code=500, detail=f"Error getting taxon: {str(e)}")
+
+@app.get("/api/taxonomy/{taxon_id}/timeline")
+async def get_taxon_timeline(taxon_id: int):
+    """Get observation counts per year for every species under a taxon"""
+    dataset = get_dataset()
+    taxonomy = get_taxonomy(dataset, taxon_id)
+    
+    try:
+        # Rolled up per taxon when the dataset was loaded
+        with stage("aggregate"):
+            timeline_data = taxonomy.timeline(taxon_id)
+        record_rows(returned=len(timeline_data))
+        
+        with stage("serialize"):
+            return FastJSONResponse({
+                "id": taxon_id,
+                "rank": taxonomy.node_rank[taxon_id],
+                "name": taxonomy.node_name[taxon_id],
+                "interval": "year",
+                "timeline": frame_to_records(timeline_data, timeline_fields("year"))
             })
         
-        return {
-            "speciesKey": species_key,
-            "timeline": timeline
-        }
+    except Exception as e:
+        logger.error(f"Error getting taxon timeline: {e}")
+        raise HTTPException(status_code=500, detail=f"Error getting taxon timeline: {str(e)}")
+
+@app.get("/api/taxonomy/{taxon_id}/grid")
+async def get_taxon_grid(
+    taxon_id: int,
+    zoom: int = Query(6, ge=0, le=20, description="Map zoom level the bins are sized for"),
+    max_bins: int = Query(5000, ge=1, le=20000, description="Upper bound on the number of bins")
+):
+    """Get observations of every species under a taxon aggregated into map grid cells"""
+    dataset = get_dataset()
+    taxonomy = get_taxonomy(dataset, taxon_id)
+    
+    try:
+        def build_response():
+            # Merges the taxon's stored per-species cells, not its observations
+            with stage("aggregate"):
+                bins, level = taxonomy.grid(taxon_id, zoom, max_bins)
+            record_rows(returned=len(bins))
+            
+            with stage("serialize"):
+                return FastJSONResponse({
+                    "id": taxon_id,
+                    "rank": taxonomy.node_rank[taxon_id],
+                    "name": taxonomy.node_name[taxon_id],
+                    "zoom": zoom,
+                    "level": level,
+                    "count": int(bins['count'].sum()),
+                    "bins": frame_to_records(bins, GRID_BIN_FIELDS)
+                })
+        
+        return await run_query(build_response)
         
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Error getting species timeline: {e}")
-        raise HTTPException(status_code=500, detail=f"Error getting species timeline: {str(e)}")
+        logger.error(f"Error getting taxon grid: {e}")
+        raise HTTPException(status_code=500, detail=f"Error getting taxon grid: {str(e)}")
 
 @app.get("/api/dashboard/stats")
 async def get_dashboard_stats():
     """Get general statistics for the dashboard"""
-    if species_data is None or observations_data is None:
-        raise HTTPException(status_code=500, detail="Data not loaded")
-    
-    try:
-        # Basic statistics
-        total_species = len(species_data)
-        total_observations = len(observations_data)
-        
-        # Most observed species
-        top_species = observations_data.groupby('speciesKey').size().sort_values(ascending=False).head(10)
-        top_species_list = []
-        
-        for species_key, count in top_species.items():
-            species_info = species_data[species_data['speciesKey'] == species_key]
-            if not species_info.empty:
-                species_row = species_info.iloc[0]
-                top_species_list.append({
-                    "speciesKey": int(species_key),
-                    "scientificName": species_row['scientificName'],
-                    "vernacularName": species_row['vernacularName'],
-                    "observationCount": int(count)
-                })
-        
-        # Year range
-        year_range = {
-            "min": int(observations_data['year'].min()) if not observations_data['year'].isna().all() else None,
-            "max": int(observations_data['year'].max()) if not observations_data['year'].isna().all() else None
-        }
-        
-        return {
-            "totalSpecies": total_species,
-            "totalObservations": total_observations,
-            "topSpecies": top_species_list,
-            "yearRange": year_range
-        }
+    dataset = get_dataset()
+    require_data(is_ready(dataset), "Data not loaded")
+    
+    try:
+        # Aggregates are precomputed when the data is loaded
+        return FastJSONResponse(dataset.dashboard_stats.response)
         
     except Exception as e:
         logger.error(f"Error getting dashboard stats: {e}")
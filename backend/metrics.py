@@ -0,0 +1,283 @@
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterator, Optional, Sequence, Set, Tuple
+import re
+import sys
+import threading
+import time
+
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse
+from starlette.routing import Match
+
+# Histogram upper bounds, Prometheus-style (le="...")
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216, 67108864)
+ROW_BUCKETS = (10, 100, 1000, 10000, 100000, 1000000, 10000000)
+
+METRIC_PREFIX = "biodiversity"
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus exposition sense"""
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name: str, labels: str) -> Iterator[str]:
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            yield f'{name}_bucket{{{labels},le="{bound:g}"}} {cumulative}'
+        yield f'{name}_bucket{{{labels},le="+Inf"}} {self.count}'
+        yield f'{name}_sum{{{labels}}} {self.sum:.6f}'
+        yield f'{name}_count{{{labels}}} {self.count}'
+
+
+class RequestMetrics:
+    """What one request did, filled in by handlers through stage() and record_rows()"""
+
+    __slots__ = ("stages", "rows_scanned", "rows_returned", "threads")
+
+    def __init__(self):
+        self.stages: Dict[str, float] = {}
+        self.rows_scanned: Optional[int] = None
+        self.rows_returned: Optional[int] = None
+        # Threads currently inside one of this request's stages, for the profiler
+        self.threads: Set[int] = set()
+
+    def server_timing(self) -> str:
+        """Stage durations as a Server-Timing header value"""
+        return ", ".join(f"{name};dur={seconds * 1000:.3f}" for name, seconds in self.stages.items())
+
+
+# Set by the metrics middleware for the duration of a request; copied into
+# query pool threads along with the rest of the request context
+_current: ContextVar[Optional[RequestMetrics]] = ContextVar("request_metrics", default=None)
+
+
+def begin_request() -> Tuple[RequestMetrics, object]:
+    """Start collecting for the current request; returns the collector and a reset token"""
+    request_metrics = RequestMetrics()
+    return request_metrics, _current.set(request_metrics)
+
+
+def end_request(token) -> None:
+    _current.reset(token)
+
+
+@contextmanager
+def stage(name: str):
+    """Time a block of handler work under a stage name (no-op outside a request)"""
+    request_metrics = _current.get()
+    if request_metrics is None:
+        yield
+        return
+    thread = threading.get_ident()
+    request_metrics.threads.add(thread)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        request_metrics.stages[name] = request_metrics.stages.get(name, 0.0) + time.perf_counter() - started
+        request_metrics.threads.discard(thread)
+
+
+def record_rows(scanned: Optional[int] = None, returned: Optional[int] = None) -> None:
+    """Note how many rows the current request read and how many it returned"""
+    request_metrics = _current.get()
+    if request_metrics is None:
+        return
+    if scanned is not None:
+        request_metrics.rows_scanned = (request_metrics.rows_scanned or 0) + scanned
+    if returned is not None:
+        request_metrics.rows_returned = returned
+
+
+class MetricsRegistry:
+    """Per-route request counters and histograms, rendered in Prometheus text format"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests: Dict[Tuple[str, str, int], int] = defaultdict(int)
+        self.latency: Dict[str, Histogram] = {}
+        self.response_bytes: Dict[str, Histogram] = {}
+        self.rows_scanned: Dict[str, Histogram] = {}
+        self.rows_returned: Dict[str, Histogram] = {}
+        self.stages: Dict[Tuple[str, str], Histogram] = {}
+
+    @staticmethod
+    def _histogram(table: dict, key, buckets: Sequence[float]) -> Histogram:
+        histogram = table.get(key)
+        if histogram is None:
+            histogram = table[key] = Histogram(buckets)
+        return histogram
+
+    def observe(
+        self, route: str, method: str, status: int, seconds: float, size: int, request_metrics: RequestMetrics
+    ) -> None:
+        with self._lock:
+            self.requests[(route, method, status)] += 1
+            self._histogram(self.latency, route, LATENCY_BUCKETS).observe(seconds)
+            self._histogram(self.response_bytes, route, SIZE_BUCKETS).observe(size)
+            if request_metrics.rows_scanned is not None:
+                self._histogram(self.rows_scanned, route, ROW_BUCKETS).observe(request_metrics.rows_scanned)
+            if request_metrics.rows_returned is not None:
+                self._histogram(self.rows_returned, route, ROW_BUCKETS).observe(request_metrics.rows_returned)
+            for name, stage_seconds in request_metrics.stages.items():
+                self._histogram(self.stages, (route, name), LATENCY_BUCKETS).observe(stage_seconds)
+
+    def render(self, gauges: Optional[Dict[str, float]] = None) -> str:
+        """Prometheus text exposition of everything recorded so far, plus point-in-time gauges"""
+        p = METRIC_PREFIX
+        lines = []
+        with self._lock:
+            lines.append(f"# TYPE {p}_requests_total counter")
+            for (route, method, status), count in sorted(self.requests.items()):
+                lines.append(f'{p}_requests_total{{route="{route}",method="{method}",status="{status}"}} {count}')
+
+            for name, table, help_text in (
+                ("request_duration_seconds", self.latency, "Time from request to last body byte"),
+                ("response_size_bytes", self.response_bytes, "Response body size"),
+                ("rows_scanned", self.rows_scanned, "Rows read from the dataset per request"),
+                ("rows_returned", self.rows_returned, "Rows in the response per request"),
+            ):
+                lines.append(f"# HELP {p}_{name} {help_text}")
+                lines.append(f"# TYPE {p}_{name} histogram")
+                for route, histogram in sorted(table.items()):
+                    lines.extend(histogram.render(f"{p}_{name}", f'route="{route}"'))
+
+            lines.append(f"# HELP {p}_stage_duration_seconds Handler time per stage (filter, aggregate, serialize)")
+            lines.append(f"# TYPE {p}_stage_duration_seconds histogram")
+            for (route, name), histogram in sorted(self.stages.items()):
+                lines.extend(histogram.render(f"{p}_stage_duration_seconds", f'route="{route}",stage="{name}"'))
+
+        for name, value in sorted((gauges or {}).items()):
+            # Stats dicts use camelCase keys; Prometheus names are snake_case
+            name = re.sub(r"(?<=[a-z])(?=[A-Z])", "_", name).lower()
+            lines.append(f"# TYPE {p}_{name} gauge")
+            lines.append(f"{p}_{name} {float(value):g}")
+        return "\n".join(lines) + "\n"
+
+
+class SamplingProfiler:
+    """Samples the stacks of one request's threads at a fixed interval
+
+    Only threads inside one of the request's stage() blocks are sampled, so
+    concurrent requests on other pool threads stay out of the profile. The
+    result is in folded-stack format, ready for flamegraph tools.
+    """
+
+    def __init__(self, request_metrics: RequestMetrics, interval: float = 0.001):
+        self.request_metrics = request_metrics
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            for ident in list(self.request_metrics.threads):
+                frame = frames.get(ident)
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{frame.f_lineno})")
+                    frame = frame.f_back
+                if stack:
+                    self.samples[";".join(reversed(stack))] += 1
+
+    def stop(self) -> str:
+        """Stop sampling and return the folded stacks, most frequent first"""
+        self._stop.set()
+        self._thread.join()
+        total = sum(self.samples.values())
+        lines = [f"# {total} samples every {self.interval * 1000:g} ms"]
+        lines.extend(f"{stack} {count}" for stack, count in self.samples.most_common())
+        return "\n".join(lines) + "\n"
+
+
+def route_template(scope) -> str:
+    """Path template of the route serving scope, or "unmatched"
+
+    Taken from scope["route"] when the router ran; responses answered by a
+    middleware before routing (e.g. cache hits) are matched against the
+    app's routes here instead.
+    """
+    route = scope.get("route")
+    if route is None and "app" in scope:
+        for candidate in scope["app"].router.routes:
+            match, _ = candidate.matches(scope)
+            if match == Match.FULL:
+                route = candidate
+                break
+    return getattr(route, "path", "unmatched")
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency, size and rows per route
+
+    Stage timings go out in a Server-Timing header. Requests for which
+    profile_requested returns True get a SamplingProfiler profile instead
+    of their normal body.
+    """
+
+    def __init__(self, app, registry: MetricsRegistry, profile_requested: Optional[Callable[[Request], bool]] = None):
+        self.app = app
+        self.registry = registry
+        self.profile_requested = profile_requested
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        request_metrics, token = begin_request()
+        profiler = None
+        if self.profile_requested is not None and self.profile_requested(Request(scope)):
+            profiler = SamplingProfiler(request_metrics)
+            profiler.start()
+
+        status = 500
+        size = 0
+
+        async def send_observed(message):
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if request_metrics.stages:
+                    headers = list(message.get("headers", []))
+                    headers.append((b"server-timing", request_metrics.server_timing().encode()))
+                    message = {**message, "headers": headers}
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            # A profiled request's own response is swallowed and replaced below
+            if profiler is None:
+                await send(message)
+
+        try:
+            await self.app(scope, receive, send_observed)
+        finally:
+            end_request(token)
+            profile = profiler.stop() if profiler is not None else None
+            # Label by route template so /api/species/1 and /api/species/2 share series
+            self.registry.observe(route_template(scope), scope["method"], status, time.perf_counter() - started, size, request_metrics)
+
+        if profile is not None:
+            headers = {"Server-Timing": request_metrics.server_timing()} if request_metrics.stages else None
+            await PlainTextResponse(profile, headers=headers)(scope, receive, send)
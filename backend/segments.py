@@ -0,0 +1,125 @@
+import pandas as pd
+import numpy as np
+from pandas.api.types import union_categoricals
+from typing import List, Optional, Tuple
+import os
+import shutil
+import logging
+
+from storage import read_column_store, write_column_store, OBSERVATION_SCHEMA, SEGMENTS_SUFFIX, SPECIES_SCHEMA
+
+logger = logging.getLogger(__name__)
+
+# Appended observations live next to the base table as numbered, immutable
+# segment directories, each holding the delta's observations (sorted by
+# speciesKey) and a species table with the delta's per-species counts:
+#   data/observations_poland.segments/000001/observations.store
+#   data/observations_poland.segments/000001/species.store
+OBSERVATIONS_STORE = "observations.store"
+SPECIES_STORE = "species.store"
+
+
+def segments_dir(observations_path: str) -> str:
+    """Segment directory for an observations path without extension"""
+    return observations_path + SEGMENTS_SUFFIX
+
+
+def list_segments(observations_path: str) -> List[str]:
+    """Names of the complete segments appended to an observations table, oldest first"""
+    root = segments_dir(observations_path)
+    if not os.path.isdir(root):
+        return []
+    return sorted(
+        name for name in os.listdir(root)
+        if not name.endswith(".tmp") and os.path.exists(os.path.join(root, name, OBSERVATIONS_STORE, "meta.json"))
+    )
+
+
+def write_segment(observations_path: str, observations: pd.DataFrame, species: Optional[pd.DataFrame] = None) -> str:
+    """Append observations as a new immutable segment and return its name
+
+    species supplies names and taxonomy for species the delta introduces;
+    the segment's species table gets one row per species in the delta with
+    observationCount set to its rows in the delta. The segment becomes
+    visible in one rename, so readers never see it half written.
+    """
+    root = segments_dir(observations_path)
+    os.makedirs(root, exist_ok=True)
+    existing = list_segments(observations_path)
+    name = f"{int(existing[-1]) + 1 if existing else 1:06d}"
+    tmp_path = os.path.join(root, name + ".tmp")
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    observations = observations.sort_values('speciesKey', kind='stable').reset_index(drop=True)
+    keys, counts = np.unique(observations['speciesKey'].to_numpy(), return_counts=True)
+    delta_counts = pd.DataFrame({'speciesKey': keys.astype(np.int32), 'observationCount': counts})
+    if species is None:
+        species_delta = delta_counts
+    else:
+        species_delta = (
+            species.drop(columns=['observationCount'], errors='ignore')
+            .drop_duplicates('speciesKey')
+            .merge(delta_counts, on='speciesKey', how='right')
+        )
+
+    write_column_store(observations, os.path.join(tmp_path, OBSERVATIONS_STORE), OBSERVATION_SCHEMA)
+    write_column_store(species_delta, os.path.join(tmp_path, SPECIES_STORE), SPECIES_SCHEMA)
+    os.rename(tmp_path, os.path.join(root, name))
+    logger.info(f"Appended segment {name} with {len(observations)} observations of {len(keys)} species")
+    return name
+
+
+def read_segment(observations_path: str, name: str, mmap: bool = False) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Observations and species delta of one segment"""
+    path = os.path.join(segments_dir(observations_path), name)
+    return (
+        read_column_store(os.path.join(path, OBSERVATIONS_STORE), mmap=mmap),
+        read_column_store(os.path.join(path, SPECIES_STORE))
+    )
+
+
+def concat_observations(frames: List[pd.DataFrame]) -> pd.DataFrame:
+    """Concatenate observation frames column by column, keeping categoricals encoded"""
+    columns = {}
+    for name in frames[0].columns:
+        parts = [frame[name] for frame in frames if name in frame.columns]
+        if isinstance(parts[0].dtype, pd.CategoricalDtype) and all(
+            isinstance(part.dtype, pd.CategoricalDtype) for part in parts
+        ):
+            # Segments have different categories; a plain concat would decode to strings
+            columns[name] = union_categoricals(parts)
+        else:
+            columns[name] = pd.concat(parts, ignore_index=True)
+    return pd.DataFrame(columns)
+
+
+def apply_species_delta(species: Optional[pd.DataFrame], delta: pd.DataFrame) -> pd.DataFrame:
+    """Species table with a segment's counts added and the species it introduces appended
+
+    Existing rows keep their names; the result is ranked by observationCount
+    like the table ingest writes. Work is proportional to the species table,
+    never to the observations behind it.
+    """
+    if species is None:
+        return delta.sort_values(['observationCount', 'speciesKey'], ascending=[False, True]).reset_index(drop=True)
+
+    added = species['speciesKey'].map(delta.set_index('speciesKey')['observationCount'])
+    new_species = delta[~delta['speciesKey'].isin(species['speciesKey'])]
+    if 'observationCount' in species.columns:
+        species = species.assign(
+            observationCount=(species['observationCount'].fillna(0) + added.fillna(0)).astype('Int64')
+        )
+    else:
+        new_species = new_species.drop(columns=['observationCount'])
+
+    if len(new_species):
+        merged = pd.concat([species, new_species], ignore_index=True)
+        # Differing categories decode to strings on concat; re-encode the small table
+        for name in species.columns:
+            if isinstance(species[name].dtype, pd.CategoricalDtype):
+                merged[name] = merged[name].astype('category')
+        species = merged
+    if 'observationCount' in species.columns:
+        species = species.sort_values(['observationCount', 'speciesKey'], ascending=[False, True], kind='stable')
+    return species.reset_index(drop=True)
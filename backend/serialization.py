@@ -0,0 +1,188 @@
+import pandas as pd
+import numpy as np
+from fastapi.responses import JSONResponse
+from typing import Any, Dict, Iterator, List
+import base64
+import json
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is listed in requirements.txt
+    orjson = None
+
+# Response fields and how each column is converted to JSON-ready values
+OBSERVATION_FIELDS = {
+    "decimalLatitude": "float",
+    "decimalLongitude": "float",
+    "eventDate": "str",
+    "year": "int",
+    "month": "int",
+    "day": "int",
+    "country": "str",
+    "stateProvince": "str",
+    "locality": "str",
+    "basisOfRecord": "str",
+    "individualCount": "int",
+}
+
+SPECIES_FIELDS = {
+    "scientificName": "str",
+    "vernacularName": "str",
+    "speciesKey": "int",
+    "kingdom": "str",
+    "phylum": "str",
+    "class": "str",
+    "order": "str",
+    "family": "str",
+    "genus": "str",
+}
+
+GRID_BIN_FIELDS = {
+    "decimalLatitude": "float",
+    "decimalLongitude": "float",
+    "count": "int",
+}
+
+
+SPECIES_SUMMARY_FIELDS = {
+    "observationCount": "int",
+    "yearMin": "int",
+    "yearMax": "int",
+    "minLatitude": "float",
+    "maxLatitude": "float",
+    "minLongitude": "float",
+    "maxLongitude": "float",
+    "centroidLatitude": "float",
+    "centroidLongitude": "float",
+}
+
+
+def timeline_fields(interval: str = "year", split_by: str = None) -> Dict[str, str]:
+    """Timeline entry fields for a given interval and optional split"""
+    fields = {"year": "int"}
+    if interval == "month":
+        fields["month"] = "int"
+    if split_by:
+        fields[split_by] = "str"
+    fields["count"] = "int"
+    return fields
+
+
+def column_to_list(frame: pd.DataFrame, name: str, kind: str) -> List[Any]:
+    """Convert one column to Python values in bulk, with missing values as None"""
+    if name not in frame.columns:
+        # Absent optional columns keep the empty-string default of the old row.get()
+        return [None if kind != "str" else ""] * len(frame)
+
+    column = frame[name]
+    missing = column.isna().to_numpy()
+
+    if kind == "int":
+        if missing.any():
+            column = column.fillna(0)
+        values = column.to_numpy(dtype=np.int64).tolist()
+    elif kind == "float":
+        values = column.to_numpy(dtype=np.float64)
+        if column.dtype == np.float32:
+            # Drop float32 widening noise (52.1 -> 52.099998...); float32 only
+            # resolves ~0.5 m at these magnitudes, so 5 places (~1 m) is exact enough
+            values = values.round(5)
+        values = values.tolist()
+    else:
+        values = column.tolist()
+
+    # Only the missing positions are touched in Python
+    for i in np.flatnonzero(missing).tolist():
+        values[i] = None
+    return values
+
+
+def frame_to_columns(frame: pd.DataFrame, fields: Dict[str, str]) -> Dict[str, List[Any]]:
+    """Convert a frame to a dict of JSON-ready column lists"""
+    return {name: column_to_list(frame, name, kind) for name, kind in fields.items()}
+
+
+def frame_to_records(frame: pd.DataFrame, fields: Dict[str, str]) -> List[Dict[str, Any]]:
+    """Convert a frame to a list of JSON-ready row dicts without iterrows"""
+    if frame.empty:
+        return []
+    names = list(fields)
+    columns = [column_to_list(frame, name, kind) for name, kind in fields.items()]
+    return [dict(zip(names, row)) for row in zip(*columns)]
+
+
+def _pack(values: np.ndarray) -> str:
+    """Little-endian bytes of an array, base64-encoded for embedding in JSON"""
+    return base64.b64encode(values.astype(values.dtype.newbyteorder("<"), copy=False).tobytes()).decode("ascii")
+
+
+def _smallest_int_dtype(low: int, high: int) -> np.dtype:
+    for dtype in (np.int8, np.int16, np.int32):
+        info = np.iinfo(dtype)
+        if info.min <= low and high <= info.max:
+            return np.dtype(dtype)
+    return np.dtype(np.int64)
+
+
+def column_to_packed(frame: pd.DataFrame, name: str, kind: str) -> Dict[str, Any]:
+    """Encode one column as a typed buffer a browser can view as a TypedArray
+
+    Floats become float32 with NaN for missing values, integers the narrowest
+    signed type that holds them plus a uint8 validity mask if any are
+    missing, and strings a dictionary of distinct values with integer codes
+    (-1 for missing).
+    """
+    if name not in frame.columns:
+        # Same defaults as column_to_list: "" for strings, missing otherwise
+        if kind == "str":
+            return {"type": "dictionary", "values": [""], "codeType": "int8",
+                    "data": _pack(np.zeros(len(frame), dtype=np.int8))}
+        if kind == "float":
+            return {"type": "float32", "data": _pack(np.full(len(frame), np.nan, dtype=np.float32))}
+        return {"type": "int8", "data": _pack(np.zeros(len(frame), dtype=np.int8)),
+                "valid": _pack(np.zeros(len(frame), dtype=np.uint8))}
+
+    column = frame[name]
+    if kind == "float":
+        return {"type": "float32", "data": _pack(column.to_numpy(dtype=np.float32, na_value=np.nan))}
+
+    if kind == "int":
+        missing = column.isna().to_numpy()
+        values = (column.fillna(0) if missing.any() else column).to_numpy(dtype=np.int64)
+        dtype = _smallest_int_dtype(int(values.min()), int(values.max())) if len(values) else np.dtype(np.int8)
+        packed = {"type": dtype.name, "data": _pack(values.astype(dtype))}
+        if missing.any():
+            packed["valid"] = _pack((~missing).astype(np.uint8))
+        return packed
+
+    # Only the values present in this page go into the dictionary
+    codes, uniques = pd.factorize(column)
+    code_dtype = _smallest_int_dtype(-1, len(uniques))
+    return {"type": "dictionary", "values": [str(value) for value in uniques], "codeType": code_dtype.name,
+            "data": _pack(codes.astype(code_dtype))}
+
+
+def frame_to_columnar(frame: pd.DataFrame, fields: Dict[str, str]) -> Dict[str, Dict[str, Any]]:
+    """Convert a frame to packed, dictionary-encoded columns (see column_to_packed)"""
+    return {name: column_to_packed(frame, name, kind) for name, kind in fields.items()}
+
+
+def iter_ndjson(frame: pd.DataFrame, fields: Dict[str, str], batch_size: int = 5000) -> Iterator[bytes]:
+    """Yield a frame as newline-delimited JSON, converting one batch of rows at a time"""
+    for start in range(0, len(frame), batch_size):
+        records = frame_to_records(frame.iloc[start:start + batch_size], fields)
+        yield b"".join(dumps(record) + b"\n" for record in records)
+
+
+def dumps(content: Any) -> bytes:
+    """Encode content to JSON bytes, using orjson when available"""
+    if orjson is not None:
+        return orjson.dumps(content, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """JSON response encoded straight to bytes, skipping FastAPI's jsonable_encoder walk"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
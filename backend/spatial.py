@@ -0,0 +1,200 @@
+import pandas as pd
+import numpy as np
+from typing import Dict, Optional, Tuple
+
+# (min_lon, min_lat, max_lon, max_lat), the usual bbox order
+BBox = Tuple[float, float, float, float]
+
+# Web Mercator is undefined at the poles; clamp like slippy-map tiles do
+MAX_MERCATOR_LATITUDE = 85.05112878
+
+# Grid cells per map tile side: 256px tiles binned into 32px cells
+CELLS_PER_TILE_BITS = 3
+
+
+def parse_bbox(value: Optional[str]) -> Optional[BBox]:
+    """Parse 'min_lon,min_lat,max_lon,max_lat' into floats, raising ValueError if malformed"""
+    if value is None:
+        return None
+    parts = value.split(",")
+    if len(parts) != 4:
+        raise ValueError("bbox must be min_lon,min_lat,max_lon,max_lat")
+    min_lon, min_lat, max_lon, max_lat = (float(part) for part in parts)
+    if not (min_lon <= max_lon and min_lat <= max_lat):
+        raise ValueError("bbox minimums must not exceed maximums")
+    return min_lon, min_lat, max_lon, max_lat
+
+
+def bbox_mask(latitude: np.ndarray, longitude: np.ndarray, bbox: BBox) -> np.ndarray:
+    """Rows whose coordinates fall inside the bbox (edges inclusive)"""
+    min_lon, min_lat, max_lon, max_lat = bbox
+    return (
+        (latitude >= min_lat) & (latitude <= max_lat)
+        & (longitude >= min_lon) & (longitude <= max_lon)
+    )
+
+
+def mercator_cells(latitude: np.ndarray, longitude: np.ndarray, level: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Web Mercator cell column/row of each point on a 2**level x 2**level grid"""
+    size = 1 << level
+    lat = np.radians(np.clip(latitude, -MAX_MERCATOR_LATITUDE, MAX_MERCATOR_LATITUDE))
+    x = (longitude + 180.0) / 360.0
+    y = (1.0 - np.log(np.tan(lat) + 1.0 / np.cos(lat)) / np.pi) / 2.0
+    column = np.clip((x * size).astype(np.int64), 0, size - 1)
+    row = np.clip((y * size).astype(np.int64), 0, size - 1)
+    return column, row
+
+
+def grid_bins(frame: pd.DataFrame, zoom: int, max_bins: int) -> Tuple[pd.DataFrame, int]:
+    """Bin observations into Web Mercator grid cells with counts and centroids
+
+    Cells are a fixed fraction of a map tile at the requested zoom. If that
+    yields more than max_bins cells the grid is coarsened one level at a
+    time, so the payload stays bounded however many points there are.
+    Returns the bins and the grid level actually used.
+    """
+    coordinates = frame[['decimalLatitude', 'decimalLongitude']].dropna()
+    latitude = coordinates['decimalLatitude'].to_numpy(dtype=np.float64)
+    longitude = coordinates['decimalLongitude'].to_numpy(dtype=np.float64)
+
+    # Bin once at the finest level, then merge cells until under max_bins
+    level = zoom + CELLS_PER_TILE_BITS
+    cells, counts, latitude_sum, longitude_sum = point_cells(latitude, longitude, level)
+    return cells_to_bins(cells, counts, latitude_sum, longitude_sum, level, level, max_bins)
+
+
+def point_cells(
+    latitude: np.ndarray, longitude: np.ndarray, level: int, owner: Optional[np.ndarray] = None
+) -> Tuple[np.ndarray, ...]:
+    """Occupied cells at a level with their point counts and coordinate sums
+
+    owner, if given, holds high bits OR-ed into each point's cell id so that
+    points of different owners never share a cell.
+    """
+    column, row = mercator_cells(latitude, longitude, level)
+    cells = (column << level) | row
+    if owner is not None:
+        cells |= owner
+    cells, inverse, counts = np.unique(cells, return_inverse=True, return_counts=True)
+    latitude_sum = np.bincount(inverse, weights=latitude, minlength=len(cells))
+    longitude_sum = np.bincount(inverse, weights=longitude, minlength=len(cells))
+    return cells, counts, latitude_sum, longitude_sum
+
+
+def coarsen_cells(
+    cells: np.ndarray, counts: np.ndarray, latitude_sum: np.ndarray, longitude_sum: np.ndarray,
+    level: int, target_level: int
+) -> Tuple[np.ndarray, ...]:
+    """Merge cells of a level into their enclosing cells at a coarser level"""
+    shift = level - target_level
+    column, row = (cells >> level) >> shift, (cells & ((1 << level) - 1)) >> shift
+    cells, inverse = np.unique((column << target_level) | row, return_inverse=True)
+    counts = np.bincount(inverse, weights=counts).astype(np.int64)
+    return cells, counts, np.bincount(inverse, weights=latitude_sum), np.bincount(inverse, weights=longitude_sum)
+
+
+def cells_to_bins(
+    cells: np.ndarray, counts: np.ndarray, latitude_sum: np.ndarray, longitude_sum: np.ndarray,
+    level: int, target_level: int, max_bins: int
+) -> Tuple[pd.DataFrame, int]:
+    """Bins with centroids at target_level (or coarser, to stay under max_bins)"""
+    if target_level < level:
+        cells, counts, latitude_sum, longitude_sum = coarsen_cells(
+            cells, counts, latitude_sum, longitude_sum, level, target_level
+        )
+        level = target_level
+
+    while len(cells) > max_bins and level > 0:
+        cells, counts, latitude_sum, longitude_sum = coarsen_cells(
+            cells, counts, latitude_sum, longitude_sum, level, level - 1
+        )
+        level -= 1
+
+    bins = pd.DataFrame({
+        'decimalLatitude': latitude_sum / counts,
+        'decimalLongitude': longitude_sum / counts,
+        'count': counts,
+    })
+    return bins, level
+
+
+class SpatialIndex:
+    """Per-species grid index over observation coordinates
+
+    Within each species block (see indexes.SpeciesIndex) rows are ordered by
+    a row-major grid cell key, so the cells a bbox covers form one contiguous
+    key range per grid row and can be found by binary search. Only rows in
+    those ranges are checked against the exact bbox.
+
+    The ordering can be saved with the column store (see
+    dataset.index_arrays) and passed back in as stored, so a memory-mapped
+    store shares it between processes instead of each building its own.
+    """
+
+    CELL_DEGREES = 0.1
+    COLUMNS = int(round(360 / CELL_DEGREES))
+    ROWS = int(round(180 / CELL_DEGREES))
+
+    # Arrays making up the index, as saved with the column store
+    STORED = ('order', 'sorted_keys')
+
+    def __init__(self, species_index, stored: Optional[Dict[str, np.ndarray]] = None):
+        self.species_index = species_index
+        if stored is not None:
+            self.order, self.sorted_keys = stored['order'], stored['sorted_keys']
+            return
+        frame = species_index.frame
+        latitude = frame['decimalLatitude'].to_numpy(dtype=np.float64, na_value=np.nan)
+        longitude = frame['decimalLongitude'].to_numpy(dtype=np.float64, na_value=np.nan)
+
+        # Rows without coordinates get key -1 and never fall in a bbox range
+        keys = self.cell_keys(latitude, longitude)
+        species_keys = frame['speciesKey'].to_numpy()
+        position_dtype = np.int32 if len(frame) < np.iinfo(np.int32).max else np.int64
+        self.order = np.lexsort((keys, species_keys)).astype(position_dtype)
+        self.sorted_keys = keys[self.order]
+
+    def stored(self) -> Dict[str, np.ndarray]:
+        """The STORED arrays by name, to save with the column store"""
+        return {name: getattr(self, name) for name in self.STORED}
+
+    @classmethod
+    def cell_row(cls, latitude):
+        return np.clip(np.floor((np.asarray(latitude) + 90.0) / cls.CELL_DEGREES), 0, cls.ROWS - 1).astype(np.int32)
+
+    @classmethod
+    def cell_column(cls, longitude):
+        return np.clip(np.floor((np.asarray(longitude) + 180.0) / cls.CELL_DEGREES), 0, cls.COLUMNS - 1).astype(np.int32)
+
+    @classmethod
+    def cell_keys(cls, latitude: np.ndarray, longitude: np.ndarray) -> np.ndarray:
+        valid = ~(np.isnan(latitude) | np.isnan(longitude))
+        keys = np.full(len(latitude), -1, dtype=np.int32)
+        keys[valid] = cls.cell_row(latitude[valid]) * cls.COLUMNS + cls.cell_column(longitude[valid])
+        return keys
+
+    def query(self, species_key, bbox: BBox) -> np.ndarray:
+        """Ascending row positions (into the species index frame) of a species inside bbox"""
+        start, end = self.species_index.bounds(species_key)
+        if start == end:
+            return np.empty(0, dtype=np.int64)
+
+        min_lon, min_lat, max_lon, max_lat = bbox
+        rows = np.arange(self.cell_row(min_lat), self.cell_row(max_lat) + 1, dtype=np.int32)
+        first_column, last_column = self.cell_column(min_lon), self.cell_column(max_lon)
+
+        # One contiguous key range per grid row covered by the bbox; needles
+        # match the key dtype so searchsorted doesn't convert the whole block
+        keys = self.sorted_keys[start:end]
+        lows = np.searchsorted(keys, rows * self.COLUMNS + first_column, side='left')
+        highs = np.searchsorted(keys, rows * self.COLUMNS + last_column, side='right')
+        candidates = np.concatenate(
+            [self.order[start + lo:start + hi] for lo, hi in zip(lows.tolist(), highs.tolist()) if hi > lo]
+            or [np.empty(0, dtype=self.order.dtype)]
+        )
+
+        # Cells on the bbox edge may hold points just outside it
+        frame = self.species_index.frame
+        latitude = frame['decimalLatitude'].to_numpy()[candidates]
+        longitude = frame['decimalLongitude'].to_numpy()[candidates]
+        return np.sort(candidates[bbox_mask(latitude, longitude, bbox)])
@@ -0,0 +1,212 @@
+import pandas as pd
+import numpy as np
+from typing import Dict, Iterable, Optional
+import hashlib
+import json
+import os
+import shutil
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Column types used both for typed CSV parsing and for the column store.
+# Nullable integers use pandas extension dtypes so missing values survive narrowing.
+OBSERVATION_SCHEMA = {
+    'speciesKey': 'int32',
+    'decimalLatitude': 'float32',
+    'decimalLongitude': 'float32',
+    'eventDate': 'category',
+    'year': 'Int16',
+    'month': 'Int8',
+    'day': 'Int8',
+    'country': 'category',
+    'stateProvince': 'category',
+    'locality': 'category',
+    'basisOfRecord': 'category',
+    'individualCount': 'Int32',
+}
+
+SPECIES_SCHEMA = {
+    'speciesKey': 'int32',
+    'scientificName': 'category',
+    'vernacularName': 'category',
+    'kingdom': 'category',
+    'phylum': 'category',
+    'class': 'category',
+    'order': 'category',
+    'family': 'category',
+    'genus': 'category',
+    'observationCount': 'Int64',
+}
+
+STORE_SUFFIX = ".store"
+SEGMENTS_SUFFIX = ".segments"
+STORE_FORMAT_VERSION = 1
+
+
+def store_path(base_path: str) -> str:
+    """Column store directory for a dataset path without extension"""
+    return base_path + STORE_SUFFIX
+
+
+def read_csv_typed(csv_file: str, schema: Dict[str, str]) -> pd.DataFrame:
+    """Parse a CSV reading only the schema columns, already in their narrow dtypes"""
+    header = pd.read_csv(csv_file, nrows=0).columns
+    dtypes = {name: dtype for name, dtype in schema.items() if name in header}
+    return pd.read_csv(csv_file, usecols=list(dtypes), dtype=dtypes)
+
+
+def write_column_store(
+    frame: pd.DataFrame, path: str, schema: Dict[str, str], arrays: Optional[Dict[str, np.ndarray]] = None
+) -> None:
+    """Write a frame as one .npy file per column plus a JSON manifest
+
+    String columns are dictionary-encoded (integer codes + categories in the
+    manifest) and nullable integers use the dtype minimum as a null sentinel
+    with the null mask saved alongside, so every column is a flat array that
+    can be loaded or memory-mapped as is. arrays are extra named arrays
+    derived from the rows (e.g. index orderings, see read_store_arrays)
+    stored with them, so they are replaced together.
+    """
+    tmp_path = path + ".tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    columns = {}
+    for name, dtype in schema.items():
+        if name not in frame.columns:
+            continue
+        series = frame[name]
+        file_name = f"{name}.npy"
+
+        if dtype == 'category':
+            series = series.astype('category')
+            values = series.cat.codes.to_numpy()
+            info = {"kind": "category", "categories": series.cat.categories.tolist()}
+        elif dtype[0] == 'I':
+            # Nullable extension ints, e.g. Int16 -> int16 with a sentinel
+            np_dtype = np.dtype(dtype.lower())
+            sentinel = int(np.iinfo(np_dtype).min)
+            series = series.astype(dtype)
+            values = series.to_numpy(dtype=np_dtype, na_value=sentinel)
+            mask_file = f"{name}.mask.npy"
+            np.save(os.path.join(tmp_path, mask_file), series.isna().to_numpy())
+            info = {"kind": "nullable", "null": sentinel, "mask": mask_file}
+        else:
+            values = series.to_numpy(dtype=dtype)
+            info = {"kind": "plain"}
+
+        np.save(os.path.join(tmp_path, file_name), values)
+        columns[name] = {"file": file_name, **info}
+
+    stored = {}
+    for name, values in (arrays or {}).items():
+        file_name = f"array.{name}.npy"
+        np.save(os.path.join(tmp_path, file_name), values)
+        stored[name] = file_name
+
+    meta = {"format": STORE_FORMAT_VERSION, "rows": len(frame), "columns": columns, "arrays": stored}
+    with open(os.path.join(tmp_path, "meta.json"), "w") as f:
+        json.dump(meta, f)
+
+    # Swap the new store in with two renames and only then delete the old
+    # one, so readers never find the path without a complete store for longer
+    # than between the renames
+    old_path = path + ".old"
+    shutil.rmtree(old_path, ignore_errors=True)
+    if os.path.exists(path):
+        os.rename(path, old_path)
+    os.rename(tmp_path, path)
+    shutil.rmtree(old_path, ignore_errors=True)
+
+
+def read_column_store(path: str, mmap: bool = False) -> pd.DataFrame:
+    """Load a column store written by write_column_store
+
+    With mmap=True the columns are read-only memory maps of the .npy files,
+    so processes loading the same store share one copy via the page cache.
+    """
+    mmap_mode = "r" if mmap else None
+    with open(os.path.join(path, "meta.json")) as f:
+        meta = json.load(f)
+    if meta.get("format") != STORE_FORMAT_VERSION:
+        raise ValueError(f"Unsupported column store format in {path}: {meta.get('format')}")
+
+    columns = {}
+    for name, info in meta["columns"].items():
+        values = np.load(os.path.join(path, info["file"]), mmap_mode=mmap_mode)
+        if info["kind"] == "category":
+            columns[name] = pd.Categorical.from_codes(values, categories=pd.Index(info["categories"]))
+        elif info["kind"] == "nullable":
+            if "mask" in info:
+                mask = np.load(os.path.join(path, info["mask"]), mmap_mode=mmap_mode)
+            else:
+                mask = values == info["null"]
+            columns[name] = pd.arrays.IntegerArray(values, mask)
+        else:
+            columns[name] = values
+
+    return pd.DataFrame(columns, copy=False)
+
+
+def read_store_arrays(path: str, mmap: bool = False) -> Dict[str, np.ndarray]:
+    """Extra arrays saved with a column store, memory-mapped like its columns with mmap=True"""
+    mmap_mode = "r" if mmap else None
+    with open(os.path.join(path, "meta.json")) as f:
+        meta = json.load(f)
+    return {
+        name: np.load(os.path.join(path, file_name), mmap_mode=mmap_mode)
+        for name, file_name in meta.get("arrays", {}).items()
+    }
+
+
+def data_fingerprint(base_paths: Iterable[str], segments: bool = True) -> str:
+    """Identify the on-disk data by the size and mtime of the files load_table would read
+
+    Every worker loading the same files computes the same fingerprint, so it
+    can serve as a dataset version shared across processes. Appended
+    segments (see segments.py) count too unless segments=False.
+    """
+    digest = hashlib.sha1()
+    for base_path in base_paths:
+        column_store = store_path(base_path)
+        if os.path.exists(os.path.join(column_store, "meta.json")):
+            files = [os.path.join(column_store, name) for name in sorted(os.listdir(column_store))]
+        else:
+            files = [base_path + ".csv"]
+        segment_root = base_path + SEGMENTS_SUFFIX
+        if segments and os.path.isdir(segment_root):
+            for directory, subdirectories, names in os.walk(segment_root):
+                # Segments still being written are invisible until renamed into place
+                subdirectories[:] = sorted(name for name in subdirectories if not name.endswith(".tmp"))
+                files.extend(os.path.join(directory, name) for name in sorted(names))
+        for file_path in files:
+            if os.path.exists(file_path):
+                stat = os.stat(file_path)
+                digest.update(f"{file_path}:{stat.st_size}:{stat.st_mtime_ns}\n".encode())
+    return digest.hexdigest()[:16]
+
+
+def load_table_arrays(base_path: str, mmap: bool = False) -> Dict[str, np.ndarray]:
+    """Extra arrays saved with a dataset's column store, empty if it has none or is a CSV"""
+    column_store = store_path(base_path)
+    if not os.path.exists(os.path.join(column_store, "meta.json")):
+        return {}
+    return read_store_arrays(column_store, mmap=mmap)
+
+
+def load_table(base_path: str, schema: Dict[str, str], mmap: bool = False) -> Optional[pd.DataFrame]:
+    """Load a dataset from its column store if present, else from its CSV"""
+    column_store = store_path(base_path)
+    if os.path.exists(os.path.join(column_store, "meta.json")):
+        logger.info(f"Loading column store {column_store}{' (memory-mapped)' if mmap else ''}")
+        return read_column_store(column_store, mmap=mmap)
+
+    csv_file = base_path + ".csv"
+    if os.path.exists(csv_file):
+        if mmap:
+            logger.warning(f"No column store for {base_path}, memory mapping disabled")
+        logger.info(f"Loading {csv_file} (run scripts/download_data.py --convert for faster startup)")
+        return read_csv_typed(csv_file, schema)
+
+    return None
@@ -0,0 +1,378 @@
+import pandas as pd
+import numpy as np
+from bisect import bisect_left, bisect_right
+from typing import Dict, List, Optional, Tuple
+
+from indexes import expand_ranges, SpeciesIndex, TimelineCube
+from metrics import record_rows
+from spatial import CELLS_PER_TILE_BITS, cells_to_bins, coarsen_cells, point_cells
+
+# Ranks from the root down; species are the leaves
+RANKS = ['kingdom', 'phylum', 'class', 'order', 'family', 'genus', 'species']
+
+# Label for a rank the species table leaves empty
+UNKNOWN_TAXON = "Unknown"
+
+# Grid level the per-species cells are stored at (zoom 11 map cells);
+# coarser requests merge these, finer ones are capped here
+CELL_LEVEL = 11 + CELLS_PER_TILE_BITS
+
+
+class SpeciesRollup:
+    """Per-species observation counts, year counts and map cells of one set of observations
+
+    Rollups of separately indexed observations (the loaded data and each
+    appended segment) simply add up, so the taxonomy can combine them
+    without going back to observation rows. The year counts and map cells
+    can be passed in as arrays saved with the column store.
+    """
+
+    # Arrays saved with the column store; the rest is cheap to derive
+    STORED = (
+        'year_keys', 'years', 'year_counts',
+        'cells', 'cell_counts', 'cell_latitude_sum', 'cell_longitude_sum', 'cell_offsets'
+    )
+
+    def __init__(
+        self, species_index: SpeciesIndex, timeline_cube: TimelineCube, stored: Optional[Dict[str, np.ndarray]] = None
+    ):
+        # The index frame is sorted by speciesKey, so offsets are in key order
+        self.keys = np.array(list(species_index.offsets), dtype=np.int64)
+        bounds = np.array(list(species_index.offsets.values()), dtype=np.int64).reshape(-1, 2)
+        self.counts = bounds[:, 1] - bounds[:, 0]
+        if stored is not None:
+            for name in self.STORED:
+                setattr(self, name, stored[name])
+            return
+
+        # Counts per species and year, from the timeline cube rather than the rows
+        cells = timeline_cube.index.frame
+        if 'year' in cells.columns:
+            years = cells.groupby(['speciesKey', 'year'], observed=True, sort=True)['count'].sum()
+            self.year_keys = years.index.get_level_values('speciesKey').to_numpy(dtype=np.int64)
+            self.years = years.index.get_level_values('year').to_numpy(dtype=np.int64)
+            self.year_counts = years.to_numpy(dtype=np.int64)
+        else:
+            self.year_keys = self.years = self.year_counts = np.zeros(0, dtype=np.int64)
+
+        # Occupied cells per species, sorted by species then cell; binning
+        # (species, cell) pairs keeps each species' cells apart
+        frame = species_index.frame
+        position = np.repeat(np.arange(len(self.keys), dtype=np.int64), self.counts)
+        latitude = frame['decimalLatitude'].to_numpy(dtype=np.float64, na_value=np.nan)
+        longitude = frame['decimalLongitude'].to_numpy(dtype=np.float64, na_value=np.nan)
+        keep = ~np.isnan(latitude) & ~np.isnan(longitude)
+        cell_bits = 2 * CELL_LEVEL
+        combined, self.cell_counts, self.cell_latitude_sum, self.cell_longitude_sum = point_cells(
+            latitude[keep], longitude[keep], CELL_LEVEL, owner=position[keep] << cell_bits
+        )
+        self.cells = combined & ((1 << cell_bits) - 1)
+        self.cell_offsets = np.searchsorted(combined >> cell_bits, np.arange(len(self.keys) + 1))
+
+    def stored(self) -> Dict[str, np.ndarray]:
+        """The STORED arrays by name, to save with the column store"""
+        return {name: getattr(self, name) for name in self.STORED}
+
+
+class TaxonomyIndex:
+    """Taxonomy tree over the species table with observation rollups at every rank
+
+    Species are ordered by their full lineage, so every taxon owns a
+    contiguous run of species and its children are a contiguous run of node
+    ids. Counts come from prefix sums over that order, year timelines are
+    aggregated per node once at build time, and a taxon's map cells are
+    gathered from the per-species cells of each rollup. Requests never
+    regroup observation rows, and the tree is rebuilt from the rollups alone
+    when segments are appended. Without segments it can instead be loaded
+    from arrays saved with the column store.
+    """
+
+    # Arrays saved with the column store (see stored)
+    STORED = (
+        'species_keys', 'parent', 'start', 'end', 'depth_offsets', 'names', 'name_order',
+        'observation_counts', 'by_depth', 'by_parent', 'timeline_node', 'timeline_year', 'timeline_count'
+    )
+    # Joins node names in the saved byte array; never part of a name
+    NAME_SEPARATOR = "\x00"
+
+    def __init__(
+        self, species: pd.DataFrame, rollups: List[SpeciesRollup], stored: Optional[Dict[str, np.ndarray]] = None
+    ):
+        table = species.drop_duplicates('speciesKey')
+        ranks = [rank for rank in RANKS[:-1] if rank in table.columns]
+        self.ranks = ranks + ['species']
+        keys = table['speciesKey'].to_numpy(dtype=np.int64)
+
+        # A saved tree (see stored) only holds for the species table it was built from
+        built = not (
+            stored is not None
+            and len(stored['depth_offsets']) == len(self.ranks) + 1
+            and np.array_equal(np.sort(keys), np.sort(stored['species_keys']))
+        )
+        if built:
+            coverings = self._build_tree(table, ranks, keys)
+        else:
+            self._load_tree(stored)
+
+        # Observation counts as prefix sums over lineage order; each rollup's
+        # cells are located per species for the grid
+        counts = np.zeros(len(self.species_keys), dtype=np.int64)
+        self._cell_ranges: List[Tuple[SpeciesRollup, np.ndarray, np.ndarray]] = []
+        for rollup in rollups:
+            found = pd.Index(rollup.keys).get_indexer(self.species_keys)
+            present = found >= 0
+            if not present.any():
+                continue
+            counts[present] += rollup.counts[found[present]]
+            cell_starts = np.where(present, rollup.cell_offsets[found], 0)
+            cell_ends = np.where(present, rollup.cell_offsets[found + 1], 0)
+            self._cell_ranges.append((rollup, cell_starts, cell_ends))
+        if not built:
+            return
+
+        count_prefix = np.concatenate(([0], np.cumsum(counts)))
+        self.observation_counts = count_prefix[self.end] - count_prefix[self.start]
+
+        # Node ids ranked most observed first within each depth and within each
+        # parent's children; both groups are contiguous id ranges, so a group
+        # keeps its positions and a request only slices its top entries
+        ids = np.arange(len(self.node_rank))
+        depth = np.repeat(np.arange(len(self.ranks)), np.diff(self._depth_offsets))
+        self._by_depth = np.lexsort((ids, -self.observation_counts, depth))
+        self._by_parent = np.lexsort((ids, -self.observation_counts, self.parent))
+
+        self._build_timelines(rollups, coverings)
+
+    def _build_tree(self, table: pd.DataFrame, ranks: List[str], keys: np.ndarray) -> List[np.ndarray]:
+        """Lay out the nodes from the species table; returns the node covering each species at each depth"""
+        labels = {
+            rank: table[rank].astype(object).where(table[rank].notna(), UNKNOWN_TAXON).astype(str).to_numpy()
+            for rank in ranks
+        }
+        scientific = (
+            table['scientificName'].astype(object).to_numpy() if 'scientificName' in table.columns
+            else np.full(len(table), None, dtype=object)
+        )
+        labels['species'] = np.array([
+            name if isinstance(name, str) else str(key) for name, key in zip(scientific, keys)
+        ], dtype=object)
+
+        # Lineage order: each taxon becomes a contiguous run of species
+        order = np.lexsort([keys] + [labels[rank] for rank in reversed(self.ranks)])
+        self.species_keys = keys[order]
+        labels = {rank: values[order] for rank, values in labels.items()}
+        n = len(self.species_keys)
+
+        # One block of nodes per depth, in lineage order; a node starts
+        # wherever its rank's label or any ancestor's label changes
+        node_ranks, node_names, parents, starts, ends = [], [], [], [], []
+        # Node covering each species at each depth, for the timeline rollup
+        coverings: List[np.ndarray] = []
+        # First node id of each depth, plus the total
+        self._depth_offsets = [0]
+        changed = np.zeros(n, dtype=bool)
+        covering = np.full(n, -1, dtype=np.int64)
+        next_id = 0
+        for rank in self.ranks:
+            values = labels[rank]
+            if rank == 'species':
+                changed = np.ones(n, dtype=bool)
+            elif n:
+                changed = changed | np.concatenate(([True], values[1:] != values[:-1]))
+            block_starts = np.flatnonzero(changed)
+            block_ends = np.append(block_starts[1:], n)
+            ids = np.arange(next_id, next_id + len(block_starts))
+            next_id += len(block_starts)
+
+            node_ranks.extend([rank] * len(block_starts))
+            node_names.append(values[block_starts])
+            parents.append(covering[block_starts])
+            starts.append(block_starts)
+            ends.append(block_ends)
+            covering = np.repeat(ids, block_ends - block_starts)
+            coverings.append(covering)
+            self._depth_offsets.append(next_id)
+
+        self.node_rank: List[str] = node_ranks
+        self.node_name: List[str] = np.concatenate(node_names).tolist() if node_names else []
+        # Parents are non-decreasing across the whole array, so children are a searchsorted range
+        self.parent = np.concatenate(parents) if parents else np.zeros(0, dtype=np.int64)
+        self.start = np.concatenate(starts) if starts else np.zeros(0, dtype=np.int64)
+        self.end = np.concatenate(ends) if ends else np.zeros(0, dtype=np.int64)
+        # Node ids sorted by name, so find() is a binary search
+        self._name_order = np.argsort(np.array(self.node_name, dtype=object), kind='stable')
+        return coverings
+
+    def _load_tree(self, stored: Dict[str, np.ndarray]) -> None:
+        """Take the nodes, rankings and timelines from arrays saved by stored()"""
+        self.species_keys = stored['species_keys']
+        self.parent, self.start, self.end = stored['parent'], stored['start'], stored['end']
+        self._depth_offsets = stored['depth_offsets'].tolist()
+        self.node_rank = np.repeat(np.array(self.ranks, dtype=object), np.diff(self._depth_offsets)).tolist()
+        names = bytes(stored['names']).decode()
+        self.node_name = names.split(self.NAME_SEPARATOR) if len(self.node_rank) else []
+        self._name_order = stored['name_order']
+        self.observation_counts = stored['observation_counts']
+        self._by_depth, self._by_parent = stored['by_depth'], stored['by_parent']
+        self._timeline_node = stored['timeline_node']
+        self._timeline_year = stored['timeline_year']
+        self._timeline_count = stored['timeline_count']
+
+    def stored(self) -> Dict[str, np.ndarray]:
+        """The built tree as flat arrays to save with the column store, names joined into UTF-8 bytes"""
+        return {
+            'species_keys': self.species_keys,
+            'parent': self.parent,
+            'start': self.start,
+            'end': self.end,
+            'depth_offsets': np.array(self._depth_offsets, dtype=np.int64),
+            'names': np.frombuffer(self.NAME_SEPARATOR.join(self.node_name).encode(), dtype=np.uint8),
+            'name_order': self._name_order,
+            'observation_counts': self.observation_counts,
+            'by_depth': self._by_depth,
+            'by_parent': self._by_parent,
+            'timeline_node': self._timeline_node,
+            'timeline_year': self._timeline_year,
+            'timeline_count': self._timeline_count,
+        }
+
+    def _build_timelines(self, rollups: List[SpeciesRollup], coverings: List[np.ndarray]) -> None:
+        """Year counts for every node, stored sorted by node then year"""
+        species_keys = pd.Index(self.species_keys)
+        positions, years, counts = [], [], []
+        for rollup in rollups:
+            position = species_keys.get_indexer(rollup.year_keys)
+            keep = position >= 0
+            positions.append(position[keep])
+            years.append(rollup.years[keep])
+            counts.append(rollup.year_counts[keep])
+        position = np.concatenate(positions) if positions else np.zeros(0, dtype=np.int64)
+        years = np.concatenate(years) if years else np.zeros(0, dtype=np.int64)
+        counts = np.concatenate(counts) if counts else np.zeros(0, dtype=np.int64)
+
+        nodes, node_years, node_counts = [], [], []
+        for covering in coverings:
+            rolled = (
+                pd.DataFrame({'node': covering[position], 'year': years, 'count': counts})
+                .groupby(['node', 'year'], sort=True)['count']
+                .sum()
+            )
+            nodes.append(rolled.index.get_level_values('node').to_numpy())
+            node_years.append(rolled.index.get_level_values('year').to_numpy())
+            node_counts.append(rolled.to_numpy())
+        # Depth blocks have ascending ids, so the concatenation stays sorted by node
+        self._timeline_node = np.concatenate(nodes) if nodes else np.zeros(0, dtype=np.int64)
+        self._timeline_year = np.concatenate(node_years) if nodes else np.zeros(0, dtype=np.int64)
+        self._timeline_count = np.concatenate(node_counts) if nodes else np.zeros(0, dtype=np.int64)
+
+    def __len__(self) -> int:
+        return len(self.node_rank)
+
+    def __contains__(self, node) -> bool:
+        return 0 <= node < len(self.node_rank)
+
+    def _child_range(self, node: int) -> Tuple[int, int]:
+        lo = int(np.searchsorted(self.parent, node, side='left'))
+        hi = int(np.searchsorted(self.parent, node, side='right'))
+        return lo, hi
+
+    def child_count(self, node: int) -> int:
+        lo, hi = self._child_range(node)
+        return hi - lo
+
+    def top_children(self, node: int, limit: int) -> List[int]:
+        """At most limit direct children of a node (-1 for the roots), most observed first"""
+        lo, hi = self._child_range(node)
+        return self._by_parent[lo:min(hi, lo + limit)].tolist()
+
+    def lineage(self, node: int) -> List[int]:
+        """Ancestors of a node from the root down, excluding the node itself"""
+        path = []
+        parent = int(self.parent[node])
+        while parent >= 0:
+            path.append(parent)
+            parent = int(self.parent[parent])
+        return path[::-1]
+
+    def find(self, name: str, rank: Optional[str] = None) -> List[int]:
+        """Nodes with this name, at one rank or any"""
+        lo = bisect_left(self._name_order, name, key=self.node_name.__getitem__)
+        hi = bisect_right(self._name_order, name, lo=lo, key=self.node_name.__getitem__)
+        return sorted(
+            node for node in self._name_order[lo:hi].tolist() if rank is None or self.node_rank[node] == rank
+        )
+
+    def _depth_range(self, rank: str) -> Tuple[int, int]:
+        if rank not in self.ranks:
+            return 0, 0
+        depth = self.ranks.index(rank)
+        return self._depth_offsets[depth], self._depth_offsets[depth + 1]
+
+    def nodes_at(self, rank: str) -> List[int]:
+        """Every node of a rank, in lineage order"""
+        return list(range(*self._depth_range(rank)))
+
+    def count_at(self, rank: str) -> int:
+        lo, hi = self._depth_range(rank)
+        return hi - lo
+
+    def top_at(self, rank: str, limit: int) -> List[int]:
+        """At most limit nodes of a rank, most observed first"""
+        lo, hi = self._depth_range(rank)
+        return self._by_depth[lo:min(hi, lo + limit)].tolist()
+
+    def top(self, nodes: List[int], limit: int) -> List[int]:
+        """At most limit of the given nodes, most observed first"""
+        nodes = np.asarray(nodes, dtype=np.int64)
+        ranked = nodes[np.lexsort((nodes, -self.observation_counts[nodes]))]
+        return ranked[:limit].tolist()
+
+    def observation_count(self, node: int) -> int:
+        return int(self.observation_counts[node])
+
+    def summary(self, node: int) -> dict:
+        """JSON-ready description of a node"""
+        rank = self.node_rank[node]
+        parent = int(self.parent[node])
+        summary = {
+            "id": node,
+            "rank": rank,
+            "name": self.node_name[node],
+            "parentId": parent if parent >= 0 else None,
+            "speciesCount": int(self.end[node] - self.start[node]),
+            "observationCount": self.observation_count(node),
+        }
+        if rank == 'species':
+            summary["speciesKey"] = int(self.species_keys[self.start[node]])
+        else:
+            summary["childCount"] = self.child_count(node)
+        return summary
+
+    def timeline(self, node: int) -> pd.DataFrame:
+        """Precomputed observation counts per year under a node"""
+        lo = int(np.searchsorted(self._timeline_node, node, side='left'))
+        hi = int(np.searchsorted(self._timeline_node, node, side='right'))
+        record_rows(scanned=hi - lo)
+        return pd.DataFrame({'year': self._timeline_year[lo:hi], 'count': self._timeline_count[lo:hi]})
+
+    def grid(self, node: int, zoom: int, max_bins: int) -> Tuple[pd.DataFrame, int]:
+        """Map bins under a node, merged from the stored per-species cells"""
+        start, end = self.start[node], self.end[node]
+        parts = []
+        for rollup, cell_starts, cell_ends in self._cell_ranges:
+            positions = expand_ranges(cell_starts[start:end], cell_ends[start:end])
+            parts.append((
+                rollup.cells[positions], rollup.cell_counts[positions],
+                rollup.cell_latitude_sum[positions], rollup.cell_longitude_sum[positions]
+            ))
+        if not parts:
+            parts.append((np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0), np.zeros(0)))
+        cells, counts, latitude_sum, longitude_sum = (np.concatenate(arrays) for arrays in zip(*parts))
+        record_rows(scanned=len(cells))
+
+        # Species overlap, so cells are merged even when no coarsening is needed
+        level = min(zoom + CELLS_PER_TILE_BITS, CELL_LEVEL)
+        cells, counts, latitude_sum, longitude_sum = coarsen_cells(
+            cells, counts, latitude_sum, longitude_sum, CELL_LEVEL, level
+        )
+        return cells_to_bins(cells, counts, latitude_sum, longitude_sum, level, level, max_bins)
@@ -5,11 +5,26 @@ from fastapi.testclient import TestClient
 from unittest.mock import patch, MagicMock
 import sys
 import os
+import asyncio
+import base64
+import json
+import threading
+import time
 
 # Add the backend directory to the path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from main import app
+from cache import CachedResponse, ResponseCache
+from coalesce import LatestRequests, SingleFlight
+from compress import negotiate
+from executor import QueryExecutor, QueryQueueFull
+from filters import ObservationFilter, YearIndex
+from indexes import DashboardStats, SearchIndex, SpeciesIndex, TimelineCube
+from serialization import frame_to_columnar, frame_to_records, OBSERVATION_FIELDS
+from spatial import SpatialIndex
+from storage import read_column_store, write_column_store, OBSERVATION_SCHEMA, SPECIES_SCHEMA
+from taxonomy import TaxonomyIndex
 
 client = TestClient(app)
 
@@ -86,10 +101,15 @@ class TestSpeciesSearch:
 
     def test_search_species_limit(self, mock_data):
         """Test search with limit parameter"""
-        response = client.get("/api/species/search?query=a&limit=2")
+        response = client.get("/api/species/search?query=us&limit=1")
         assert response.status_code == 200
         data = response.json()
-        assert len(data["species"]) <= 2
+        assert len(data["species"]) == 1
+
+    def test_search_species_query_too_short(self, mock_data):
+        """Test that single-character queries are rejected like the search bar does"""
+        response = client.get("/api/species/search?query=a")
+        assert response.status_code == 422
 
     def test_search_species_missing_data(self):
         """Test search when data is not loaded"""
@@ -113,6 +133,57 @@ class TestSpeciesObservations:
         assert "decimalLongitude" in obs
         assert "eventDate" in obs
 
+    def test_get_observations_bbox(self, mock_data):
+        """Test viewport filtering through the spatial index"""
+        response = client.get("/api/species/2/observations?bbox=19.25,52.25,19.5,52.5")
+        assert response.status_code == 200
+        data = response.json()
+        assert data["count"] == 1
+        assert data["observations"][0]["decimalLatitude"] == 52.3
+
+    def test_get_observations_year_range(self, mock_data):
+        """Test inclusive year bounds"""
+        assert client.get("/api/species/1/observations?year_from=2020&year_to=2020").json()["count"] == 2
+        assert client.get("/api/species/1/observations?year_from=2021").json()["count"] == 0
+
+    def test_get_observations_invalid_bbox(self, mock_data):
+        """Test that malformed viewports are rejected"""
+        response = client.get("/api/species/1/observations?bbox=20,50,19,52")
+        assert response.status_code == 422
+
+    def test_get_observations_pagination(self, mock_data):
+        """Test walking all pages with the returned cursor"""
+        first = client.get("/api/species/1/observations?limit=1").json()
+        assert first["count"] == 1
+        assert first["total"] == 2
+        assert first["nextCursor"] is not None
+
+        second = client.get(f"/api/species/1/observations?limit=1&cursor={first['nextCursor']}").json()
+        assert second["count"] == 1
+        assert second["nextCursor"] is None
+        assert first["observations"][0]["eventDate"] != second["observations"][0]["eventDate"]
+
+    def test_get_observations_stale_cursor(self, mock_data):
+        """Test that a cursor issued before the data changed is answered 409"""
+        first = client.get("/api/species/1/observations?limit=1").json()
+        with patch('main.observations_data', sample_observations_data.copy()):
+            response = client.get(f"/api/species/1/observations?limit=1&cursor={first['nextCursor']}")
+            assert response.status_code == 409
+
+    def test_get_observations_invalid_cursor(self, mock_data):
+        """Test that cursors we did not issue are rejected"""
+        response = client.get("/api/species/1/observations?cursor=not-a-cursor")
+        assert response.status_code == 422
+
+    def test_get_observations_ndjson_stream(self, mock_data):
+        """Test the streaming NDJSON format"""
+        response = client.get("/api/species/2/observations?format=ndjson")
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        assert response.headers["x-total-count"] == "2"
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        assert [obs["decimalLatitude"] for obs in lines] == [52.2, 52.3]
+
     def test_get_observations_no_data(self, mock_data):
         """Test retrieval for species with no observations"""
         response = client.get("/api/species/999/observations")
@@ -127,6 +198,127 @@ class TestSpeciesObservations:
             response = client.get("/api/species/1/observations")
             assert response.status_code == 500
 
+class TestSpeciesBatch:
+    def test_batch_in_request_order(self, mock_data):
+        """Test summaries and timelines for several species in one request"""
+        response = client.get("/api/species/batch?keys=3,1,99,1")
+        assert response.status_code == 200
+        data = response.json()
+        assert [species["speciesKey"] for species in data["species"]] == [3, 1, 99]
+
+        cat, human, unknown = data["species"]
+        assert human["vernacularName"] == "Human"
+        assert human["observationCount"] == 2
+        assert human["extent"] == {"minLatitude": 52.0, "maxLatitude": 52.1, "minLongitude": 19.0, "maxLongitude": 19.1}
+        assert human["centroid"]["decimalLatitude"] == pytest.approx(52.05)
+        assert human["timeline"] == [{"year": 2020, "count": 2}]
+        assert cat["yearRange"] == {"min": 2020, "max": 2020}
+        assert unknown["observationCount"] == 0
+        assert unknown["timeline"] == []
+
+    def test_float32_coordinates_serialize_like_observations(self):
+        """Test that extents and centroids of float32 coordinates carry no widening noise"""
+        observations = sample_observations_data.astype({'decimalLatitude': 'float32', 'decimalLongitude': 'float32'})
+        with patch('main.species_data', sample_species_data), patch('main.observations_data', observations):
+            human = client.get("/api/species/batch?keys=1").json()["species"][0]
+            points = client.get("/api/species/1/observations").json()["observations"]
+        assert human["extent"] == {
+            "minLatitude": min(point["decimalLatitude"] for point in points),
+            "maxLatitude": max(point["decimalLatitude"] for point in points),
+            "minLongitude": min(point["decimalLongitude"] for point in points),
+            "maxLongitude": max(point["decimalLongitude"] for point in points),
+        }
+        assert human["extent"]["maxLatitude"] == 52.1
+        assert human["centroid"] == {"decimalLatitude": 52.05, "decimalLongitude": 19.05}
+
+    def test_monthly_timelines(self, mock_data):
+        """Test that the batch timeline honours the interval"""
+        data = client.get("/api/species/batch?keys=2&interval=month").json()
+        assert data["species"][0]["timeline"] == [
+            {"year": 2020, "month": 3, "count": 1}, {"year": 2020, "month": 4, "count": 1}
+        ]
+
+    def test_invalid_keys(self, mock_data):
+        """Test that malformed or oversized key lists are rejected"""
+        assert client.get("/api/species/batch?keys=wolf").status_code == 422
+        assert client.get("/api/species/batch?keys=" + ",".join(map(str, range(101)))).status_code == 422
+
+class TestTaxonomy:
+    def test_browse_tree(self, mock_data):
+        """Test walking from the kingdoms down to a family with rolled-up counts"""
+        data = client.get("/api/taxonomy").json()
+        assert [taxon["name"] for taxon in data["taxa"]] == ["Animalia"]
+        assert data["taxa"][0]["observationCount"] == 5
+        assert data["taxa"][0]["speciesCount"] == 3
+
+        canidae = client.get("/api/taxonomy?rank=family&name=Canidae").json()["taxa"][0]
+        taxon = client.get(f"/api/taxonomy/{canidae['id']}").json()
+        assert [node["name"] for node in taxon["lineage"]] == ["Animalia", "Chordata", "Mammalia", "Carnivora"]
+        assert [child["name"] for child in taxon["children"]] == ["Canis"]
+        assert taxon["observationCount"] == 2
+
+        order = client.get("/api/taxonomy?rank=order").json()
+        assert [(taxon["name"], taxon["observationCount"]) for taxon in order["taxa"]] == [
+            ("Carnivora", 3), ("Primates", 2)
+        ]
+
+    def test_limit_keeps_most_observed(self, mock_data):
+        """Test that a limit returns the most observed taxa while counting them all"""
+        species = client.get("/api/taxonomy?rank=species").json()
+        counts = [taxon["observationCount"] for taxon in species["taxa"]]
+        assert counts == sorted(counts, reverse=True)
+
+        top = client.get("/api/taxonomy?rank=species&limit=1").json()
+        assert top["count"] == species["count"] == 3
+        assert top["taxa"] == species["taxa"][:1]
+
+        mammalia = client.get("/api/taxonomy?rank=class&name=Mammalia").json()["taxa"][0]
+        taxon = client.get(f"/api/taxonomy/{mammalia['id']}?limit=1").json()
+        assert taxon["childCount"] == 2
+        assert [child["name"] for child in taxon["children"]] == ["Carnivora"]
+
+    def test_timeline_and_grid(self, mock_data):
+        """Test that taxon timelines and bins cover every species below the taxon"""
+        carnivora = client.get("/api/taxonomy?rank=order&name=Carnivora").json()["taxa"][0]["id"]
+        timeline = client.get(f"/api/taxonomy/{carnivora}/timeline").json()
+        assert timeline["timeline"] == [{"year": 2020, "count": 3}]
+
+        grid = client.get(f"/api/taxonomy/{carnivora}/grid?zoom=4").json()
+        assert grid["count"] == 3
+        assert grid["bins"][0]["decimalLatitude"] == pytest.approx(52.3)
+
+    def test_unknown_taxon(self, mock_data):
+        """Test that an unknown taxon id is a 404"""
+        assert client.get("/api/taxonomy/999").status_code == 404
+        assert client.get("/api/taxonomy/999/timeline").status_code == 404
+
+class TestObservationGrid:
+    def test_grid_bins_counts_and_centroids(self, mock_data):
+        """Test that nearby observations share a bin with their centroid"""
+        response = client.get("/api/species/1/observations/grid?zoom=4")
+        assert response.status_code == 200
+        data = response.json()
+        assert data["count"] == 2
+        assert len(data["bins"]) == 1
+        assert data["bins"][0]["count"] == 2
+        assert data["bins"][0]["decimalLatitude"] == pytest.approx(52.05)
+        assert data["bins"][0]["decimalLongitude"] == pytest.approx(19.05)
+
+    def test_grid_respects_max_bins(self, mock_data):
+        """Test that the grid is coarsened to stay within max_bins"""
+        fine = client.get("/api/species/1/observations/grid?zoom=14").json()
+        assert len(fine["bins"]) == 2
+        coarse = client.get("/api/species/1/observations/grid?zoom=14&max_bins=1").json()
+        assert len(coarse["bins"]) == 1
+        assert coarse["level"] < fine["level"]
+
+    def test_grid_bbox_filter(self, mock_data):
+        """Test that only observations inside the bbox are binned"""
+        response = client.get("/api/species/1/observations/grid?bbox=18.9,51.9,19.05,52.05")
+        assert response.json()["count"] == 1
+        response = client.get("/api/species/1/observations/grid?bbox=19,52,oops")
+        assert response.status_code == 422
+
 class TestSpeciesTimeline:
     def test_get_timeline_success(self, mock_data):
         """Test successful retrieval of species timeline"""
@@ -138,6 +330,28 @@ class TestSpeciesTimeline:
         assert data["timeline"][0]["year"] == 2020
         assert data["timeline"][0]["count"] == 2
 
+    def test_get_timeline_monthly(self, mock_data):
+        """Test monthly timeline from the timeline cube"""
+        response = client.get("/api/species/1/timeline?interval=month")
+        assert response.status_code == 200
+        assert response.json()["timeline"] == [
+            {"year": 2020, "month": 1, "count": 1},
+            {"year": 2020, "month": 2, "count": 1}
+        ]
+
+    def test_get_timeline_split_by_basis(self, mock_data):
+        """Test yearly timeline split by basis of record"""
+        response = client.get("/api/species/2/timeline?split_by=basisOfRecord")
+        assert response.status_code == 200
+        data = response.json()
+        assert data["splitBy"] == "basisOfRecord"
+        assert data["timeline"] == [{"year": 2020, "basisOfRecord": "HUMAN_OBSERVATION", "count": 2}]
+
+    def test_get_timeline_invalid_interval(self, mock_data):
+        """Test that unknown intervals are rejected"""
+        response = client.get("/api/species/1/timeline?interval=week")
+        assert response.status_code == 422
+
     def test_get_timeline_no_data(self, mock_data):
         """Test retrieval for species with no timeline data"""
         response = client.get("/api/species/999/timeline")
@@ -151,6 +365,39 @@ class TestSpeciesTimeline:
             response = client.get("/api/species/1/timeline")
             assert response.status_code == 500
 
+class TestObservationFilters:
+    def test_observations_filtered_by_month_and_basis(self, mock_data):
+        """Test month and categorical filters on observations"""
+        assert client.get("/api/species/1/observations?month=2").json()["count"] == 1
+        assert client.get("/api/species/1/observations?basis_of_record=HUMAN_OBSERVATION").json()["count"] == 2
+        assert client.get("/api/species/1/observations?state_province=Silesia").json()["count"] == 0
+        assert client.get("/api/species/1/observations?month=13").status_code == 422
+
+    def test_timeline_filtered(self, mock_data):
+        """Test timeline filters applied to the timeline cube"""
+        response = client.get("/api/species/2/timeline?interval=month&year_from=2020&month=4")
+        assert response.json()["timeline"] == [{"year": 2020, "month": 4, "count": 1}]
+        assert client.get("/api/species/2/timeline?year_to=2019").json()["timeline"] == []
+
+    def test_year_index_matches_linear_filter(self):
+        """Test that year index queries agree with a brute-force filter"""
+        rng = np.random.default_rng(0)
+        years = pd.array(rng.integers(2000, 2024, 500), dtype='Int16')
+        years[::7] = pd.NA
+        observations = pd.DataFrame({
+            'speciesKey': np.sort(rng.integers(1, 4, 500)),
+            'year': years
+        })
+        index = YearIndex(SpeciesIndex(observations))
+        for species_key in (1, 2, 3):
+            in_range = observations['year'].between(2005, 2010).fillna(False)
+            expected = observations.index[(observations['speciesKey'] == species_key) & in_range].tolist()
+            assert index.query(species_key, ObservationFilter(2005, 2010)).tolist() == expected
+            expected = observations.index[
+                (observations['speciesKey'] == species_key) & observations['year'].notna()
+            ].tolist()
+            assert index.query(species_key, ObservationFilter(year_from=1900)).tolist() == expected
+
 class TestDashboardStats:
     def test_get_dashboard_stats_success(self, mock_data):
         """Test successful retrieval of dashboard stats"""
@@ -164,12 +411,656 @@ class TestDashboardStats:
         assert data["totalSpecies"] == 3
         assert data["totalObservations"] == 5
 
+    def test_top_species_and_year_range(self, mock_data):
+        """Test the precomputed top species ranking and year range"""
+        data = client.get("/api/dashboard/stats").json()
+        assert [s["speciesKey"] for s in data["topSpecies"]] == [1, 2, 3]
+        assert data["topSpecies"][0]["scientificName"] == "Homo sapiens"
+        assert data["topSpecies"][0]["observationCount"] == 2
+        assert data["yearRange"] == {"min": 2020, "max": 2020}
+
+    def test_incremental_update(self):
+        """Test that appended observations update the aggregates from the delta only"""
+        stats = DashboardStats(sample_species_data, sample_observations_data, SpeciesIndex(sample_observations_data))
+        delta = sample_observations_data.iloc[[4, 4]].assign(year=[2021, 2019])
+        stats.update(delta)
+        assert stats.response["totalObservations"] == 7
+        assert stats.response["topSpecies"][0] == {
+            "speciesKey": 3, "scientificName": "Felis catus", "vernacularName": "Cat", "observationCount": 3
+        }
+        assert stats.response["yearRange"] == {"min": 2019, "max": 2021}
+
     def test_get_dashboard_stats_missing_data(self):
         """Test retrieval when data is not loaded"""
         with patch('main.species_data', None):
             response = client.get("/api/dashboard/stats")
             assert response.status_code == 500
 
+class TestSpeciesIndex:
+    def test_lookup_unsorted_observations(self):
+        """Test that species slices are correct when observations arrive unsorted"""
+        shuffled = sample_observations_data.iloc[[4, 0, 2, 1, 3]].reset_index(drop=True)
+        index = SpeciesIndex(shuffled)
+        assert len(index) == 3
+        assert list(index.lookup(1)['speciesKey']) == [1, 1]
+        assert list(index.lookup(2)['decimalLatitude']) == [52.2, 52.3]
+        assert index.lookup(999).empty
+
+    def test_index_follows_data_reload(self, mock_data):
+        """Test that replacing the observations frame rebuilds the index"""
+        response = client.get("/api/species/3/observations")
+        assert response.json()["count"] == 1
+
+        reloaded = pd.concat([sample_observations_data, sample_observations_data.iloc[[4]]])
+        with patch('main.observations_data', reloaded):
+            response = client.get("/api/species/3/observations")
+            assert response.json()["count"] == 2
+
+class TestSearchIndex:
+    def test_prefix_hits_rank_first(self):
+        """Test that word-prefix matches come before plain substring matches"""
+        species = pd.DataFrame({
+            'scientificName': ['Ursus arctos', 'Sus scrofa', 'Felis catus'],
+            'vernacularName': ['Brown Bear', 'Wild Boar', 'Cat']
+        })
+        index = SearchIndex(species)
+        assert index.search("sus", 10) == [1, 0]
+        assert index.search("sus", 1) == [1]
+        assert index.search("bo", 10) == [1]
+
+    def test_normalized_substring_match(self):
+        """Test case and diacritic insensitive matching inside words"""
+        species = pd.DataFrame({
+            'scientificName': ['Bison bonasus', 'Canis lupus'],
+            'vernacularName': ['Żubr', None]
+        })
+        index = SearchIndex(species)
+        assert index.search("ZUBR", 10) == [0]
+        assert index.search("nasu", 10) == [0]
+        assert index.search("is lu", 10) == [1]
+        assert index.search("xyz", 10) == []
+
+class TestSpatialIndex:
+    def test_query_matches_linear_filter(self):
+        """Test that bbox queries agree with a brute-force filter"""
+        rng = np.random.default_rng(0)
+        observations = pd.DataFrame({
+            'speciesKey': np.sort(rng.integers(1, 4, 500)),
+            'decimalLatitude': rng.uniform(49.0, 54.8, 500),
+            'decimalLongitude': rng.uniform(14.0, 24.2, 500)
+        })
+        index = SpatialIndex(SpeciesIndex(observations))
+        bbox = (16.03, 50.51, 19.97, 52.49)
+        for species_key in (1, 2, 3):
+            expected = observations.index[
+                (observations['speciesKey'] == species_key)
+                & observations['decimalLatitude'].between(50.51, 52.49)
+                & observations['decimalLongitude'].between(16.03, 19.97)
+            ].tolist()
+            assert index.query(species_key, bbox).tolist() == expected
+
+    def test_saved_index_is_memory_mapped(self, tmp_path):
+        """Test that indexes saved with the column store are mapped from it and answer like built ones"""
+        from dataset import index_arrays, load_dataset
+        write_column_store(sample_species_data, str(tmp_path / "species.store"), SPECIES_SCHEMA)
+        observations = sample_observations_data.sort_values('speciesKey', kind='stable').reset_index(drop=True)
+        write_column_store(
+            observations, str(tmp_path / "observations.store"), OBSERVATION_SCHEMA,
+            index_arrays(observations, sample_species_data)
+        )
+
+        dataset = load_dataset(str(tmp_path / "species"), str(tmp_path / "observations"), mmap=True)
+        assert not dataset.spatial_index.order.flags.writeable
+        built = SpatialIndex(dataset.species_index)
+        bbox = (18.0, 51.0, 22.0, 53.0)
+        for species_key in (1, 2, 3):
+            assert dataset.spatial_index.query(species_key, bbox).tolist() == built.query(species_key, bbox).tolist()
+
+        assert not dataset.year_index.order.flags.writeable
+        built = YearIndex(dataset.species_index)
+        filters = ObservationFilter(year_from=2020, year_to=2020)
+        for species_key in (1, 2, 3):
+            assert dataset.year_index.query(species_key, filters).tolist() == built.query(species_key, filters).tolist()
+
+        assert not dataset.timeline_cube.index.frame['count'].to_numpy().flags.writeable
+        built = TimelineCube(dataset.observations)
+        for species_key in (1, 2, 3):
+            for split_by in (None, 'basisOfRecord'):
+                pd.testing.assert_frame_equal(
+                    dataset.timeline_cube.timeline(species_key, split_by=split_by),
+                    built.timeline(species_key, split_by=split_by)
+                )
+
+        assert not dataset.species_rollup.cells.flags.writeable
+        taxonomy = dataset.taxonomy_index
+        assert not taxonomy.observation_counts.flags.writeable
+        built = TaxonomyIndex(dataset.species, [dataset.species_rollup])
+        assert taxonomy.node_name == built.node_name
+        assert taxonomy.node_rank == built.node_rank
+        assert taxonomy.top_at('species', 10) == built.top_at('species', 10)
+        carnivora = taxonomy.find("Carnivora", "order")[0]
+        assert carnivora == built.find("Carnivora", "order")[0]
+        assert taxonomy.observation_count(carnivora) == 3
+        pd.testing.assert_frame_equal(taxonomy.timeline(carnivora), built.timeline(carnivora))
+        assert taxonomy.grid(carnivora, 4, 100)[0]['count'].sum() == 3
+
+class TestSerialization:
+    def test_missing_values_become_null(self):
+        """Test that NaN cells serialize as None and ints stay ints"""
+        frame = sample_observations_data.head(2).copy()
+        frame['individualCount'] = [np.nan, 3.0]
+        frame['eventDate'] = [None, '2020-02-01']
+        records = frame_to_records(frame, OBSERVATION_FIELDS)
+        assert records[0]['individualCount'] is None
+        assert records[0]['eventDate'] is None
+        assert records[1]['individualCount'] == 3
+        assert isinstance(records[1]['individualCount'], int)
+        assert records[1]['decimalLatitude'] == 52.1
+
+    def test_absent_optional_columns(self):
+        """Test that absent text columns default to empty strings"""
+        frame = sample_observations_data.drop(columns=['locality']).head(1)
+        records = frame_to_records(frame, OBSERVATION_FIELDS)
+        assert records[0]['locality'] == ''
+
+def decode_packed(column):
+    """Decode one column of the columnar format back to Python values"""
+    if column["type"] == "dictionary":
+        codes = np.frombuffer(base64.b64decode(column["data"]), column["codeType"])
+        return [column["values"][code] if code >= 0 else None for code in codes.tolist()]
+    values = np.frombuffer(base64.b64decode(column["data"]), "<" + np.dtype(column["type"]).str[1:]).tolist()
+    if "valid" in column:
+        valid = np.frombuffer(base64.b64decode(column["valid"]), np.uint8)
+        values = [value if flag else None for value, flag in zip(values, valid.tolist())]
+    return values
+
+class TestColumnarFormat:
+    def test_round_trip(self):
+        """Test that packed columns decode to the same values as the row format"""
+        frame = sample_observations_data.copy()
+        frame['individualCount'] = pd.array([1, None, 300, 1, 1], dtype='Int32')
+        frame.loc[2, 'stateProvince'] = None
+        columns = frame_to_columnar(frame, OBSERVATION_FIELDS)
+        records = frame_to_records(frame, OBSERVATION_FIELDS)
+
+        assert columns["individualCount"]["type"] == "int16"
+        assert columns["country"]["values"] == ["Poland"]
+        for name in ["eventDate", "year", "stateProvince", "individualCount"]:
+            assert decode_packed(columns[name]) == [record[name] for record in records]
+        assert np.allclose(decode_packed(columns["decimalLatitude"]), [r["decimalLatitude"] for r in records])
+
+    def test_endpoint(self, mock_data):
+        """Test format=columnar paging on the observations endpoint"""
+        response = client.get("/api/species/1/observations?format=columnar&limit=1")
+        assert response.status_code == 200
+        data = response.json()
+        assert data["count"] == 1
+        assert data["total"] == 2
+        assert data["nextCursor"] is not None
+        assert decode_packed(data["columns"]["month"]) == [1]
+
+class TestColumnStore:
+    def test_round_trip(self, tmp_path):
+        """Test that the column store preserves values, nulls and narrow dtypes"""
+        frame = sample_observations_data.copy()
+        frame['individualCount'] = [1, None, 3, None, 5]
+        frame['stateProvince'] = ['Mazovia', None, 'Silesia', 'Mazovia', 'Silesia']
+        path = str(tmp_path / "observations.store")
+        write_column_store(frame, path, OBSERVATION_SCHEMA)
+
+        loaded = read_column_store(path)
+        assert loaded['speciesKey'].dtype == np.int32
+        assert loaded['decimalLatitude'].dtype == np.float32
+        assert str(loaded['year'].dtype) == 'Int16'
+        assert loaded['basisOfRecord'].dtype == 'category'
+        assert loaded['individualCount'].isna().tolist() == [False, True, False, True, False]
+        assert loaded['stateProvince'].isna().sum() == 1
+        assert frame_to_records(loaded, OBSERVATION_FIELDS) == frame_to_records(frame, OBSERVATION_FIELDS)
+
+    def test_memory_mapped_load(self, tmp_path):
+        """Test that mmap loading serves the same rows straight from the files"""
+        path = str(tmp_path / "observations.store")
+        write_column_store(sample_observations_data, path, OBSERVATION_SCHEMA)
+
+        mapped = read_column_store(path, mmap=True)
+        # Read-only arrays means the columns are the mapped files, not copies
+        assert not mapped['decimalLatitude'].to_numpy().flags.writeable
+        assert len(SpeciesIndex(mapped).lookup(2)) == 2
+        assert frame_to_records(mapped, OBSERVATION_FIELDS) == frame_to_records(read_column_store(path), OBSERVATION_FIELDS)
+
+    def test_rewrite_keeps_a_store_on_disk(self, tmp_path):
+        """Test that replacing a store never deletes anything while the path has no store"""
+        import shutil
+        import storage
+        path = str(tmp_path / "observations.store")
+        write_column_store(sample_observations_data, path, OBSERVATION_SCHEMA)
+        mapped = read_column_store(path, mmap=True)
+
+        deleted = []
+        real_rmtree = shutil.rmtree
+        def rmtree(target, *args, **kwargs):
+            real_rmtree(target, *args, **kwargs)
+            deleted.append(os.path.exists(os.path.join(path, "meta.json")))
+        with patch.object(storage.shutil, 'rmtree', rmtree):
+            write_column_store(sample_observations_data.head(2), path, OBSERVATION_SCHEMA)
+
+        assert deleted and all(deleted)
+        assert sorted(os.listdir(tmp_path)) == ["observations.store"]
+        assert len(read_column_store(path)) == 2
+        # Frames mapped from the replaced store stay readable
+        assert len(mapped) == len(sample_observations_data)
+        assert mapped['decimalLatitude'].sum() == pytest.approx(sample_observations_data['decimalLatitude'].sum())
+
+class TestResponseCache:
+    def test_repeat_request_served_from_cache(self, mock_data):
+        """Test that identical requests hit the cache regardless of parameter order"""
+        first = client.get("/api/species/1/observations?year_from=2020&limit=5")
+        hits = client.get("/cache/stats").json()["hits"]
+        second = client.get("/api/species/1/observations?limit=5&year_from=2020")
+        assert client.get("/cache/stats").json()["hits"] == hits + 1
+        assert second.content == first.content
+        assert second.headers["content-type"] == "application/json"
+        assert second.headers["etag"] == first.headers["etag"]
+
+    def test_compressed_requests_count_once(self, mock_data):
+        """Test that each request counts one hit or miss, whether or not its body is stored compressed"""
+        headers = {"Accept-Encoding": "gzip"}
+        client.get("/api/species/2/timeline?interval=year", headers=headers)
+        before = client.get("/cache/stats").json()
+        for _ in range(10):
+            client.get("/api/species/2/timeline?interval=year", headers=headers)
+        after = client.get("/cache/stats").json()
+        assert after["hits"] - before["hits"] == 10
+        assert after["misses"] == before["misses"]
+
+        with patch('main.COMPRESS_MIN_BYTES', 0):
+            client.get("/api/species/2/timeline?interval=month", headers=headers)
+            before = client.get("/cache/stats").json()
+            for _ in range(10):
+                response = client.get("/api/species/2/timeline?interval=month", headers=headers)
+            assert response.headers["content-encoding"] == "gzip"
+        after = client.get("/cache/stats").json()
+        assert after["hits"] - before["hits"] == 10
+        assert after["misses"] == before["misses"]
+
+    def test_if_none_match_returns_304(self, mock_data):
+        """Test conditional requests against the dataset-derived ETag"""
+        etag = client.get("/api/species/1/timeline").headers["etag"]
+        response = client.get("/api/species/1/timeline", headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        assert response.headers["etag"] == etag
+
+    def test_reload_changes_etag(self, mock_data):
+        """Test that replacing the data invalidates cached responses"""
+        before = client.get("/api/species/3/observations")
+        reloaded = pd.concat([sample_observations_data, sample_observations_data.iloc[[4]]])
+        with patch('main.observations_data', reloaded):
+            response = client.get("/api/species/3/observations", headers={"If-None-Match": before.headers["etag"]})
+            assert response.status_code == 200
+            assert response.json()["count"] == 2
+
+    def test_lru_eviction_by_size(self):
+        """Test that least recently used entries are evicted past the byte budget"""
+        cache = ResponseCache(max_bytes=10, max_entry_bytes=8)
+        cache.put("a", CachedResponse(b"aaaa", "application/json"))
+        cache.put("b", CachedResponse(b"bbbb", "application/json"))
+        assert cache.get("a") is not None
+        cache.put("c", CachedResponse(b"cccc", "application/json"))
+        assert cache.get("b") is None
+        assert cache.get("a") is not None
+        cache.put("huge", CachedResponse(b"x" * 9, "application/json"))
+        assert cache.get("huge") is None
+        assert cache.stats()["evictions"] == 1
+
+class TestCompression:
+    def test_negotiate(self):
+        """Test content coding choice from Accept-Encoding"""
+        assert negotiate(None) is None
+        assert negotiate("gzip") == "gzip"
+        assert negotiate("gzip;q=0.5, br;q=0") == "gzip"
+        assert negotiate("identity") is None
+        assert negotiate("*;q=0") is None
+
+    def test_compressed_response_cached(self, mock_data):
+        """Test that compressed bodies are stored and served precompressed"""
+        import main
+        main.response_cache.clear()
+        with patch('main.COMPRESS_MIN_BYTES', 0):
+            first = client.get("/api/species/1/observations", headers={"Accept-Encoding": "gzip"})
+            hits = main.response_cache.stats()["hits"]
+            second = client.get("/api/species/1/observations", headers={"Accept-Encoding": "gzip"})
+        assert first.headers["content-encoding"] == "gzip"
+        assert second.headers["content-encoding"] == "gzip"
+        assert main.response_cache.stats()["hits"] == hits + 1
+        assert second.json()["count"] == 2
+        assert "Accept-Encoding" in second.headers["vary"]
+
+        identity = client.get("/api/species/1/observations", headers={"Accept-Encoding": "identity"})
+        assert "content-encoding" not in identity.headers
+        assert identity.headers["etag"] != first.headers["etag"]
+
+    def test_small_responses_uncompressed(self, mock_data):
+        """Test that bodies below the threshold are sent as is"""
+        response = client.get("/api/species/3/timeline", headers={"Accept-Encoding": "gzip"})
+        assert "content-encoding" not in response.headers
+
+    def test_ndjson_stream_compressed(self, mock_data):
+        """Test that streamed responses are compressed on the fly"""
+        response = client.get("/api/species/2/observations?format=ndjson", headers={"Accept-Encoding": "gzip"})
+        assert response.headers["content-encoding"] == "gzip"
+        assert len(response.text.strip().split("\n")) == 2
+
+class TestQueryExecutor:
+    def test_heavy_endpoints_run_on_pool(self, mock_data):
+        """Test that query work is counted by the executor stats"""
+        import main
+        main.response_cache.clear()
+        completed = client.get("/executor/stats").json()["completed"]
+        client.get("/api/species/2/timeline")
+        client.get("/api/species/2/observations/grid")
+        stats = client.get("/executor/stats").json()
+        assert stats["completed"] == completed + 2
+        assert stats["queueSecondsMax"] >= 0
+
+    def test_ndjson_batches_run_on_pool(self, mock_data):
+        """Test that a stream's batches are serialized on the query pool, not Starlette's"""
+        completed = client.get("/executor/stats").json()["completed"]
+        response = client.get("/api/species/2/observations?format=ndjson")
+        assert len(response.text.splitlines()) == 2
+        # The filter, the one batch, and the call that finds the stream exhausted
+        assert client.get("/executor/stats").json()["completed"] == completed + 3
+
+    def test_full_queue_rejected(self):
+        """Test that work beyond the queue limit is rejected instead of waiting"""
+        executor = QueryExecutor(max_workers=1, max_queue=1)
+        release = threading.Event()
+
+        async def scenario():
+            running = asyncio.ensure_future(executor.run(release.wait))
+            while executor.stats()["active"] == 0:
+                await asyncio.sleep(0.001)
+            queued = asyncio.ensure_future(executor.run(lambda: "done"))
+            await asyncio.sleep(0)
+            with pytest.raises(QueryQueueFull):
+                await executor.run(lambda: "rejected")
+            release.set()
+            return await running, await queued
+
+        assert asyncio.run(scenario()) == (True, "done")
+        assert executor.stats()["rejected"] == 1
+        executor.shutdown()
+
+    def test_full_queue_returns_503(self, mock_data):
+        """Test that a saturated pool is reported as retryable"""
+        with patch('main.query_executor.run', side_effect=QueryQueueFull()):
+            response = client.get("/api/species/1/timeline")
+        assert response.status_code == 503
+        assert response.headers["retry-after"] == "1"
+
+class TestCoalescing:
+    def test_single_flight_shares_result(self):
+        """Test that concurrent callers with one key run the computation once"""
+        flight = SingleFlight()
+        calls = []
+
+        async def compute():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return "result"
+
+        async def scenario():
+            return await asyncio.gather(*(flight.run("key", compute) for _ in range(5)))
+
+        assert asyncio.run(scenario()) == ["result"] * 5
+        assert len(calls) == 1
+        assert flight.stats() == {"inFlight": 0, "leaders": 1, "coalesced": 4}
+
+    def test_single_flight_followers_retry_without_result(self):
+        """Test that waiting callers compute for themselves when the leader has nothing to share"""
+        flight = SingleFlight()
+        results = iter([None, "second"])
+
+        async def compute():
+            await asyncio.sleep(0.01)
+            return next(results)
+
+        async def scenario():
+            return await asyncio.gather(flight.run("key", compute), flight.run("key", compute))
+
+        assert asyncio.run(scenario()) == [None, "second"]
+
+    def test_concurrent_timelines_computed_once(self, mock_data):
+        """Test that identical concurrent requests share one timeline computation"""
+        import httpx
+        import main
+        original = main.Dataset.species_timeline
+        calls = []
+
+        def slow_timeline(self, *args, **kwargs):
+            calls.append(1)
+            time.sleep(0.05)
+            return original(self, *args, **kwargs)
+
+        async def scenario():
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as async_client:
+                return await asyncio.gather(*(
+                    async_client.get("/api/species/2/timeline?interval=month") for _ in range(4)
+                ))
+
+        with patch.object(main.Dataset, 'species_timeline', slow_timeline):
+            responses = asyncio.run(scenario())
+        assert [response.status_code for response in responses] == [200] * 4
+        assert len({response.content for response in responses}) == 1
+        assert len(calls) == 1
+
+    def test_superseded_search_skipped(self, mock_data):
+        """Test that a search overtaken by a newer one from the same client is not computed"""
+        import main
+        latest = main.latest_searches
+
+        def register_then_newer(client_id):
+            # Another keystroke from the same client arrives before the handler runs
+            sequence = LatestRequests.register(latest, client_id)
+            LatestRequests.register(latest, client_id)
+            return sequence
+
+        with patch.object(latest, 'register', side_effect=register_then_newer):
+            response = client.get("/api/species/search?query=Ho&client_id=tab-1")
+        assert response.status_code == 409
+        assert client.get("/api/species/search?query=Ho&client_id=tab-1").json()["count"] == 1
+        assert client.get("/api/species/search?query=Ho").json()["count"] == 1
+
+    def test_client_id_shares_cache_entry(self, mock_data):
+        """Test that searches differing only in client_id are one cached response"""
+        first = client.get("/api/species/search?query=Can&client_id=tab-1")
+        hits = client.get("/cache/stats").json()["hits"]
+        second = client.get("/api/species/search?query=Can&client_id=tab-2")
+        assert client.get("/cache/stats").json()["hits"] == hits + 1
+        assert second.headers["etag"] == first.headers["etag"]
+
+    def test_latest_requests_bounded(self):
+        """Test that only the most recently seen clients are remembered"""
+        latest = LatestRequests(max_clients=2)
+        first = latest.register("a")
+        latest.register("b")
+        latest.register("c")
+        assert latest.stats()["clients"] == 2
+        assert not latest.is_superseded("a", first)
+        assert latest.is_superseded("c", latest.register("c") - 1)
+
+class TestMetrics:
+    def test_metrics_by_route_template(self, mock_data):
+        """Test that requests are counted per route with stage timings and row counts"""
+        response = client.get("/api/species/2/observations?year_to=2020")
+        assert "filter;dur=" in response.headers["server-timing"]
+        assert "serialize;dur=" in response.headers["server-timing"]
+
+        text = client.get("/metrics").text
+        route = 'route="/api/species/{species_key}/observations"'
+        assert f'biodiversity_requests_total{{{route},method="GET",status="200"}}' in text
+        assert f'biodiversity_rows_returned_count{{{route}}}' in text
+        assert f'biodiversity_stage_duration_seconds_count{{{route},stage="filter"}}' in text
+        assert "biodiversity_response_cache_max_bytes" in text
+
+    def test_cache_hits_labelled_by_route(self, mock_data):
+        """Test that responses served from the cache are counted under their route template"""
+        import re
+        pattern = r'biodiversity_requests_total\{route="/api/species/\{species_key\}/timeline",method="GET",status="200"\} (\d+)'
+
+        def count():
+            found = re.search(pattern, client.get("/metrics").text)
+            return int(found.group(1)) if found else 0
+
+        before = count()
+        for _ in range(3):
+            client.get("/api/species/3/timeline")
+        assert count() == before + 3
+
+    def test_profile_requires_opt_in(self, mock_data):
+        """Test that X-Profile only returns a profile when profiling is enabled"""
+        response = client.get("/api/species/1/timeline?interval=month", headers={"X-Profile": "1"})
+        assert response.headers["content-type"] == "application/json"
+
+        with patch('main.PROFILE_REQUESTS', True):
+            response = client.get("/api/species/1/timeline?interval=month", headers={"X-Profile": "1"})
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain")
+        assert response.text.startswith("# ")
+
+@pytest.fixture
+def restore_data():
+    """Put back the module data after a test that installs a new dataset"""
+    import main
+    saved = (main.species_data, main.observations_data, main._dataset)
+    yield main
+    main.species_data, main.observations_data, main._dataset = saved
+
+ADMIN_HEADERS = {"X-Admin-Token": "secret"}
+
+@pytest.fixture
+def admin_token():
+    """Enable the admin endpoints with the token in ADMIN_HEADERS"""
+    with patch('main.ADMIN_TOKEN', 'secret'):
+        yield
+
+class TestHotReload:
+    def test_admin_reload_swaps_dataset(self, tmp_path, restore_data, admin_token):
+        """Test that a background reload publishes the new data and reports it in /health"""
+        main = restore_data
+        write_column_store(sample_species_data, str(tmp_path / "species.store"), SPECIES_SCHEMA)
+        write_column_store(sample_observations_data, str(tmp_path / "observations.store"), OBSERVATION_SCHEMA)
+
+        with patch('main.SPECIES_PATH', str(tmp_path / "species")), \
+             patch('main.OBSERVATIONS_PATH', str(tmp_path / "observations")):
+            response = client.post("/admin/reload", headers=ADMIN_HEADERS)
+            assert response.status_code == 202
+            for _ in range(500):
+                if not main._reload_lock.locked():
+                    break
+                time.sleep(0.01)
+
+        health = client.get("/health").json()
+        assert health["reloading"] is False
+        assert health["buildSeconds"] is not None
+        assert health["dataVersion"] == main._dataset.version
+        assert client.get("/api/species/search?query=wolf").json()["count"] == 1
+        assert client.get("/api/species/2/observations").json()["count"] == 2
+
+    def test_concurrent_reload_rejected(self, admin_token):
+        """Test that only one reload runs at a time"""
+        import main
+        with main._reload_lock:
+            assert client.post("/admin/reload", headers=ADMIN_HEADERS).status_code == 409
+
+    def test_admin_token_required(self):
+        """Test that reloads need the configured token and are disabled without one"""
+        with patch('main.ADMIN_TOKEN', None):
+            assert client.post("/admin/reload").status_code == 403
+        with patch('main.ADMIN_TOKEN', ''):
+            assert client.post("/admin/reload", headers={"X-Admin-Token": ""}).status_code == 403
+        with patch('main.ADMIN_TOKEN', 'secret'):
+            assert client.post("/admin/reload").status_code == 403
+            assert client.post("/admin/reload", headers={"X-Admin-Token": "wrong"}).status_code == 403
+
+class TestSegments:
+    def test_segment_applied_incrementally(self, tmp_path, restore_data):
+        """Test that an appended segment is merged into every query without reindexing old rows"""
+        main = restore_data
+        from dataset import load_dataset, refresh_dataset
+        from segments import write_segment
+
+        species_path, observations_path = str(tmp_path / "species"), str(tmp_path / "observations")
+        write_column_store(
+            sample_species_data.assign(observationCount=[2, 2, 1]), species_path + ".store", SPECIES_SCHEMA
+        )
+        write_column_store(sample_observations_data, observations_path + ".store", OBSERVATION_SCHEMA)
+        base = refresh_dataset(None, species_path, observations_path)
+
+        # Two more wolves in 2021 and a species not seen before
+        delta = sample_observations_data.iloc[[2, 3, 4]].assign(speciesKey=[2, 2, 4], year=[2021, 2021, 2021])
+        fox = pd.DataFrame({
+            'speciesKey': [4], 'scientificName': ['Vulpes vulpes'], 'vernacularName': ['Red fox'],
+            'kingdom': ['Animalia'], 'phylum': ['Chordata'], 'class': ['Mammalia'],
+            'order': ['Carnivora'], 'family': ['Canidae'], 'genus': ['Vulpes']
+        })
+        assert write_segment(observations_path, delta, fox) == "000001"
+
+        updated = refresh_dataset(base, species_path, observations_path)
+        assert updated.segment_names == ["000001"]
+        assert updated.species_index is base.species_index
+        counts = dict(zip(updated.species['speciesKey'], updated.species['observationCount']))
+        assert counts == {1: 2, 2: 4, 3: 1, 4: 1}
+        assert updated.version == load_dataset(species_path, observations_path).version
+        assert refresh_dataset(updated, species_path, observations_path) is updated
+
+        main.install_dataset(updated)
+        assert client.get("/api/dashboard/stats").json()["totalObservations"] == 8
+        assert client.get("/api/species/2/observations").json()["count"] == 4
+        assert client.get("/api/species/2/timeline").json()["timeline"] == [
+            {"year": 2020, "count": 2}, {"year": 2021, "count": 2}
+        ]
+        assert client.get("/api/species/search?query=fox").json()["count"] == 1
+        canidae = client.get("/api/taxonomy?rank=family&name=Canidae").json()["taxa"][0]
+        assert (canidae["speciesCount"], canidae["observationCount"]) == (2, 5)
+
+class TestStartup:
+    def test_search_served_before_observations(self, tmp_path, restore_data):
+        """Test that the startup load publishes the species table first and /ready tracks it"""
+        main = restore_data
+        from dataset import LoadProgress, load_dataset
+        write_column_store(sample_species_data, str(tmp_path / "species.store"), SPECIES_SCHEMA)
+        write_column_store(sample_observations_data, str(tmp_path / "observations.store"), OBSERVATION_SCHEMA)
+        progress = LoadProgress()
+        seen = {}
+
+        def on_species(dataset):
+            main.install_dataset(dataset)
+            seen["ready"] = client.get("/ready")
+            seen["search"] = client.get("/api/species/search?query=wolf")
+            seen["stats"] = client.get("/api/dashboard/stats")
+
+        with patch('main.startup_progress', progress):
+            main.install_dataset(load_dataset(
+                str(tmp_path / "species"), str(tmp_path / "observations"), progress=progress, on_species=on_species
+            ))
+            progress.finish()
+            ready = client.get("/ready")
+
+        assert seen["ready"].status_code == 503
+        assert seen["ready"].json()["searchReady"] is True
+        assert seen["search"].json()["count"] == 1
+        assert seen["stats"].status_code == 503
+        assert seen["stats"].headers["Retry-After"] == "5"
+        assert ready.status_code == 200
+        assert {"species", "observations", "taxonomy"} <= set(ready.json()["phaseSeconds"])
+
+    def test_ready_without_startup_load(self, mock_data):
+        """Test that data set without a startup load counts as ready"""
+        response = client.get("/ready")
+        assert response.status_code == 200
+        assert response.json()["loading"] is False
+
 class TestDataProcessing:
     def test_observations_data_processing(self, mock_data):
         """Test that observations data is properly processed"""
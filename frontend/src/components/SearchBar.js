@@ -1,6 +1,6 @@
 import React, { useState, useEffect, useRef } from 'react';
 import { Search, X, Loader2 } from 'lucide-react';
-import { searchSpecies } from '../services/api';
+import { isCancelledRequest, searchSpecies } from '../services/api';
 
 const SearchBar = ({ onSpeciesSelect, onSpeciesClear, selectedSpecies, loading }) => {
   const [query, setQuery] = useState('');
@@ -19,14 +19,19 @@ const SearchBar = ({ onSpeciesSelect, onSpeciesClear, selectedSpecies, loading }
       return;
     }
 
+    // Aborted (and its result ignored) as soon as the query changes again
+    const controller = new AbortController();
     const timeoutId = setTimeout(async () => {
       try {
         setIsSearching(true);
         setSearchError(null);
-        const results = await searchSpecies(query, 10);
+        const results = await searchSpecies(query, 10, { signal: controller.signal });
+        if (controller.signal.aborted) return;
         setSearchResults(results.species || []);
         setShowResults(true);
       } catch (error) {
+        // A newer query superseded this one, here or on the server
+        if (controller.signal.aborted || isCancelledRequest(error)) return;
         setSearchError('Failed to search species');
         console.error('Search error:', error);
       } finally {
@@ -34,7 +39,10 @@ const SearchBar = ({ onSpeciesSelect, onSpeciesClear, selectedSpecies, loading }
       }
     }, 300);
 
-    return () => clearTimeout(timeoutId);
+    return () => {
+      clearTimeout(timeoutId);
+      controller.abort();
+    };
   }, [query]);
 
   // Close results when clicking outside
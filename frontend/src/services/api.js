@@ -2,6 +2,11 @@ import axios from 'axios';
 
 const API_BASE_URL = process.env.REACT_APP_API_URL || 'http://localhost:8000';
 
+// Identifies this tab to the server, which skips searches that a newer one
+// from the same tab has made obsolete. Sent as a query parameter: a custom
+// header would make every search a CORS preflight as well
+const CLIENT_ID = Math.random().toString(36).slice(2) + Date.now().toString(36);
+
 const api = axios.create({
   baseURL: API_BASE_URL,
   timeout: 30000,
@@ -28,10 +33,16 @@ api.interceptors.response.use(
     return response;
   },
   (error) => {
+    // Aborted requests were superseded on purpose; let callers recognise them
+    if (axios.isCancel(error)) {
+      return Promise.reject(error);
+    }
     console.error('API Response Error:', error);
     if (error.response) {
-      // Server responded with error status
-      throw new Error(error.response.data.detail || 'An error occurred');
+      // Server responded with error status; keep it so callers can tell 409s apart
+      const apiError = new Error(error.response.data.detail || 'An error occurred');
+      apiError.status = error.response.status;
+      throw apiError;
     } else if (error.request) {
       // Request was made but no response received
       throw new Error('Unable to connect to server');
@@ -42,21 +53,49 @@ api.interceptors.response.use(
   }
 );
 
-export const searchSpecies = async (query, limit = 10) => {
+// Pass an AbortSignal to cancel the search once a newer query replaces it
+export const searchSpecies = async (query, limit = 10, { signal } = {}) => {
   try {
     const response = await api.get('/api/species/search', {
-      params: { query, limit }
+      params: { query, limit, client_id: CLIENT_ID },
+      signal
     });
     return response.data;
   } catch (error) {
-    console.error('Error searching species:', error);
+    if (!isCancelledRequest(error)) {
+      console.error('Error searching species:', error);
+    }
     throw error;
   }
 };
 
-export const getSpeciesObservations = async (speciesKey) => {
+// Aborted here, or skipped by the server (409) because a newer search from this tab overtook it
+export const isCancelledRequest = (error) => axios.isCancel(error) || error?.status === 409;
+
+const filterParams = ({ yearFrom, yearTo, month, basisOfRecord, stateProvince } = {}) => ({
+  year_from: yearFrom,
+  year_to: yearTo,
+  month,
+  basis_of_record: basisOfRecord,
+  state_province: stateProvince,
+});
+
+const observationParams = ({ bbox, limit, cursor, ...filters } = {}) => ({
+  bbox: bbox ? bbox.join(',') : undefined,
+  ...filterParams(filters),
+  limit,
+  cursor,
+});
+
+// Optional filters: bbox [minLon, minLat, maxLon, maxLat], yearFrom, yearTo,
+// month, basisOfRecord, stateProvince.
+// Pass limit (and the previous page's nextCursor as cursor) to page through results;
+// a 409 means the data changed since that cursor was issued, so start over without it.
+export const getSpeciesObservations = async (speciesKey, options = {}) => {
   try {
-    const response = await api.get(`/api/species/${speciesKey}/observations`);
+    const response = await api.get(`/api/species/${speciesKey}/observations`, {
+      params: observationParams(options)
+    });
     return response.data;
   } catch (error) {
     console.error('Error getting species observations:', error);
@@ -64,9 +103,130 @@ export const getSpeciesObservations = async (speciesKey) => {
   }
 };
 
-export const getSpeciesTimeline = async (speciesKey) => {
+const TYPED_ARRAYS = {
+  float32: Float32Array,
+  int8: Int8Array,
+  int16: Int16Array,
+  int32: Int32Array,
+  uint8: Uint8Array,
+};
+
+// Base64 little-endian buffer from the columnar format -> TypedArray
+const decodeBuffer = (data, type) => {
+  const binary = atob(data);
+  const bytes = new Uint8Array(binary.length);
+  for (let i = 0; i < binary.length; i++) {
+    bytes[i] = binary.charCodeAt(i);
+  }
+  return new TYPED_ARRAYS[type](bytes.buffer);
+};
+
+const decodeColumn = (column) => {
+  if (column.type === 'dictionary') {
+    // values[codes[i]] is the string for row i; code -1 means missing
+    return { values: column.values, codes: decodeBuffer(column.data, column.codeType) };
+  }
+  return {
+    values: decodeBuffer(column.data, column.type),
+    // 0 where the value is missing; absent when every value is present
+    valid: column.valid ? decodeBuffer(column.valid, 'uint8') : undefined,
+  };
+};
+
+// Same filters and paging as getSpeciesObservations, but fetched in the
+// columnar format: each field arrives as a typed array (coordinates as
+// Float32Array), strings as a dictionary plus codes. Much smaller and faster
+// to parse than one object per observation for large species.
+export const getSpeciesObservationsColumnar = async (speciesKey, options = {}) => {
   try {
-    const response = await api.get(`/api/species/${speciesKey}/timeline`);
+    const response = await api.get(`/api/species/${speciesKey}/observations`, {
+      params: { ...observationParams(options), format: 'columnar' }
+    });
+    const { columns, ...meta } = response.data;
+    const decoded = {};
+    Object.entries(columns).forEach(([name, column]) => {
+      decoded[name] = decodeColumn(column);
+    });
+    return { ...meta, columns: decoded };
+  } catch (error) {
+    console.error('Error getting species observations:', error);
+    throw error;
+  }
+};
+
+// Streams observations as NDJSON, calling onBatch with each parsed chunk of
+// observations as it arrives. Resolves with the total number received.
+export const streamSpeciesObservations = async (speciesKey, onBatch, options = {}) => {
+  const params = new URLSearchParams({ format: 'ndjson' });
+  Object.entries(observationParams(options)).forEach(([key, value]) => {
+    if (value !== undefined) params.append(key, value);
+  });
+
+  const response = await fetch(
+    `${API_BASE_URL}/api/species/${speciesKey}/observations?${params}`,
+    { signal: options.signal }
+  );
+  if (!response.ok) {
+    const body = await response.json().catch(() => ({}));
+    throw new Error(body.detail || 'An error occurred');
+  }
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffered = '';
+  let received = 0;
+
+  for (;;) {
+    const { done, value } = await reader.read();
+    buffered += decoder.decode(value || new Uint8Array(), { stream: !done });
+
+    // Parse every complete line; keep a trailing partial line for the next chunk
+    const lines = buffered.split('\n');
+    buffered = done ? '' : lines.pop();
+    const batch = lines.filter(line => line).map(line => JSON.parse(line));
+    if (batch.length > 0) {
+      received += batch.length;
+      onBatch(batch);
+    }
+    if (done) return received;
+  }
+};
+
+// Observations binned into map grid cells; bbox is [minLon, minLat, maxLon, maxLat]
+export const getSpeciesObservationGrid = async (speciesKey, { zoom = 6, bbox, maxBins } = {}) => {
+  try {
+    const response = await api.get(`/api/species/${speciesKey}/observations/grid`, {
+      params: { zoom, bbox: bbox ? bbox.join(',') : undefined, max_bins: maxBins }
+    });
+    return response.data;
+  } catch (error) {
+    console.error('Error getting species observation grid:', error);
+    throw error;
+  }
+};
+
+// Summaries (count, year range, extent, centroid) and timelines for several
+// species in one request, e.g. to compare species or prefetch the top species
+export const getSpeciesBatch = async (speciesKeys, { interval = 'year' } = {}) => {
+  try {
+    const response = await api.get('/api/species/batch', {
+      params: { keys: speciesKeys.join(','), interval }
+    });
+    return response.data;
+  } catch (error) {
+    console.error('Error getting species batch:', error);
+    throw error;
+  }
+};
+
+// interval: 'year' | 'month'; splitBy: 'basisOfRecord' | 'stateProvince' (optional)
+// Accepts the same yearFrom, yearTo, month, basisOfRecord and stateProvince
+// filters as getSpeciesObservations
+export const getSpeciesTimeline = async (speciesKey, { interval = 'year', splitBy, ...filters } = {}) => {
+  try {
+    const response = await api.get(`/api/species/${speciesKey}/timeline`, {
+      params: { interval, split_by: splitBy, ...filterParams(filters) }
+    });
     return response.data;
   } catch (error) {
     console.error('Error getting species timeline:', error);
@@ -74,6 +234,50 @@ export const getSpeciesTimeline = async (speciesKey) => {
   }
 };
 
+// Kingdoms by default, or taxa filtered by rank ('family', ...) and/or exact name
+export const getTaxa = async ({ rank, name, limit } = {}) => {
+  try {
+    const response = await api.get('/api/taxonomy', { params: { rank, name, limit } });
+    return response.data;
+  } catch (error) {
+    console.error('Error getting taxa:', error);
+    throw error;
+  }
+};
+
+// A taxon with its lineage and children
+export const getTaxon = async (taxonId) => {
+  try {
+    const response = await api.get(`/api/taxonomy/${taxonId}`);
+    return response.data;
+  } catch (error) {
+    console.error('Error getting taxon:', error);
+    throw error;
+  }
+};
+
+export const getTaxonTimeline = async (taxonId) => {
+  try {
+    const response = await api.get(`/api/taxonomy/${taxonId}/timeline`);
+    return response.data;
+  } catch (error) {
+    console.error('Error getting taxon timeline:', error);
+    throw error;
+  }
+};
+
+export const getTaxonGrid = async (taxonId, { zoom = 6, maxBins } = {}) => {
+  try {
+    const response = await api.get(`/api/taxonomy/${taxonId}/grid`, {
+      params: { zoom, max_bins: maxBins }
+    });
+    return response.data;
+  } catch (error) {
+    console.error('Error getting taxon grid:', error);
+    throw error;
+  }
+};
+
 export const getDashboardStats = async () => {
   try {
     const response = await api.get('/api/dashboard/stats');
@@ -2,9 +2,24 @@ import requests
 import pandas as pd
 import numpy as np
 import os
+import sys
+import argparse
+from pathlib import Path
 from datetime import datetime
 import logging
 
+# Share the on-disk format with the backend (backend/ locally, the app root in Docker)
+ROOT_DIR = Path(__file__).resolve().parent.parent
+for candidate in (ROOT_DIR / "backend", ROOT_DIR):
+    if (candidate / "storage.py").exists():
+        sys.path.insert(0, str(candidate))
+        break
+
+from storage import (
+    read_csv_typed, store_path, write_column_store, OBSERVATION_SCHEMA, SPECIES_SCHEMA
+)
+from dataset import index_arrays
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -66,6 +81,31 @@ def create_sample_data():
     
     return species_df, observations_df
 
+def convert_to_column_store():
+    """Convert the CSV data files to typed column stores the backend loads directly"""
+    # Species first: the taxonomy saved with the observations is built from them
+    species = None
+    for name, schema in (("species_poland", SPECIES_SCHEMA), ("observations_poland", OBSERVATION_SCHEMA)):
+        csv_file = f"data/{name}.csv"
+        if not os.path.exists(csv_file):
+            logger.warning(f"{csv_file} not found, skipping conversion")
+            continue
+
+        df = read_csv_typed(csv_file, schema)
+        arrays = None
+        if name.startswith("species"):
+            species = df
+        elif 'speciesKey' in df.columns:
+            # Store observations grouped by species so the backend needn't sort,
+            # with indexes every backend worker can map instead of building
+            df = df.sort_values('speciesKey', kind='stable').reset_index(drop=True)
+            arrays = index_arrays(df, species)
+
+        output = store_path(f"data/{name}")
+        write_column_store(df, output, schema, arrays)
+        memory_mb = df.memory_usage(deep=True).sum() / 1e6
+        logger.info(f"Wrote {len(df)} rows to {output} ({memory_mb:.1f} MB in memory)")
+
 def download_gbif_data():
     """Create sample biodiversity data for Poland"""
     
@@ -104,10 +144,20 @@ def download_gbif_data():
         logger.info(f"Top 5 species by observation count:")
         for _, row in species_df.head().iterrows():
             logger.info(f"  {row['scientificName']} ({row['vernacularName']}): {row['observationCount']} observations")
+        
+        convert_to_column_store()
             
     except Exception as e:
         logger.error(f"Error creating sample data: {e}")
         return
 
 if __name__ == "__main__":
-    download_gbif_data()
+    parser = argparse.ArgumentParser(description="Create biodiversity data files for the dashboard")
+    parser.add_argument("--convert", action="store_true",
+                        help="Only convert existing CSV files in data/ to column stores")
+    args = parser.parse_args()
+
+    if args.convert:
+        convert_to_column_store()
+    else:
+        download_gbif_data()
@@ -0,0 +1,314 @@
+import pandas as pd
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
+from typing import Dict, Iterator, List, Optional, Tuple
+import argparse
+import csv
+import io
+import os
+import shutil
+import sys
+import time
+import zipfile
+from pathlib import Path
+import logging
+
+# Share the on-disk format with the backend (backend/ locally, the app root in Docker)
+ROOT_DIR = Path(__file__).resolve().parent.parent
+for candidate in (ROOT_DIR / "backend", ROOT_DIR):
+    if (candidate / "storage.py").exists():
+        sys.path.insert(0, str(candidate))
+        break
+
+from storage import load_table, store_path, write_column_store, OBSERVATION_SCHEMA, SPECIES_SCHEMA
+from dataset import index_arrays
+from segments import apply_species_delta, concat_observations, list_segments, read_segment, segments_dir, write_segment
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Bytes of raw TSV handed to a worker at a time
+DEFAULT_BLOCK_MB = 64
+
+# Occurrence columns that become species table columns; GBIF's interpreted
+# `species` holds the binomial, `scientificName` may name a subspecies
+TAXONOMY_COLUMNS = ['kingdom', 'phylum', 'class', 'order', 'family', 'genus']
+SPECIES_NAME_SOURCES = ['species', 'scientificName']
+
+# Simple (CSV) downloads only carry the ISO code
+COUNTRY_SOURCES = ['country', 'countryCode']
+
+
+def find_occurrence_member(archive: zipfile.ZipFile) -> str:
+    """Name of the occurrence table in a DwC-A or GBIF simple download zip"""
+    names = archive.namelist()
+    if "occurrence.txt" in names:
+        return "occurrence.txt"
+    tables = [info for info in archive.infolist() if info.filename.endswith((".txt", ".csv"))
+              and not info.filename.startswith(("verbatim", "multimedia", "citations", "rights"))]
+    if not tables:
+        raise ValueError("No occurrence table found in archive")
+    return max(tables, key=lambda info: info.file_size).filename
+
+
+def open_occurrences(source: str):
+    """Binary stream of the occurrence TSV, from a zip archive or a plain file"""
+    if zipfile.is_zipfile(source):
+        archive = zipfile.ZipFile(source)
+        member = find_occurrence_member(archive)
+        logger.info(f"Reading {member} from {source}")
+        return archive.open(member)
+    return open(source, "rb")
+
+
+def iter_blocks(stream, block_bytes: int) -> Iterator[bytes]:
+    """Raw blocks of whole lines, each roughly block_bytes long"""
+    remainder = b""
+    while True:
+        data = stream.read(block_bytes)
+        if not data:
+            break
+        data = remainder + data
+        cut = data.rfind(b"\n") + 1
+        if cut == 0:
+            remainder = data
+            continue
+        remainder = data[cut:]
+        yield data[:cut]
+    if remainder.strip():
+        yield remainder
+
+
+def _first_present(header: List[str], candidates: List[str]) -> Optional[str]:
+    return next((name for name in candidates if name in header), None)
+
+
+def source_columns(header: List[str]) -> Dict[str, str]:
+    """Map each output column to the occurrence column it is read from"""
+    columns = {name: name for name in OBSERVATION_SCHEMA if name in header}
+    country = _first_present(header, COUNTRY_SOURCES)
+    if country:
+        columns['country'] = country
+    species_name = _first_present(header, SPECIES_NAME_SOURCES)
+    if species_name:
+        columns['scientificName'] = species_name
+    for name in TAXONOMY_COLUMNS + ['vernacularName']:
+        if name in header:
+            columns[name] = name
+
+    missing = [name for name in ('speciesKey', 'decimalLatitude', 'decimalLongitude') if name not in columns]
+    if missing:
+        raise ValueError(f"Occurrence table lacks required columns: {missing}")
+    return columns
+
+
+def parse_block(block: bytes, header: List[str], columns: Dict[str, str]) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Parse one block into typed observations and the species rows it mentions
+
+    Runs in a worker process; only the mapped columns are materialized.
+    """
+    raw = pd.read_csv(
+        io.BytesIO(block), sep="\t", header=None, names=header, usecols=sorted(set(columns.values())),
+        dtype=str, quoting=csv.QUOTE_NONE, keep_default_na=False, na_values=[""], on_bad_lines="skip"
+    )
+    raw = raw.rename(columns={source: name for name, source in columns.items() if source != name})
+
+    # Observations need a species and a position on the map
+    species_key = pd.to_numeric(raw['speciesKey'], errors='coerce')
+    latitude = pd.to_numeric(raw['decimalLatitude'], errors='coerce')
+    longitude = pd.to_numeric(raw['decimalLongitude'], errors='coerce')
+    keep = (species_key.notna() & latitude.between(-90, 90) & longitude.between(-180, 180)).to_numpy()
+    raw = raw[keep]
+
+    observations = {}
+    for name, dtype in OBSERVATION_SCHEMA.items():
+        if name not in raw.columns:
+            continue
+        if dtype == 'category':
+            values = raw[name]
+            if name == 'eventDate':
+                # Drop the time of day so dates dictionary-encode well
+                values = values.str.split("T").str[0]
+            observations[name] = values.astype('category')
+        else:
+            numeric = pd.to_numeric(raw[name], errors='coerce')
+            if dtype[0].isupper():
+                # Out-of-range values would wrap in the narrow nullable type
+                info = np.iinfo(dtype.lower())
+                numeric = numeric.where(numeric.between(info.min + 1, info.max)).round()
+            observations[name] = numeric.astype(dtype)
+    observations = pd.DataFrame(observations)
+
+    # First row per species, preferring rows that carry a vernacular name
+    species_columns = ['speciesKey'] + [name for name in SPECIES_SCHEMA if name in raw.columns and name != 'speciesKey']
+    species = raw[species_columns].assign(speciesKey=observations['speciesKey'].to_numpy())
+    if 'vernacularName' in species.columns:
+        species = species.sort_values('vernacularName', key=lambda names: names.isna(), kind='stable')
+    species = species.drop_duplicates('speciesKey')
+    return observations, species
+
+
+def merge_species(known: Optional[pd.DataFrame], new: pd.DataFrame) -> pd.DataFrame:
+    """Add newly seen species, filling in vernacular names missing so far"""
+    if known is None:
+        return new.reset_index(drop=True)
+    merged = pd.concat([known, new], ignore_index=True)
+    if 'vernacularName' in merged.columns:
+        merged = merged.sort_values('vernacularName', key=lambda names: names.isna(), kind='stable')
+    return merged.drop_duplicates('speciesKey').sort_index().reset_index(drop=True)
+
+
+def parse_export(source: str, workers: int, block_mb: int = DEFAULT_BLOCK_MB) -> Tuple[pd.DataFrame, Optional[pd.DataFrame]]:
+    """Parse a GBIF occurrence export into typed observations and the species they mention
+
+    The export is streamed in blocks of whole lines and parsed by a pool of
+    processes with a bounded number of blocks in flight, so memory holds the
+    typed output plus a few raw blocks rather than the (much wider) export.
+    """
+    with open_occurrences(source) as stream:
+        header = stream.readline().decode("utf-8").rstrip("\r\n").split("\t")
+        columns = source_columns(header)
+
+        parsed_rows = 0
+        observation_blocks = []
+        species = None
+
+        def collect(result: Tuple[pd.DataFrame, pd.DataFrame]) -> None:
+            nonlocal species
+            observations, block_species = result
+            observation_blocks.append(observations)
+            species = merge_species(species, block_species)
+
+        blocks = iter_blocks(stream, block_mb * 1024 * 1024)
+        if workers <= 1:
+            for block in blocks:
+                parsed_rows += block.count(b"\n")
+                collect(parse_block(block, header, columns))
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                # Results are consumed in submission order so output is deterministic
+                pending = deque()
+                for block in blocks:
+                    parsed_rows += block.count(b"\n")
+                    pending.append(pool.submit(parse_block, block, header, columns))
+                    if len(pending) >= 2 * workers:
+                        collect(pending.popleft().result())
+                while pending:
+                    collect(pending.popleft().result())
+
+    if observation_blocks:
+        observations = concat_observations(observation_blocks)
+    else:
+        observations = pd.DataFrame({name: pd.Series(dtype=dtype) for name, dtype in OBSERVATION_SCHEMA.items()})
+    logger.info(f"Kept {len(observations)} of {parsed_rows} occurrences with species and coordinates")
+    return observations, species
+
+
+def ingest(source: str, output_dir: str, workers: int, block_mb: int = DEFAULT_BLOCK_MB) -> Tuple[int, int]:
+    """Ingest a GBIF occurrence export into the backend's column stores
+
+    Replaces the existing tables, including any appended segments.
+    Returns the number of observations and species written.
+    """
+    started = time.perf_counter()
+    os.makedirs(output_dir, exist_ok=True)
+    observations, species = parse_export(source, workers, block_mb)
+
+    # Store observations grouped by species so the backend needn't sort
+    observations = observations.sort_values('speciesKey', kind='stable').reset_index(drop=True)
+    observations_path = os.path.join(output_dir, "observations_poland")
+
+    # Species table with observation counts, most observed first
+    keys, counts = np.unique(observations['speciesKey'].to_numpy(), return_counts=True)
+    if species is None:
+        species = pd.DataFrame({'speciesKey': pd.Series(dtype='int32')})
+    species = species.merge(
+        pd.DataFrame({'speciesKey': keys, 'observationCount': counts}), on='speciesKey', how='inner'
+    )
+    species = species.sort_values(['observationCount', 'speciesKey'], ascending=[False, True]).reset_index(drop=True)
+
+    # Indexes are saved too, so every backend worker maps them instead of building its own
+    write_column_store(
+        observations, store_path(observations_path), OBSERVATION_SCHEMA, index_arrays(observations, species)
+    )
+    shutil.rmtree(segments_dir(observations_path), ignore_errors=True)
+    write_column_store(species, store_path(os.path.join(output_dir, "species_poland")), SPECIES_SCHEMA)
+
+    logger.info(f"Wrote {len(observations)} observations and {len(species)} species to {output_dir} "
+                f"in {time.perf_counter() - started:.1f}s")
+    return len(observations), len(species)
+
+
+def append(source: str, output_dir: str, workers: int, block_mb: int = DEFAULT_BLOCK_MB) -> str:
+    """Append an export (e.g. a daily delta) to existing tables as a new immutable segment
+
+    Nothing already written is read or rewritten: the delta's observations
+    and per-species counts go into the segment, and a running backend picks
+    it up on its next reload without reprocessing older data. Returns the
+    segment name.
+    """
+    started = time.perf_counter()
+    observations, species = parse_export(source, workers, block_mb)
+    name = write_segment(os.path.join(output_dir, "observations_poland"), observations, species)
+    logger.info(f"Appended {len(observations)} observations as segment {name} in {time.perf_counter() - started:.1f}s")
+    return name
+
+
+def compact(output_dir: str) -> Tuple[int, int]:
+    """Fold every appended segment into the base tables and remove the segments
+
+    Returns the number of observations and species written.
+    """
+    started = time.perf_counter()
+    observations_path = os.path.join(output_dir, "observations_poland")
+    species_path = os.path.join(output_dir, "species_poland")
+    names = list_segments(observations_path)
+    observations = load_table(observations_path, OBSERVATION_SCHEMA)
+    species = load_table(species_path, SPECIES_SCHEMA)
+    if not names:
+        logger.info("No segments to compact")
+        return (0 if observations is None else len(observations)), (0 if species is None else len(species))
+
+    frames = [] if observations is None else [observations]
+    for name in names:
+        segment_observations, species_delta = read_segment(observations_path, name)
+        frames.append(segment_observations)
+        species = apply_species_delta(species, species_delta)
+
+    observations = concat_observations(frames).sort_values('speciesKey', kind='stable').reset_index(drop=True)
+    write_column_store(
+        observations, store_path(observations_path), OBSERVATION_SCHEMA, index_arrays(observations, species)
+    )
+    write_column_store(species, store_path(species_path), SPECIES_SCHEMA)
+    shutil.rmtree(segments_dir(observations_path))
+
+    logger.info(f"Compacted {len(names)} segments into {len(observations)} observations and {len(species)} species "
+                f"in {time.perf_counter() - started:.1f}s")
+    return len(observations), len(species)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingest a local GBIF occurrence export (DwC-A zip or TSV)")
+    parser.add_argument("source", nargs="?", help="Path to the downloaded .zip or occurrence.txt")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--append", action="store_true",
+                      help="Add the export to the existing tables as a new segment instead of replacing them")
+    mode.add_argument("--compact", action="store_true",
+                      help="Fold appended segments into the base tables (no source needed)")
+    parser.add_argument("--output", default="data", help="Directory for the backend data files")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Parser processes (1 parses in this process)")
+    parser.add_argument("--block-mb", type=int, default=DEFAULT_BLOCK_MB,
+                        help="Raw MB of TSV parsed per task")
+    args = parser.parse_args()
+    if not args.compact and args.source is None:
+        parser.error("source is required unless --compact is given")
+
+    if args.compact:
+        compact(args.output)
+    elif args.append:
+        append(args.source, args.output, args.workers, args.block_mb)
+    else:
+        ingest(args.source, args.output, args.workers, args.block_mb)